@@ -1,6 +1,7 @@
 import os
+import json
 import tempfile
-from flask import Flask, request, render_template, jsonify, send_file
+from flask import Flask, request, render_template, jsonify, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 
 # Google Colabの環境かどうかをチェック
@@ -19,11 +20,20 @@ except ImportError:
     print("ローカル環境で実行しています。.envファイルからAPIキーを読み込みました。")
 
 # 各モジュールのインポート
-from modules.transcription import transcribe_audio
-from modules.llm_processing import summarize_text, question_answering, translate_to_japanese
-from modules.template_handler import process_template
+from modules.transcription import transcribe_audio, get_transcription_cache_stats
+from modules.llm_processing import (
+    summarize_text, question_answering, batch_question_answering, get_llm_client_stats
+)
+from modules.template_handler import process_template, get_template_cache_stats
 from modules.file_handler import save_uploaded_file, get_file_path
-from modules.download_handler import generate_download
+from modules.download_handler import (
+    generate_reports, normalize_output_format, has_report, ReportNotFoundError, get_report_cache_stats
+)
+from modules.pipeline import run_meeting_pipeline
+from modules.retrieval import get_retrieval_index_stats
+from modules.result_cache import get_result_cache_stats
+from modules.report_renderer import new_report_id, is_valid_report_id, get_report_render_stats
+from modules.job_queue import submit_job, get_job, iter_job_events
 
 app = Flask(__name__)
 
@@ -36,6 +46,81 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 # ファイルサイズ制限 (例: 100MB)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024
 
+def respond_with_job_or_result(kind, data, run):
+    """
+    リクエストに応じて処理をストリーミング・ジョブ登録・その場での実行のいずれかで行う
+    
+    Args:
+        kind (str): ジョブの種類
+        data (dict): リクエストデータ（'async' がTrueならジョブとして登録）
+        run (callable): 進捗報告用の関数とイベント送信用の関数を受け取り、結果の辞書を返す処理
+        
+    Returns:
+        Response: イベントストリーム、ジョブID、または処理結果のレスポンス
+    """
+    # /stream のエンドポイントは途中経過をServer-Sent Eventsで送信
+    if request.path.endswith('/stream'):
+        job_id = submit_job(kind, run)
+        print(f"ストリーミングジョブを登録しました: {kind} ({job_id})")
+        return stream_job_events(job_id)
+    
+    if data.get('async'):
+        job_id = submit_job(kind, run)
+        print(f"ジョブを登録しました: {kind} ({job_id})")
+        return jsonify({'status': 'accepted', 'job_id': job_id}), 202
+    
+    result = run(None, None)
+    return jsonify(dict({'status': 'success'}, **result))
+
+def stream_job_events(job_id, last_event_id=-1):
+    """
+    ジョブのイベントをServer-Sent Eventsとして送信する
+    
+    Args:
+        job_id (str): ジョブID
+        last_event_id (int): 受信済みの最後のイベント番号
+        
+    Returns:
+        Response: text/event-stream のレスポンス
+    """
+    def generate():
+        # 最初のイベントでジョブIDを通知（再接続用）
+        yield f"data: {json.dumps({'type': 'job', 'job_id': job_id})}\n\n"
+        for item in iter_job_events(job_id, last_event_id):
+            if item is None:
+                # 接続維持のためのコメント行
+                yield ": keep-alive\n\n"
+                continue
+            event_id, event = item
+            yield f"id: {event_id}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def token_emitter(emit):
+    """
+    LLMのトークン通知をイベント送信に変換する関数を作成する
+    
+    Args:
+        emit (callable): イベント送信用の関数（Noneの場合はトークンを通知しない）
+        
+    Returns:
+        callable: on_token として渡す関数（emitがNoneの場合はNone）
+    """
+    if emit is None:
+        return None
+    
+    def on_token(token):
+        if token is None:
+            emit({'type': 'llm_start'})
+        else:
+            emit({'type': 'token', 'text': token})
+    
+    return on_token
+
 @app.route('/')
 def index():
     """メインページを表示"""
@@ -68,6 +153,7 @@ def upload_file():
     })
 
 @app.route('/transcribe', methods=['POST'])
+@app.route('/transcribe/stream', methods=['POST'])
 def transcribe():
     """音声文字起こし処理"""
     print("===== 文字起こし処理を開始 =====")
@@ -76,9 +162,11 @@ def transcribe():
     
     audio_path = data.get('audio_path')
     api_choice = data.get('api_choice', 'deepgram')  # デフォルトはDeepgram
+    use_cache = data.get('use_cache', True)  # デフォルトはキャッシュを使用
     
     print(f"音声パス: {audio_path}")
     print(f"API選択: {api_choice}")
+    print(f"キャッシュ使用: {use_cache}")
     
     if not audio_path:
         print("エラー: 音声ファイルのパスが指定されていません")
@@ -90,18 +178,24 @@ def transcribe():
         print(f"解決されたファイルパス: {full_path}")
         print(f"ファイルの存在確認: {os.path.exists(full_path)}")
         
-        # 文字起こし実行
-        print(f"文字起こし開始: {api_choice}")
-        transcription = transcribe_audio(
-            full_path, 
-            api_choice=api_choice
-        )
-        print("文字起こし完了")
+        def run(progress_callback, emit):
+            def on_chunk(index, total, text):
+                if emit:
+                    emit({'type': 'chunk', 'index': index, 'total': total, 'text': text})
+            
+            # 文字起こし実行
+            print(f"文字起こし開始: {api_choice}")
+            transcription = transcribe_audio(
+                full_path, 
+                api_choice=api_choice,
+                use_cache=use_cache,
+                progress_callback=progress_callback,
+                on_chunk=on_chunk
+            )
+            print("文字起こし完了")
+            return {'transcription': transcription}
         
-        return jsonify({
-            'status': 'success',
-            'transcription': transcription
-        })
+        return respond_with_job_or_result('transcribe', data, run)
     
     except Exception as e:
         import traceback
@@ -111,6 +205,7 @@ def transcribe():
         return jsonify({'error': f'文字起こし処理中にエラーが発生しました: {str(e)}'}), 500
 
 @app.route('/summarize', methods=['POST'])
+@app.route('/summarize/stream', methods=['POST'])
 def summarize():
     """文字起こしテキストの要約処理"""
     data = request.json
@@ -119,30 +214,30 @@ def summarize():
     method = data.get('method', 'refine')  # デフォルトはrefine
     model_type = data.get('model_type', 'llama3')  # デフォルトはllama3
     force_japanese = data.get('force_japanese', True)  # デフォルトは日本語強制
+    use_cache = data.get('use_cache', True)  # デフォルトはキャッシュを使用
     
     print(f"要約リクエスト: API={api_choice}, 方法={method}, モデル={model_type}, 日本語強制={force_japanese}")
     
-    if not text:
+    if not isinstance(text, str) or not text.strip():
         return jsonify({'error': 'テキストが指定されていません'}), 400
     
     try:
-        # 要約実行
-        summary = summarize_text(
-            text, 
-            api_choice=api_choice,
-            method=method,
-            model_type=model_type
-        )
-        
-        # 日本語への翻訳が必要かチェック（translate_to_japanese関数内で自動判定するが、
-        # force_japaneseフラグがFalseの場合は翻訳しない）
-        if force_japanese:
-            summary = translate_to_japanese(summary, api_choice)
+        def run(progress_callback, emit):
+            # 要約実行
+            summary = summarize_text(
+                text, 
+                api_choice=api_choice,
+                method=method,
+                model_type=model_type,
+                progress_callback=progress_callback,
+                on_token=token_emitter(emit),
+                use_cache=use_cache,
+                force_japanese=force_japanese
+            )
+            
+            return {'summary': summary}
         
-        return jsonify({
-            'status': 'success',
-            'summary': summary
-        })
+        return respond_with_job_or_result('summarize', data, run)
     
     except Exception as e:
         import traceback
@@ -151,6 +246,7 @@ def summarize():
         return jsonify({'error': f'要約処理中にエラーが発生しました: {str(e)}'}), 500
 
 @app.route('/qa', methods=['POST'])
+@app.route('/qa/stream', methods=['POST'])
 def qa():
     """質疑応答処理"""
     data = request.json
@@ -159,6 +255,7 @@ def qa():
     api_choice = data.get('api_choice', 'azure')  # デフォルトはAzure OpenAI
     model_type = data.get('model_type', 'llama3')  # デフォルトはllama3
     force_japanese = data.get('force_japanese', True)  # デフォルトは日本語強制
+    use_cache = data.get('use_cache', True)  # デフォルトはキャッシュを使用
     
     print(f"質疑応答リクエスト: API={api_choice}, モデル={model_type}, 日本語強制={force_japanese}")
     print(f"質問: {question}")
@@ -167,22 +264,21 @@ def qa():
         return jsonify({'error': 'テキストまたは質問が指定されていません'}), 400
     
     try:
-        # 質疑応答実行
-        answer = question_answering(
-            text, 
-            question,
-            api_choice=api_choice,
-            model_type=model_type
-        )
-        
-        # 日本語への翻訳が必要かチェック
-        if force_japanese:
-            answer = translate_to_japanese(answer, api_choice)
+        def run(progress_callback, emit):
+            # 質疑応答実行
+            answer = question_answering(
+                text, 
+                question,
+                api_choice=api_choice,
+                model_type=model_type,
+                on_token=token_emitter(emit),
+                use_cache=use_cache,
+                force_japanese=force_japanese
+            )
+            
+            return {'answer': answer}
         
-        return jsonify({
-            'status': 'success',
-            'answer': answer
-        })
+        return respond_with_job_or_result('qa', data, run)
     
     except Exception as e:
         import traceback
@@ -190,6 +286,95 @@ def qa():
         traceback.print_exc()
         return jsonify({'error': f'質疑応答処理中にエラーが発生しました: {str(e)}'}), 500
 
+@app.route('/qa/batch', methods=['POST'])
+@app.route('/qa/batch/stream', methods=['POST'])
+def qa_batch():
+    """複数の質問にまとめて回答する"""
+    data = request.json
+    text = data.get('text')
+    questions = data.get('questions') or []
+    api_choice = data.get('api_choice', 'azure')  # デフォルトはAzure OpenAI
+    model_type = data.get('model_type', 'llama3')  # デフォルトはllama3
+    use_cache = data.get('use_cache', True)  # デフォルトはキャッシュを使用
+    force_japanese = data.get('force_japanese', True)  # デフォルトは日本語強制
+    
+    if not text or not questions:
+        return jsonify({'error': 'テキストまたは質問が指定されていません'}), 400
+    
+    # 文字列を渡すと1文字ずつが質問になるため、質問の文字列のリストのみ受け付ける
+    if not isinstance(questions, list) or not all(isinstance(q, str) and q.strip() for q in questions):
+        return jsonify({'error': '質問は文字列のリストで指定してください'}), 400
+    
+    print(f"一括質疑応答リクエスト: API={api_choice}, モデル={model_type}, 質問数={len(questions)}, 日本語強制={force_japanese}")
+    
+    try:
+        def run(progress_callback, emit):
+            qa_data = batch_question_answering(
+                text,
+                questions,
+                api_choice=api_choice,
+                model_type=model_type,
+                progress_callback=progress_callback,
+                use_cache=use_cache,
+                force_japanese=force_japanese
+            )
+            
+            # /generate_report の qa_data としてそのまま使用できる
+            return {'qa_data': qa_data}
+        
+        return respond_with_job_or_result('qa_batch', data, run)
+    
+    except Exception as e:
+        import traceback
+        print(f"一括質疑応答処理中にエラーが発生しました: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': f'質疑応答処理中にエラーが発生しました: {str(e)}'}), 500
+
+@app.route('/pipeline', methods=['POST'])
+@app.route('/pipeline/stream', methods=['POST'])
+def pipeline():
+    """文字起こしと要約のパイプライン処理"""
+    data = request.json
+    audio_path = data.get('audio_path')
+    transcription_api = data.get('transcription_api', 'deepgram')  # デフォルトはDeepgram
+    api_choice = data.get('api_choice', 'azure')  # デフォルトはAzure OpenAI
+    model_type = data.get('model_type', 'llama3')  # デフォルトはllama3
+    use_cache = data.get('use_cache', True)  # デフォルトはキャッシュを使用
+    force_japanese = data.get('force_japanese', True)  # デフォルトは日本語強制
+    
+    print(f"パイプラインリクエスト: 文字起こしAPI={transcription_api}, 要約API={api_choice}, モデル={model_type}")
+    
+    if not audio_path:
+        return jsonify({'error': '音声ファイルのパスが指定されていません'}), 400
+    
+    try:
+        full_path = get_file_path(audio_path)
+        
+        def run(progress_callback, emit):
+            def on_chunk(index, total, text):
+                if emit:
+                    emit({'type': 'chunk', 'index': index, 'total': total, 'text': text})
+            
+            return run_meeting_pipeline(
+                full_path,
+                transcription_api=transcription_api,
+                api_choice=api_choice,
+                model_type=model_type,
+                use_cache=use_cache,
+                force_japanese=force_japanese,
+                progress_callback=progress_callback,
+                on_chunk=on_chunk,
+                on_token=token_emitter(emit)
+            )
+        
+        return respond_with_job_or_result('pipeline', data, run)
+    
+    except Exception as e:
+        import traceback
+        print(f"パイプライン処理中にエラーが発生しました: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': f'パイプライン処理中にエラーが発生しました: {str(e)}'}), 500
+
 @app.route('/generate_report', methods=['POST'])
 def generate_report():
     """議事録生成処理"""
@@ -200,35 +385,70 @@ def generate_report():
     template_path = data.get('template_path')
     api_choice = data.get('api_choice', 'azure')  # デフォルトはAzure OpenAI
     model_type = data.get('model_type', 'llama3')  # デフォルトはLLama 3.3
+    use_cache = data.get('use_cache', True)  # デフォルトはキャッシュを使用
+    
+    # 複数のフォーマットを1回のリクエストで出力可能（output_formats、省略時は output_format）
+    output_formats = data.get('output_formats') or [data.get('output_format', 'docx')]
     
-    if not transcription:
+    # 作成済みのレポートの別フォーマットはレポートIDを指定して取得（文字起こしを省略可能）
+    report_id = data.get('report_id')
+    
+    if not transcription and not report_id:
         return jsonify({'error': '文字起こしデータがありません'}), 400
     
+    # レポートIDは出力先のディレクトリ名になるため、作成時の形式以外は受け付けない
+    if report_id and not is_valid_report_id(report_id):
+        return jsonify({'error': '不正なレポートIDです'}), 400
+    
+    # 文字起こしを省略した場合は、保持している（期限切れでない）レポートのみ取得可能
+    if not transcription and not has_report(report_id):
+        return jsonify({'error': f'レポートが見つかりません（文字起こしデータを指定して再作成してください）: {report_id}'}), 404
+    
+    try:
+        output_formats = [normalize_output_format(output_format) for output_format in output_formats]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # リクエスト毎のレポートIDの出力先に保存（同時に作成された他のレポートと衝突しない）
+    report_id = report_id or new_report_id()
+    
     try:
-        # テンプレートがある場合は処理
-        if template_path:
-            report_path = process_template(
-                get_file_path(template_path),
-                transcription=transcription,
+        def run(progress_callback, emit):
+            def render_template_docx(report_id):
+                return process_template(
+                    get_file_path(template_path),
+                    transcription=transcription,
+                    summary=summary,
+                    qa_data=qa_data,
+                    api_choice=api_choice,
+                    model_type=model_type,
+                    progress_callback=progress_callback,
+                    report_id=report_id,
+                    use_cache=use_cache
+                )
+            
+            _, report_paths = generate_reports(
+                output_formats,
+                transcription=transcription or None,
                 summary=summary,
                 qa_data=qa_data,
-                api_choice=api_choice,
-                model_type=model_type
-            )
-        else:
-            # テンプレートがない場合は単純なテキスト出力
-            report_path = generate_download(
-                transcription, 
-                summary, 
-                qa_data,
-                output_format='txt'
+                report_id=report_id,
+                template_path=template_path,
+                # テンプレートがある場合はdocxをテンプレートから作成
+                render_template=render_template_docx if template_path else None
             )
+            
+            return {
+                'report_id': report_id,
+                'report_path': report_paths[output_formats[0]],
+                'report_paths': report_paths
+            }
         
-        return jsonify({
-            'status': 'success',
-            'report_path': report_path
-        })
+        return respond_with_job_or_result('generate_report', data, run)
     
+    except ReportNotFoundError as e:
+        # 確認した後にレポートが保持数を超えて削除された場合
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'議事録生成中にエラーが発生しました: {str(e)}'}), 500
 
@@ -277,6 +497,47 @@ def download(filename):
         traceback.print_exc()
         return jsonify({'error': f'ダウンロード処理中にエラーが発生しました: {str(e)}'}), 500
 
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """バックグラウンドジョブのイベントをServer-Sent Eventsで送信する"""
+    if get_job(job_id) is None:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    
+    # 再接続時はLast-Event-IDの次のイベントから送信
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id', '-1'))
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = -1
+    
+    return stream_job_events(job_id, last_event_id)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """バックグラウンドジョブの状態と進捗を返す"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'ジョブが見つかりません'}), 404
+    
+    return jsonify({
+        'status': 'success',
+        'job': job
+    })
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """キャッシュ等の統計情報を返す"""
+    return jsonify({
+        'status': 'success',
+        'transcription_cache': get_transcription_cache_stats(),
+        'retrieval_index': get_retrieval_index_stats(),
+        'llm_clients': get_llm_client_stats(),
+        'llm_result_cache': get_result_cache_stats(),
+        'template_cache': get_template_cache_stats(),
+        'report_render': get_report_render_stats(),
+        'report_cache': get_report_cache_stats()
+    })
+
 if __name__ == '__main__':
     # Google Colab環境で実行されているかを確認
     try:
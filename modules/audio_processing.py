@@ -0,0 +1,302 @@
+import os
+import tempfile
+import ffmpeg
+from pydub import AudioSegment
+from pydub.silence import detect_silence
+
+# 1チャンクの目標の長さ（ミリ秒）- 例: 10分
+TARGET_CHUNK_LENGTH = int(os.environ.get("AUDIO_CHUNK_LENGTH_MS", str(10 * 60 * 1000)))
+
+# 分割点を探す範囲（目標位置の前後、ミリ秒）
+CUT_SEARCH_WINDOW = 30 * 1000
+
+# 無音とみなす最小の長さ（ミリ秒）
+MIN_SILENCE_LENGTH = 400
+
+# 無音判定の閾値（探索範囲の平均音量からの相対値、dB）
+SILENCE_THRESHOLD_OFFSET = 16
+
+# 無音が見つからずに分割した場合に前チャンクと重ねる長さ（ミリ秒）
+CHUNK_OVERLAP = int(os.environ.get("AUDIO_CHUNK_OVERLAP_MS", "2000"))
+
+# アップロード前の変換形式（'flac'、'opus'、変換しない場合は 'off'）
+UPLOAD_AUDIO_FORMAT = os.environ.get("UPLOAD_AUDIO_FORMAT", "flac").lower()
+
+# アップロード用に変換する際のサンプリングレート（Hz）
+UPLOAD_SAMPLE_RATE = 16000
+
+# 変換形式毎の拡張子、ffmpegのエンコーダー設定、Content-Type
+UPLOAD_FORMATS = {
+    'flac': {'suffix': '.flac', 'output': {'acodec': 'flac'}, 'content_type': 'audio/flac'},
+    'opus': {'suffix': '.ogg', 'output': {'acodec': 'libopus', 'audio_bitrate': '32k'}, 'content_type': 'audio/ogg'},
+}
+
+# 拡張子毎のContent-Type（変換しない場合に使用）
+CONTENT_TYPES = {
+    '.wav': 'audio/wav',
+    '.mp3': 'audio/mpeg',
+    '.mpeg': 'audio/mpeg',
+    '.mpga': 'audio/mpeg',
+    '.m4a': 'audio/mp4',
+    '.mp4': 'audio/mp4',
+    '.aac': 'audio/aac',
+    '.flac': 'audio/flac',
+    '.ogg': 'audio/ogg',
+    '.opus': 'audio/ogg',
+    '.webm': 'audio/webm',
+}
+
+# 重なり1秒あたりの文字数の上限（つなぎ目の重複テキストを探す範囲の算出に使用）
+SEAM_CHARS_PER_SECOND = 20
+
+# つなぎ目の重複とみなす最小一致文字数
+MIN_SEAM_MATCH = 4
+
+# つなぎ目の前後で無視する文字数の上限（チャンクの端で途切れた語などの認識の揺れ）
+SEAM_JITTER_CHARS = 3
+
+def get_audio_duration(audio_path):
+    """
+    コンテナのメタデータから音声の長さを取得する（全体はデコードしない）
+    
+    Args:
+        audio_path (str): 音声ファイルのパス
+        
+    Returns:
+        int: 音声の長さ（ミリ秒）
+    """
+    probe = ffmpeg.probe(audio_path)
+    
+    duration = probe.get('format', {}).get('duration')
+    if duration is None:
+        # コンテナに長さがない場合は音声ストリームの情報を使う
+        for stream in probe.get('streams', []):
+            if stream.get('codec_type') == 'audio' and stream.get('duration'):
+                duration = stream['duration']
+                break
+    
+    if duration is None:
+        raise Exception(f"音声の長さを取得できませんでした: {audio_path}")
+    
+    return int(float(duration) * 1000)
+
+def load_audio_window(audio_path, start, length):
+    """
+    音声の一部の区間だけをデコードして読み込む
+    
+    Args:
+        audio_path (str): 音声ファイルのパス
+        start (int): 開始位置（ミリ秒）
+        length (int): 読み込む長さ（ミリ秒）
+        
+    Returns:
+        AudioSegment: 指定区間の音声データ
+    """
+    return AudioSegment.from_file(
+        audio_path,
+        start_second=start / 1000,
+        duration=length / 1000
+    )
+
+def get_content_type(audio_path):
+    """
+    音声ファイルの拡張子からContent-Typeを判定する
+    
+    Args:
+        audio_path (str): 音声ファイルのパス
+        
+    Returns:
+        str: Content-Type
+    """
+    _, extension = os.path.splitext(audio_path)
+    return CONTENT_TYPES.get(extension.lower(), 'application/octet-stream')
+
+def export_segment(audio_path, segment=None, upload_format=UPLOAD_AUDIO_FORMAT):
+    """
+    指定区間をffmpegで切り出して一時ファイルに書き出す
+    
+    upload_format が 'flac' または 'opus' の場合は、アップロード量を減らすため
+    モノラル・16kHzに変換して圧縮する。それ以外の場合はWAVで書き出す。
+    
+    Args:
+        audio_path (str): 音声ファイルのパス
+        segment (dict): 'start' と 'end' を持つ区間（ミリ秒、省略時はファイル全体）
+        upload_format (str): 変換形式（'flac'、'opus'、'off'）
+        
+    Returns:
+        str: 書き出した一時ファイルのパス
+    """
+    input_options = {}
+    if segment is not None and not segment.get('whole'):
+        input_options = {'ss': segment['start'] / 1000, 't': (segment['end'] - segment['start']) / 1000}
+    
+    # 映像トラックは不要
+    output_options = {'vn': None}
+    if upload_format in UPLOAD_FORMATS:
+        suffix = UPLOAD_FORMATS[upload_format]['suffix']
+        output_options.update(UPLOAD_FORMATS[upload_format]['output'])
+        output_options.update({'ac': 1, 'ar': UPLOAD_SAMPLE_RATE})
+    else:
+        suffix = ".wav"
+    
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    temp_file.close()
+    
+    try:
+        (
+            ffmpeg
+            .input(audio_path, **input_options)
+            .output(temp_file.name, **output_options)
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except ffmpeg.Error as e:
+        os.unlink(temp_file.name)
+        raise Exception(f"音声の切り出しに失敗しました: {e.stderr.decode('utf-8', errors='ignore')}")
+    
+    return temp_file.name
+
+def find_cut_point(audio_path, target, window=CUT_SEARCH_WINDOW):
+    """
+    目標位置の近くで分割に適した位置を探す
+    
+    探索範囲の音声だけをデコードするため、元の音声の長さに関わらず
+    メモリ使用量は一定になる。
+    
+    Args:
+        audio_path (str): 音声ファイルのパス
+        target (int): 目標の分割位置（ミリ秒）
+        window (int): 目標位置の前後に探索する範囲（ミリ秒）
+        
+    Returns:
+        tuple: (分割位置（ミリ秒）, 無音区間で分割できたかどうか)
+    """
+    search_start = max(0, target - window)
+    region = load_audio_window(audio_path, search_start, target + window - search_start)
+    
+    # 探索範囲全体が無音の場合は目標位置でそのまま分割
+    if region.dBFS == float('-inf'):
+        return target, True
+    
+    silences = detect_silence(
+        region,
+        min_silence_len=MIN_SILENCE_LENGTH,
+        silence_thresh=region.dBFS - SILENCE_THRESHOLD_OFFSET,
+        seek_step=10
+    )
+    
+    if not silences:
+        return target, False
+    
+    # 目標位置に最も近い無音区間の中央で分割
+    center = target - search_start
+    start, end = min(silences, key=lambda s: abs((s[0] + s[1]) // 2 - center))
+    return search_start + (start + end) // 2, True
+
+def plan_segments(audio_path, duration=None, target_length=TARGET_CHUNK_LENGTH, overlap=CHUNK_OVERLAP):
+    """
+    音声の分割区間を決定する
+    
+    分割点は目標の長さ付近の無音区間に置く。無音が見つからない場合は
+    目標位置で分割し、次のチャンクを overlap ミリ秒だけ前から始める。
+    
+    Args:
+        audio_path (str): 音声ファイルのパス
+        duration (int): 音声の長さ（ミリ秒、省略時はメタデータから取得）
+        target_length (int): 1チャンクの目標の長さ（ミリ秒）
+        overlap (int): 無音以外で分割した場合の重なり（ミリ秒）
+        
+    Returns:
+        list: 区間のリスト（各要素は 'start', 'end', 'overlap' を持つ辞書）
+    """
+    if duration is None:
+        duration = get_audio_duration(audio_path)
+    
+    segments = []
+    position = 0
+    start = 0
+    start_overlap = 0
+    
+    # 残りが目標の長さ＋探索範囲に収まるまで分割点を探す
+    while duration - position > target_length + CUT_SEARCH_WINDOW:
+        cut, in_silence = find_cut_point(audio_path, position + target_length)
+        segments.append({'start': start, 'end': cut, 'overlap': start_overlap})
+        
+        start_overlap = 0 if in_silence else overlap
+        start = cut - start_overlap
+        position = cut
+    
+    segments.append({'start': start, 'end': duration, 'overlap': start_overlap})
+    return segments
+
+def merge_transcripts(texts, overlaps=None):
+    """
+    チャンク毎の文字起こしを結合する
+    
+    重なりのあるつなぎ目では、前チャンクの末尾と次チャンクの先頭が
+    一致する部分を探し、重複したテキストを1回分だけ残す。
+    無音で分割したつなぎ目（重なりなし）はそのまま結合する。
+    
+    Args:
+        texts (list): チャンク毎の文字起こしテキスト（元の順序）
+        overlaps (list): 各チャンクの先頭の重なり（ミリ秒）
+        
+    Returns:
+        str: 結合されたテキスト
+    """
+    if overlaps is None:
+        overlaps = [0] * len(texts)
+    
+    merged = ""
+    for text, overlap in zip(texts, overlaps):
+        if not merged:
+            merged = text
+        elif overlap and text:
+            merged = _merge_seam(merged, text, overlap)
+        else:
+            merged = f"{merged} {text}"
+    
+    return merged
+
+def _merge_seam(previous, following, overlap=CHUNK_OVERLAP):
+    """
+    重なりのあるつなぎ目の重複テキストを取り除いて結合する
+    
+    前チャンクの末尾と次チャンクの先頭が一致する場合のみ重複とみなす
+    （どちらも端の SEAM_JITTER_CHARS 文字までの揺れは無視するが、無視した
+    文字数に応じてより長い一致を求める）。
+    一致する長さは重なりの長さから見積もった文字数までとし、
+    一致しない場合は何も取り除かずに結合する。
+    
+    Args:
+        previous (str): 前チャンクまでの文字起こし
+        following (str): 次チャンクの文字起こし
+        overlap (int): 重なりの長さ（ミリ秒）
+        
+    Returns:
+        str: 結合されたテキスト
+    """
+    previous = previous.rstrip()
+    following = following.lstrip()
+    max_match = max(MIN_SEAM_MATCH, overlap * SEAM_CHARS_PER_SECOND // 1000)
+    
+    best = None
+    for skip_end in range(min(SEAM_JITTER_CHARS, len(previous)) + 1):
+        end = len(previous) - skip_end
+        for skip_start in range(min(SEAM_JITTER_CHARS, len(following)) + 1):
+            # 揺れとして文字を無視するほど、偶然の一致を避けるため長い一致を求める
+            shortest = MIN_SEAM_MATCH * (1 + skip_end + skip_start)
+            longest = min(max_match, end, len(following) - skip_start)
+            for size in range(longest, shortest - 1, -1):
+                if previous[end - size:end] == following[skip_start:skip_start + size]:
+                    # 一致が長いものを優先し、同じ長さなら揺れの少ないものを採用
+                    if best is None or (size, -(skip_end + skip_start)) > (best[0], -(best[1] + best[2])):
+                        best = (size, skip_end, skip_start)
+                    break
+    
+    if best is None:
+        return f"{previous} {following}"
+    
+    # 一致部分までを前チャンクから、一致部分以降を次チャンクから採用
+    size, skip_end, skip_start = best
+    return previous[:len(previous) - skip_end] + following[skip_start + size:]
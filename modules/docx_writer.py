@@ -0,0 +1,193 @@
+import os
+import re
+import shutil
+import zipfile
+import tempfile
+from xml.sax.saxutils import escape
+
+# 文字起こし全文を書き込む位置を示す目印（この文字列を含むパラグラフが文字起こしに置き換わる）
+TRANSCRIPT_MARKER = "__TRANSCRIPT_STREAM_MARKER__"
+
+# 文字起こしを分割する1パラグラフの最大文字数
+DOCX_PARAGRAPH_CHARS = int(os.environ.get("DOCX_PARAGRAPH_CHARS", "500"))
+
+# 本文のXMLのパス
+DOCUMENT_XML = 'word/document.xml'
+
+# 文の区切り（この直後で分割する）
+_SENTENCE_END = re.compile(r'(?<=[。！？!?])')
+
+# XMLで使用できない制御文字
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+def iter_transcript_segments(transcription, max_chars=DOCX_PARAGRAPH_CHARS):
+    """
+    文字起こしをパラグラフ単位に分割して順に取り出す
+    
+    改行で分割し、max_chars を超える行は文の区切りでまとめ直す
+    （区切りがない場合は max_chars 文字毎に分割する）。
+    
+    Args:
+        transcription (str): 文字起こしテキスト
+        max_chars (int): 1パラグラフの最大文字数
+        
+    Yields:
+        str: パラグラフのテキスト
+    """
+    for line in transcription.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if len(line) <= max_chars:
+            yield line
+            continue
+        
+        current = ""
+        for sentence in _SENTENCE_END.split(line):
+            while len(sentence) > max_chars:
+                if current:
+                    yield current
+                    current = ""
+                yield sentence[:max_chars]
+                sentence = sentence[max_chars:]
+            if len(current) + len(sentence) > max_chars:
+                yield current
+                current = ""
+            current += sentence
+        if current:
+            yield current
+
+def _find_marker_paragraph(document_xml, offset=0):
+    """本文のXMLから offset 以降で最初に目印を含むパラグラフの範囲と、パラグラフ・ランの書式を取り出す"""
+    marker = TRANSCRIPT_MARKER.encode('utf-8')
+    position = document_xml.find(marker, offset)
+    if position < 0:
+        return None
+    
+    # <w:pPr> などと区別するため、<w:p> と <w:p ...> の開始タグを探す
+    start = max(document_xml.rfind(b'<w:p>', 0, position), document_xml.rfind(b'<w:p ', 0, position))
+    end = document_xml.find(b'</w:p>', position) + len(b'</w:p>')
+    paragraph = document_xml[start:end]
+    
+    paragraph_properties = re.search(rb'<w:pPr>.*?</w:pPr>|<w:pPr/>', paragraph, re.DOTALL)
+    run_start = max(paragraph.rfind(b'<w:r>', 0, position - start), paragraph.rfind(b'<w:r ', 0, position - start))
+    run_properties = None
+    if run_start >= 0:
+        run_properties = re.search(rb'<w:rPr>.*?</w:rPr>|<w:rPr/>', paragraph[run_start:position - start], re.DOTALL)
+    
+    return {
+        'start': start,
+        'end': end,
+        'paragraph': paragraph,
+        'pPr': paragraph_properties.group(0) if paragraph_properties else b'',
+        'rPr': run_properties.group(0) if run_properties else b'',
+    }
+
+def _xml_text(text):
+    """テキストをXMLの文字データに変換する"""
+    return escape(_INVALID_XML_CHARS.sub('', text)).encode('utf-8')
+
+def _paragraph_xml(text, paragraph_properties, run_properties):
+    """書式を指定したパラグラフのXMLを作成する"""
+    return (
+        b'<w:p>' + paragraph_properties + b'<w:r>' + run_properties
+        + b'<w:t xml:space="preserve">' + _xml_text(text) + b'</w:t></w:r></w:p>'
+    )
+
+def _write_marker_paragraph(writer, found, transcription, max_chars):
+    """
+    目印のパラグラフを、目印の前のテキスト・文字起こし・目印の後のテキストの順に書き込む
+    
+    Args:
+        writer: 本文のXMLの書き込み先
+        found (dict): _find_marker_paragraph の結果
+        transcription (str): 文字起こしテキスト
+        max_chars (int): 1パラグラフの最大文字数
+    """
+    marker = TRANSCRIPT_MARKER.encode('utf-8')
+    head, tail = found['paragraph'].split(marker, 1)
+    segments = iter_transcript_segments(transcription, max_chars)
+    
+    # 目印の前のテキストは書式を保ったまま最初のパラグラフに残す
+    writer.write(head + _xml_text(next(segments, "")) + b'</w:t></w:r></w:p>')
+    for segment in segments:
+        writer.write(_paragraph_xml(segment, found['pPr'], found['rPr']))
+    
+    # 目印の後のテキストは同じ書式の新しいパラグラフとして文字起こしの後に置く
+    tail = (
+        b'<w:p>' + found['pPr'] + b'<w:r>' + found['rPr']
+        + b'<w:t xml:space="preserve">' + tail
+    )
+    if marker in tail:
+        _write_marker_paragraph(writer, dict(found, paragraph=tail), transcription, max_chars)
+    elif re.sub(rb'<[^>]*>', b'', tail).strip():
+        writer.write(tail)
+
+def stream_transcript_into_docx(source_path, output_path, transcription, max_chars=DOCX_PARAGRAPH_CHARS):
+    """
+    目印を含むdocxの目印の位置に、文字起こしをパラグラフに分割して書き込む
+    
+    文字起こしはpython-docxのオブジェクトを作らずに、本文のXMLとしてzipに
+    直接書き込む。各パラグラフは目印のパラグラフ・ランと同じ書式（テンプレートの
+    スタイル）になる。目印が複数ある場合はそれぞれの位置に書き込む。
+    
+    Args:
+        source_path (str): 目印を含むdocxファイルのパス
+        output_path (str): 出力するdocxファイルのパス
+        transcription (str): 文字起こしテキスト
+        max_chars (int): 1パラグラフの最大文字数
+        
+    Returns:
+        bool: 目印が見つかり文字起こしを書き込んだ場合はTrue
+    """
+    with zipfile.ZipFile(source_path) as source, \
+            zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED) as output:
+        written = False
+        for item in source.infolist():
+            output_item = zipfile.ZipInfo(item.filename, item.date_time)
+            output_item.compress_type = zipfile.ZIP_DEFLATED
+            output_item.external_attr = item.external_attr
+            if item.filename != DOCUMENT_XML:
+                with source.open(item) as reader, output.open(output_item, 'w') as writer:
+                    shutil.copyfileobj(reader, writer)
+                continue
+            
+            # 文字起こしを含まない本文のXMLは小さいため、全体を読み込んで目印を探す
+            document_xml = source.read(item)
+            found = _find_marker_paragraph(document_xml)
+            with output.open(output_item, 'w', force_zip64=True) as writer:
+                if found is None:
+                    writer.write(document_xml)
+                    continue
+                
+                # 目印のパラグラフ毎に文字起こしを書き込む
+                position = 0
+                while found is not None:
+                    writer.write(document_xml[position:found['start']])
+                    _write_marker_paragraph(writer, found, transcription, max_chars)
+                    position = found['end']
+                    found = _find_marker_paragraph(document_xml, position)
+                
+                writer.write(document_xml[position:])
+                written = True
+    
+    return written
+
+def save_with_transcript(doc, output_path, transcription, max_chars=DOCX_PARAGRAPH_CHARS):
+    """
+    目印のパラグラフを含むドキュメントを、文字起こしを書き込んで保存する
+    
+    Args:
+        doc (Document): 文字起こしの位置に TRANSCRIPT_MARKER を含むdocxドキュメント
+        output_path (str): 出力するdocxファイルのパス
+        transcription (str): 文字起こしテキスト
+        max_chars (int): 1パラグラフの最大文字数
+    """
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.docx')
+    temp_file.close()
+    try:
+        doc.save(temp_file.name)
+        if not stream_transcript_into_docx(temp_file.name, output_path, transcription or "", max_chars):
+            print("警告: 文字起こしの書き込み位置が見つからないため、文字起こしを含めずに保存しました")
+    finally:
+        os.unlink(temp_file.name)
@@ -1,101 +1,275 @@
 import os
 import json
+import hashlib
+import threading
 import docx
 from datetime import datetime
+from collections import OrderedDict
 
-def generate_download(transcription, summary=None, qa_data=None, output_format='docx'):
+from modules.docx_writer import TRANSCRIPT_MARKER, save_with_transcript
+from modules.template_handler import add_qa_table
+from modules.report_renderer import new_report_id, make_report_path, render_report
+
+# レポートのタイトル
+REPORT_TITLE = '音声文字起こし報告書'
+
+# メモリに保持するレポートの数（レポートID単位）
+REPORT_CACHE_SIZE = int(os.environ.get("REPORT_CACHE_SIZE", "32"))
+
+# 出力フォーマットと拡張子（'md' は 'markdown' として扱う）
+REPORT_EXTENSIONS = {
+    'docx': 'docx',
+    'txt': 'txt',
+    'json': 'json',
+    'markdown': 'md',
+}
+_FORMAT_ALIASES = {'md': 'markdown'}
+
+_reports = OrderedDict()
+_report_stats = {'hits': 0, 'misses': 0, 'renders': 0, 'evictions': 0}
+_reports_lock = threading.Lock()
+
+class ReportNotFoundError(ValueError):
+    """指定されたレポートIDのレポートを保持していない（期限切れ・未作成）場合のエラー"""
+
+def normalize_output_format(output_format):
     """
-    ダウンロード用のファイルを生成する
+    出力フォーマットの名前を正規化する
+    
+    Args:
+        output_format (str): 出力フォーマット ('docx', 'txt', 'json', 'markdown' または 'md')
+        
+    Returns:
+        str: 正規化した出力フォーマット
+    """
+    name = (output_format or '').lower()
+    name = _FORMAT_ALIASES.get(name, name)
+    if name not in REPORT_EXTENSIONS:
+        raise ValueError(f"サポートされていない出力フォーマット: {output_format}")
+    return name
+
+def build_report(transcription, summary=None, qa_data=None):
+    """
+    各フォーマットの出力に共通するレポートの内容を作成する
     
     Args:
         transcription (str): 文字起こしテキスト
         summary (str): 要約テキスト
         qa_data (list): 質疑応答データのリスト
-        output_format (str): 出力フォーマット ('docx', 'txt', 'json')
         
     Returns:
-        str: 生成されたファイルのパス
+        dict: タイトル、生成日時、要約、文字起こし、質疑応答
     """
-    # 出力ディレクトリを確保
-    output_dir = 'static/uploads'
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-    
-    # タイムスタンプを生成
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # ファイル名と相対パスを生成
-    filename = f'report_{timestamp}.{output_format}'
-    relative_path = os.path.join('static/uploads', filename)
-    
-    # 絶対パスを生成 (ファイル保存用)
-    try:
-        # 現在のファイルの場所を基準にする
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(base_dir)
-        abs_path = os.path.join(parent_dir, 'static/uploads', filename)
-    except:
-        # 絶対パスの生成に失敗した場合は相対パスをそのまま使用
-        abs_path = relative_path
-    
-    print(f"ファイル生成情報:")
-    print(f"  出力フォーマット: {output_format}")
-    print(f"  タイムスタンプ: {timestamp}")
-    print(f"  ファイル名: {filename}")
-    print(f"  相対パス: {relative_path}")
-    print(f"  絶対パス: {abs_path}")
-    
-    if output_format.lower() == 'docx':
-        return generate_docx(transcription, summary, qa_data, abs_path)
-    elif output_format.lower() == 'txt':
-        return generate_txt(transcription, summary, qa_data, abs_path)
-    elif output_format.lower() == 'json':
-        return generate_json(transcription, summary, qa_data, abs_path)
-    else:
-        raise ValueError(f"サポートされていない出力フォーマット: {output_format}")
+    generated_at = datetime.now()
+    return {
+        'title': REPORT_TITLE,
+        'generated_at': generated_at.isoformat(),
+        'generated_at_label': generated_at.strftime("%Y年%m月%d日 %H:%M:%S"),
+        'file_stamp': generated_at.strftime("%Y%m%d_%H%M%S"),
+        'transcription': transcription or "",
+        'summary': summary or "",
+        'qa_data': [
+            {'question': qa.get('question', ''), 'answer': qa.get('answer', '')}
+            for qa in (qa_data or [])
+        ],
+    }
+
+def _report_fingerprint(transcription, summary, qa_data, template_path):
+    """レポートの入力が同じかどうかを判定するハッシュ値を作成する"""
+    payload = json.dumps(
+        [transcription or "", summary or "", qa_data or [], template_path or ""],
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
 
-def generate_docx(transcription, summary, qa_data, output_path):
+def _get_report_entry(report_id, fingerprint, transcription, summary, qa_data):
     """
-    Wordドキュメントを生成
+    レポートIDに対応するレポートの内容と作成済みのファイルを取得する
+    
+    入力が与えられ、保持しているレポートと異なる場合は作り直す。
+    """
+    with _reports_lock:
+        entry = _reports.get(report_id)
+        if entry is not None and (transcription is None or entry['fingerprint'] == fingerprint):
+            _reports.move_to_end(report_id)
+            _report_stats['hits'] += 1
+            return entry
+        _report_stats['misses'] += 1
+        
+        if transcription is None:
+            raise ReportNotFoundError(f"レポートが見つかりません（文字起こしデータを指定して再作成してください）: {report_id}")
+        
+        entry = {
+            'fingerprint': fingerprint,
+            'report': build_report(transcription, summary, qa_data),
+            'files': {},
+            'lock': threading.Lock(),
+        }
+        _reports[report_id] = entry
+        _reports.move_to_end(report_id)
+        while len(_reports) > REPORT_CACHE_SIZE:
+            _reports.popitem(last=False)
+            _report_stats['evictions'] += 1
+        return entry
+
+def has_report(report_id):
+    """
+    レポートIDに対応するレポートを保持しているかどうかを判定する
+    
+    Args:
+        report_id (str): レポートID
+        
+    Returns:
+        bool: 保持している場合はTrue
+    """
+    with _reports_lock:
+        return report_id in _reports
+
+def _existing_file(relative_path):
+    """作成済みのファイルが残っているかどうか（保持期間を過ぎると削除される）"""
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return relative_path is not None and os.path.exists(os.path.join(base_dir, *relative_path.split('/')))
+
+def generate_reports(output_formats, transcription=None, summary=None, qa_data=None, report_id=None,
+                     template_path=None, render_template=None):
+    """
+    1つのレポートを複数のフォーマットで出力する
+    
+    レポートの内容は1回だけ作成し、各フォーマットはそこから出力する。
+    作成したレポートと出力済みのファイルはレポートID毎に保持し、同じレポートの
+    別のフォーマットや、同じフォーマットの再ダウンロードでは作り直さない。
+    
+    Args:
+        output_formats (list): 出力フォーマットのリスト ('docx', 'txt', 'json', 'markdown')
+        transcription (str): 文字起こしテキスト（Noneの場合は保持しているレポートを使用）
+        summary (str): 要約テキスト
+        qa_data (list): 質疑応答データのリスト
+        report_id (str): レポートID（省略時は新しく作成）
+        template_path (str): docxの作成に使用するテンプレートのパス
+        render_template (callable): テンプレートからdocxを作成する関数 (report_id) -> 相対パス
+        
+    Returns:
+        tuple: (レポートID, フォーマット毎の相対パスの辞書)
+    """
+    formats = []
+    for output_format in output_formats:
+        name = normalize_output_format(output_format)
+        if name not in formats:
+            formats.append(name)
+    
+    report_id = report_id or new_report_id()
+    fingerprint = _report_fingerprint(transcription, summary, qa_data, template_path)
+    entry = _get_report_entry(report_id, fingerprint, transcription, summary, qa_data)
+    report = entry['report']
+    
+    # 同じレポートへの同時のリクエストで同じファイルを書き込まないよう、レポート毎に排他する
+    with entry['lock']:
+        paths = {name: entry['files'][name] for name in formats if _existing_file(entry['files'].get(name))}
+        missing = [name for name in formats if name not in paths]
+        
+        # テンプレートを使用する場合のdocxはテンプレートから作成
+        if 'docx' in missing and render_template is not None:
+            paths['docx'] = render_template(report_id)
+            missing.remove('docx')
+        
+        if missing:
+            targets = []
+            for name in missing:
+                filename = f"report_{report['file_stamp']}.{REPORT_EXTENSIONS[name]}"
+                paths[name], abs_path = make_report_path(report_id, filename)
+                targets.append((name, abs_path))
+            
+            print(f"レポート {report_id} を出力します: {', '.join(missing)}")
+            render_report(write_report_files, report, targets)
+            with _reports_lock:
+                _report_stats['renders'] += len(missing)
+        
+        entry['files'].update(paths)
+    
+    return report_id, {name: paths[name] for name in formats}
+
+def generate_download(transcription, summary=None, qa_data=None, output_format='docx', report_id=None):
+    """
+    ダウンロード用のファイルを生成する
     
     Args:
         transcription (str): 文字起こしテキスト
         summary (str): 要約テキスト
         qa_data (list): 質疑応答データのリスト
-        output_path (str): 出力ファイルパス
+        output_format (str): 出力フォーマット ('docx', 'txt', 'json', 'markdown')
+        report_id (str): レポートID（出力先のディレクトリ、省略時は新しく作成）
         
     Returns:
         str: 生成されたファイルの相対パス
     """
+    _, paths = generate_reports([output_format], transcription, summary, qa_data, report_id=report_id)
+    return paths[normalize_output_format(output_format)]
+
+def write_report_files(report, targets):
+    """
+    レポートを指定されたフォーマットのファイルに出力する（レポート作成用のプロセスで実行）
+    
+    Args:
+        report (dict): build_report で作成したレポート
+        targets (list): (出力フォーマット, 出力ファイルパス) のリスト
+        
+    Returns:
+        list: 出力したファイルのパス
+    """
+    writers = {
+        'docx': generate_docx,
+        'txt': generate_txt,
+        'json': generate_json,
+        'markdown': generate_markdown,
+    }
+    return [writers[name](report, output_path) for name, output_path in targets]
+
+def generate_docx(report, output_path):
+    """
+    Wordドキュメントを生成
+    
+    Args:
+        report (dict): build_report で作成したレポート
+        output_path (str): 出力ファイルパス
+        
+    Returns:
+        str: 生成されたファイルのパス
+    """
     # 新しいドキュメントを作成
     doc = docx.Document()
     
     # タイトルを追加
-    doc.add_heading('音声文字起こし報告書', 0)
+    doc.add_heading(report['title'], 0)
     
     # 生成日時を追加
-    doc.add_paragraph(f'生成日時: {datetime.now().strftime("%Y年%m月%d日 %H:%M:%S")}')
+    doc.add_paragraph(f"生成日時: {report['generated_at_label']}")
+    
+    # 要約セクションを追加（存在する場合）
+    if report['summary']:
+        doc.add_heading('要約', level=1)
+        doc.add_paragraph(report['summary'])
     
-    # 以下略...
+    # 文字起こしセクションを追加（本文は保存時に直接書き込む）
+    doc.add_heading('文字起こし全文', level=1)
+    doc.add_paragraph(TRANSCRIPT_MARKER)
+    
+    # Q&Aセクションを追加（存在する場合）
+    if report['qa_data']:
+        add_qa_table(doc, report['qa_data'])
     
     # ファイルを保存
     print(f"Word文書の保存先: {output_path}")
-    doc.save(output_path)
-    
-    # 相対パスを返す (static/uploads/filename.docx 形式)
-    relative_path = 'static/uploads/' + os.path.basename(output_path)
-    return relative_path
+    save_with_transcript(doc, output_path, report['transcription'])
     
-def generate_txt(transcription, summary, qa_data, output_dir, timestamp):
+    return output_path
+
+def generate_txt(report, output_path):
     """
     テキストファイルを生成
     
     Args:
-        transcription (str): 文字起こしテキスト
-        summary (str): 要約テキスト
-        qa_data (list): 質疑応答データのリスト
-        output_dir (str): 出力ディレクトリ
-        timestamp (str): タイムスタンプ
+        report (dict): build_report で作成したレポート
+        output_path (str): 出力ファイルパス
         
     Returns:
         str: 生成されたファイルのパス
@@ -103,68 +277,126 @@ def generate_txt(transcription, summary, qa_data, output_dir, timestamp):
     content = []
     
     # タイトルを追加
-    content.append("音声文字起こし報告書")
+    content.append(report['title'])
     content.append("="*40)
     
     # 生成日時を追加
-    content.append(f'生成日時: {datetime.now().strftime("%Y年%m月%d日 %H:%M:%S")}')
+    content.append(f"生成日時: {report['generated_at_label']}")
     content.append("")
     
     # 要約セクションを追加（存在する場合）
-    if summary:
+    if report['summary']:
         content.append("【要約】")
         content.append("-"*40)
-        content.append(summary)
+        content.append(report['summary'])
         content.append("")
     
     # 文字起こしセクションを追加
     content.append("【文字起こし全文】")
     content.append("-"*40)
-    content.append(transcription)
+    content.append(report['transcription'])
     content.append("")
     
     # Q&Aセクションを追加（存在する場合）
-    if qa_data and len(qa_data) > 0:
+    if report['qa_data']:
         content.append("【質疑応答】")
         content.append("-"*40)
         
-        for i, qa in enumerate(qa_data, 1):
-            content.append(f"Q{i}: {qa.get('question', '')}")
-            content.append(f"A{i}: {qa.get('answer', '')}")
+        for i, qa in enumerate(report['qa_data'], 1):
+            content.append(f"Q{i}: {qa['question']}")
+            content.append(f"A{i}: {qa['answer']}")
             content.append("")
     
     # ファイルを保存
-    output_path = os.path.join(output_dir, f'report_{timestamp}.txt')
     with open(output_path, 'w', encoding='utf-8') as f:
         f.write('\n'.join(content))
     
-    return os.path.join(os.path.basename(output_dir), f'report_{timestamp}.txt')
+    return output_path
 
-def generate_json(transcription, summary, qa_data, output_dir, timestamp):
+def generate_json(report, output_path):
     """
     JSONファイルを生成
     
     Args:
-        transcription (str): 文字起こしテキスト
-        summary (str): 要約テキスト
-        qa_data (list): 質疑応答データのリスト
-        output_dir (str): 出力ディレクトリ
-        timestamp (str): タイムスタンプ
+        report (dict): build_report で作成したレポート
+        output_path (str): 出力ファイルパス
         
     Returns:
         str: 生成されたファイルのパス
     """
     # JSONデータを作成
     data = {
-        'timestamp': datetime.now().isoformat(),
-        'transcription': transcription,
-        'summary': summary if summary else "",
-        'qa_data': qa_data if qa_data else []
+        'timestamp': report['generated_at'],
+        'transcription': report['transcription'],
+        'summary': report['summary'],
+        'qa_data': report['qa_data']
     }
     
     # ファイルを保存
-    output_path = os.path.join(output_dir, f'report_{timestamp}.json')
     with open(output_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     
-    return os.path.join(os.path.basename(output_dir), f'report_{timestamp}.json')
+    return output_path
+
+def generate_markdown(report, output_path):
+    """
+    Markdownファイルを生成
+    
+    Args:
+        report (dict): build_report で作成したレポート
+        output_path (str): 出力ファイルパス
+        
+    Returns:
+        str: 生成されたファイルのパス
+    """
+    content = []
+    
+    # タイトルと生成日時を追加
+    content.append(f"# {report['title']}")
+    content.append("")
+    content.append(f"生成日時: {report['generated_at_label']}")
+    content.append("")
+    
+    # 要約セクションを追加（存在する場合）
+    if report['summary']:
+        content.append("## 要約")
+        content.append("")
+        content.append(report['summary'])
+        content.append("")
+    
+    # 文字起こしセクションを追加（行毎に段落として出力）
+    content.append("## 文字起こし全文")
+    content.append("")
+    for line in report['transcription'].splitlines():
+        if line.strip():
+            content.append(line.strip())
+            content.append("")
+    
+    # Q&Aセクションを追加（存在する場合）
+    if report['qa_data']:
+        content.append("## 質疑応答")
+        content.append("")
+        
+        for i, qa in enumerate(report['qa_data'], 1):
+            content.append(f"### Q{i}. {qa['question']}")
+            content.append("")
+            content.append(qa['answer'])
+            content.append("")
+    
+    # ファイルを保存
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(content))
+    
+    return output_path
+
+def get_report_cache_stats():
+    """
+    レポートのキャッシュの統計情報を取得する
+    
+    Returns:
+        dict: ヒット数、ミス数、出力したファイル数、削除数、保持しているレポートの数
+    """
+    with _reports_lock:
+        stats = dict(_report_stats)
+        stats.update({'entries': len(_reports), 'max_entries': REPORT_CACHE_SIZE})
+    return stats
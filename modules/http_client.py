@@ -0,0 +1,147 @@
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+import requests
+from requests.adapters import HTTPAdapter
+
+# 接続・読み取りのタイムアウト（秒）
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "300"))
+
+# 再試行の最大回数と待機時間（秒）
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "4"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# 再試行の対象とするステータスコード
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# プロバイダー毎の接続プールの大きさ
+POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+
+# プロバイダー毎に共有するセッション
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(provider):
+    """
+    プロバイダー毎に共有するHTTPセッションを取得する
+    
+    セッションはKeep-Aliveの接続プールを持つため、同じプロバイダーへの
+    リクエストではTLSハンドシェイクが再利用される。
+    
+    Args:
+        provider (str): プロバイダー名（'deepgram'、'groq' など）
+        
+    Returns:
+        requests.Session: HTTPセッション
+    """
+    with _sessions_lock:
+        session = _sessions.get(provider)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[provider] = session
+        return session
+
+def parse_retry_after(value):
+    """
+    Retry-Afterヘッダーの値を待機秒数に変換する
+    
+    Args:
+        value (str): Retry-Afterヘッダーの値（秒数またはHTTP日付）
+        
+    Returns:
+        float: 待機秒数（解釈できない場合はNone）
+    """
+    if not value:
+        return None
+    
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def compute_backoff(attempt, retry_after=None):
+    """
+    再試行までの待機秒数を計算する（指数バックオフ＋ジッター）
+    
+    Args:
+        attempt (int): 何回目の再試行か（0始まり）
+        retry_after (float): サーバーが指定した待機秒数
+        
+    Returns:
+        float: 待機秒数
+    """
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    
+    # Full Jitter: 0〜上限の範囲でランダムに待機
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def _rewind(value):
+    """再送信のためにファイルオブジェクトを先頭に戻す"""
+    if hasattr(value, 'seek'):
+        value.seek(0)
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            _rewind(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _rewind(item)
+
+def post_with_retry(provider, url, timeout=None, max_retries=None, **kwargs):
+    """
+    共有セッションでPOSTリクエストを送信し、一時的なエラーは再試行する
+    
+    接続エラー、タイムアウト、RETRY_STATUS_CODES のレスポンスを再試行の対象とし、
+    Retry-Afterヘッダーがあればその秒数だけ待機する。
+    
+    Args:
+        provider (str): プロバイダー名
+        url (str): リクエスト先のURL
+        timeout (tuple): (接続タイムアウト, 読み取りタイムアウト)（秒）
+        max_retries (int): 最大再試行回数
+        **kwargs: requests.Session.post に渡す引数
+        
+    Returns:
+        requests.Response: 最後に受信したレスポンス
+    """
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    if max_retries is None:
+        max_retries = MAX_RETRIES
+    
+    session = get_session(provider)
+    
+    for attempt in range(max_retries + 1):
+        _rewind(kwargs.get('data'))
+        _rewind(kwargs.get('files'))
+        
+        try:
+            response = session.post(url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= max_retries:
+                raise
+            wait = compute_backoff(attempt)
+            print(f"{provider}: 通信エラーのため{wait:.1f}秒後に再試行します ({attempt + 1}/{max_retries}): {str(e)}")
+            time.sleep(wait)
+            continue
+        
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= max_retries:
+            return response
+        
+        wait = compute_backoff(attempt, parse_retry_after(response.headers.get('Retry-After')))
+        print(f"{provider}: ステータス{response.status_code}のため{wait:.1f}秒後に再試行します ({attempt + 1}/{max_retries})")
+        response.close()
+        time.sleep(wait)
@@ -0,0 +1,200 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# バックグラウンドで同時に実行するジョブの数
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+
+# 完了したジョブの情報を保持する時間（秒）
+JOB_RETENTION = int(os.environ.get("JOB_RETENTION", "3600"))
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# イベントが追加されたことを待機中のストリームに通知する
+_jobs_changed = threading.Condition(_jobs_lock)
+
+# イベント待機中に送るキープアライブの間隔（秒）
+EVENT_KEEPALIVE_INTERVAL = 15
+
+# LLMのトークンをまとめて1つのイベントにする文字数と間隔（秒）
+# （トークン毎にイベントを保持すると、長い出力のジョブでメモリを大量に使用するため）
+TOKEN_EVENT_CHARS = int(os.environ.get("JOB_TOKEN_EVENT_CHARS", "200"))
+TOKEN_EVENT_INTERVAL = float(os.environ.get("JOB_TOKEN_EVENT_INTERVAL", "0.25"))
+
+def submit_job(kind, target):
+    """
+    処理をバックグラウンドジョブとして登録する
+    
+    target は進捗報告用の関数 progress(stage, done, total) と、途中経過の
+    イベント送信用の関数 emit(event) を引数に取り、JSONに変換可能な結果を
+    返す関数とする。進捗・途中経過・完了はイベントとして記録され、
+    iter_job_events で順に取り出せる。
+    
+    Args:
+        kind (str): ジョブの種類（'transcribe'、'summarize' など）
+        target (callable): 実行する処理
+        
+    Returns:
+        str: ジョブID
+    """
+    job_id = uuid.uuid4().hex
+    job = {
+        'id': job_id,
+        'kind': kind,
+        'status': 'queued',
+        'stage': None,
+        'stages': {},
+        'result': None,
+        'error': None,
+        'created_at': time.time(),
+        'started_at': None,
+        'finished_at': None,
+        'events': [],
+        'pending_tokens': [],
+        'pending_since': None,
+    }
+    
+    with _jobs_lock:
+        _remove_expired_jobs()
+        _jobs[job_id] = job
+    
+    _executor.submit(_run_job, job_id, target)
+    return job_id
+
+def _run_job(job_id, target):
+    """ジョブを実行し、状態と結果を記録する"""
+    _update_job(job_id, status='running', started_at=time.time())
+    
+    def progress(stage, done, total):
+        with _jobs_lock:
+            job = _jobs.get(job_id)
+            if job is not None:
+                job['stage'] = stage
+                job['stages'][stage] = {'done': done, 'total': total}
+        publish_event(job_id, {'type': 'progress', 'stage': stage, 'done': done, 'total': total})
+    
+    def emit(event):
+        publish_event(job_id, event)
+    
+    try:
+        result = target(progress, emit)
+        _update_job(job_id, status='completed', result=result, finished_at=time.time())
+        publish_event(job_id, {'type': 'done', 'result': result})
+    except Exception as e:
+        print(f"ジョブ {job_id} でエラーが発生しました: {str(e)}")
+        traceback.print_exc()
+        _update_job(job_id, status='failed', error=str(e), finished_at=time.time())
+        publish_event(job_id, {'type': 'error', 'error': str(e)})
+
+def _update_job(job_id, **fields):
+    """ジョブの状態を更新する"""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+def publish_event(job_id, event):
+    """
+    ジョブにイベントを追加し、待機中のストリームに通知する
+    
+    'token' イベントはTOKEN_EVENT_CHARS文字またはTOKEN_EVENT_INTERVAL秒分を
+    1つのイベントにまとめて追加する（他のイベントの前には必ず追加する）。
+    
+    Args:
+        job_id (str): ジョブID
+        event (dict): イベント（'type' を含むJSONに変換可能な辞書）
+    """
+    with _jobs_changed:
+        job = _jobs.get(job_id)
+        if job is None:
+            return
+        
+        if event['type'] == 'token':
+            if not job['pending_tokens']:
+                job['pending_since'] = time.time()
+            job['pending_tokens'].append(event['text'])
+            if (sum(len(text) for text in job['pending_tokens']) < TOKEN_EVENT_CHARS
+                    and time.time() - job['pending_since'] < TOKEN_EVENT_INTERVAL):
+                return
+            _flush_tokens(job)
+        else:
+            _flush_tokens(job)
+            job['events'].append(event)
+        _jobs_changed.notify_all()
+
+def _flush_tokens(job):
+    """まとめているトークンを1つの 'token' イベントとして追加する（_jobs_lock を取得した状態で呼ぶ）"""
+    if job['pending_tokens']:
+        job['events'].append({'type': 'token', 'text': ''.join(job['pending_tokens'])})
+        job['pending_tokens'] = []
+        job['pending_since'] = None
+
+def iter_job_events(job_id, last_event_id=-1):
+    """
+    ジョブのイベントを発生順に取り出す（完了またはエラーのイベントで終了）
+    
+    新しいイベントがない間は一定間隔でNoneを返すため、呼び出し側は
+    キープアライブの送信に利用できる。
+    
+    Args:
+        job_id (str): ジョブID
+        last_event_id (int): 受信済みの最後のイベント番号（再接続時に指定）
+        
+    Yields:
+        tuple: (イベント番号, イベント)、または待機中の場合はNone
+    """
+    next_id = last_event_id + 1
+    while True:
+        with _jobs_changed:
+            job = _jobs.get(job_id)
+            if job is None:
+                return
+            if next_id >= len(job['events']):
+                _jobs_changed.wait(timeout=EVENT_KEEPALIVE_INTERVAL)
+            events = job['events'][next_id:]
+        
+        if not events:
+            yield None
+            continue
+        
+        for event in events:
+            yield next_id, event
+            next_id += 1
+            if event['type'] in ('done', 'error'):
+                return
+
+def _remove_expired_jobs():
+    """保持期間を過ぎた完了済みジョブを削除する（_jobs_lock を取得した状態で呼ぶ）"""
+    now = time.time()
+    expired = [
+        job_id for job_id, job in _jobs.items()
+        if job['finished_at'] is not None and now - job['finished_at'] > JOB_RETENTION
+    ]
+    for job_id in expired:
+        del _jobs[job_id]
+
+def get_job(job_id):
+    """
+    ジョブの状態を取得する
+    
+    Args:
+        job_id (str): ジョブID
+        
+    Returns:
+        dict: ジョブの状態のコピー（存在しない場合はNone）
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = {
+            key: value for key, value in job.items()
+            if key not in ('events', 'pending_tokens', 'pending_since')
+        }
+        snapshot['stages'] = {stage: dict(value) for stage, value in job['stages'].items()}
+        return snapshot
@@ -1,5 +1,11 @@
 import os
+import re
+import json
+import hashlib
 import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import tiktoken
 import requests
 from openai import AzureOpenAI
@@ -11,30 +17,326 @@ from langchain_openai import AzureChatOpenAI
 from langchain_groq import ChatGroq
 # PromptTemplateのインポートを追加
 from langchain_core.prompts import PromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.output_parsers import StrOutputParser
 
-# 最大トークン数
+from modules.result_cache import make_cache_key, get_cached_result, store_cached_result
+
+# 最大トークン数（API・モデルが指定されない場合のチャンクサイズ）
 MAX_TOKENS = 4000
 
-def split_text(text):
+# API・モデル毎のコンテキスト長と最大出力トークン数
+CONTEXT_BUDGETS = {
+    'azure': {'default': {'context': 128000, 'output': 4096}},
+    'groq': {
+        'llama3': {'context': 128000, 'output': 8192},
+        'gemma2': {'context': 8192, 'output': 1024},
+    },
+}
+
+# プロンプト本文（指示文など）用に確保するトークン数
+PROMPT_RESERVE_TOKENS = 500
+
+# 1チャンクの上限トークン数（レート制限や要約の質を考慮して環境変数で調整可能）
+MAX_CHUNK_TOKENS = int(os.environ.get("LLM_MAX_CHUNK_TOKENS", "12000"))
+
+# チャンク間で重複させるトークン数
+CHUNK_OVERLAP_TOKENS = 200
+
+# tiktokenと異なるトークナイザーのモデル（Groq）のトークン数の誤差を見込む係数
+TOKENIZER_SAFETY_MARGIN = 0.8
+
+# tiktokenのエンコーディングを取得できない場合に1トークンとみなすUTF-8のバイト数
+# （英語は約4バイト、日本語は1文字3バイトで1〜2トークンのため、多めに数える値とする）
+FALLBACK_BYTES_PER_TOKEN = 2
+
+# 日本語の文の区切りを優先して分割する
+TEXT_SEPARATORS = ["\n\n", "\n", "。", "！", "？", "、", " ", ""]
+
+# 隣接する部分の要約を統合する（階層的なRefine処理）プロンプト
+PAIR_REFINE_TEMPLATE = """次の要約は会議の前半部分の要約です:
+        {existing_answer}
+        
+        次の文章はその続きの部分です:
+        {text}
+        
+        前半部分の要約に続きの部分の内容を加え、全体の流れが分かる簡潔で情報量の多い要約を日本語で作成してください。
+        """
+
+# 質疑応答のプロンプト
+QA_TEMPLATE = """以下のコンテキストを使用して、質問に回答してください。
+        
+        コンテキスト:
+        {context}
+        
+        質問:
+        {question}
+        
+        回答: 
+        """
+
+# 英語のテキストを日本語に翻訳するプロンプト
+TRANSLATE_TEMPLATE = """
+        以下の英語のテキストを自然で読みやすい日本語に翻訳してください。
+        内容を損なわず、日本語として自然な表現を使ってください。
+        
+        テキスト:
+        {text}
+        
+        日本語訳:
+        """
+
+# 日本語の文字（ひらがな、カタカナ、漢字）
+JAPANESE_CHAR_PATTERN = re.compile(r'[ぁ-んァ-ヶ一-龯]')
+
+# 文字（記号・数字・空白を除く）のうち日本語の文字がこの割合を超えれば日本語と判定する
+JAPANESE_RATIO_THRESHOLD = 0.2
+
+# 翻訳時に分割して並列に処理する1チャンクのトークン数
+TRANSLATION_CHUNK_TOKENS = int(os.environ.get("TRANSLATION_CHUNK_TOKENS", "1500"))
+
+# 同じコンテキストを使う複数の質問にまとめて回答するプロンプト
+BATCH_QA_TEMPLATE = """以下のコンテキストを使用して、番号付きの各質問に回答してください。
+        
+        コンテキスト:
+        {context}
+        
+        質問:
+        {questions}
+        
+        回答は質問と同じ順序・同じ数で、次のJSON形式のみを出力してください。
+        {{"answers": ["1番目の質問への回答", "2番目の質問への回答"]}}
+        """
+
+# 1回のプロンプトにまとめる質問の上限
+QA_BATCH_MAX_QUESTIONS = int(os.environ.get("QA_BATCH_MAX_QUESTIONS", "5"))
+
+# 要約のMap処理・段階的なReduce処理で同時に実行するLLM呼び出しの数
+MAP_CONCURRENCY = int(os.environ.get("LLM_MAP_CONCURRENCY", "4"))
+
+# 要約（Map処理）のプロンプト
+MAP_TEMPLATE = """次の文書を要約してください:
+        {text}
+        
+        簡潔で情報量の多い要約を日本語で作成してください。
+        """
+
+# 要約の結合（Reduce処理）のプロンプト
+COMBINE_TEMPLATE = """次の要約をより簡潔にまとめてください:
+        {text}
+        
+        全体の内容を網羅した簡潔で情報量の多い要約を日本語で作成してください。
+        """
+
+# LLMのtemperature
+LLM_TEMPERATURE = 0.5
+
+# プロバイダー・モデル・設定毎に共有するLLMクライアント（接続プールも共有される）
+_llm_clients = {}
+_llm_client_stats = {'created': 0, 'reused': 0, 'rebuilt': 0}
+_llm_clients_lock = threading.Lock()
+
+class LLMProgressHandler(BaseCallbackHandler):
+    """LLM呼び出しの完了数を進捗として報告するコールバック"""
+    
+    def __init__(self, progress_callback, stage, total):
+        self.progress_callback = progress_callback
+        self.stage = stage
+        self.total = total
+        self.done = 0
+        self._lock = threading.Lock()
+    
+    def on_llm_end(self, response, **kwargs):
+        with self._lock:
+            self.done += 1
+            done = min(self.done, self.total)
+        self.progress_callback(self.stage, done, self.total)
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """LLMが生成したトークンを逐次通知するコールバック"""
+    
+    def __init__(self, on_token):
+        self.on_token = on_token
+    
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        # 新しいLLM呼び出しの開始を通知（表示中の途中出力を切り替えるため）
+        self.on_token(None)
+    
+    def on_llm_new_token(self, token, **kwargs):
+        if token:
+            self.on_token(token)
+
+@lru_cache(maxsize=None)
+def get_encoding_name(api_choice=None):
+    """
+    トークン数の計算に使用するtiktokenのエンコーディング名を取得する
+    
+    Args:
+        api_choice (str): 使用するAPI ('azure' または 'groq')
+        
+    Returns:
+        str: エンコーディング名（取得できない場合はNone）
+    """
+    # gpt-4o系はo200k_base（古いtiktokenにはないためcl100k_baseで代用）
+    names = ["cl100k_base"]
+    if api_choice and api_choice.lower() == 'azure':
+        names.insert(0, "o200k_base")
+    
+    # エンコーディングは初回にダウンロードされるため、オフラインやプロキシの環境では取得できない
+    for name in names:
+        try:
+            tiktoken.get_encoding(name)
+            return name
+        except (ValueError, OSError) as e:
+            print(f"tiktokenのエンコーディング {name} を取得できません: {str(e)}")
+    
+    print("警告: トークン数をUTF-8のバイト数から概算します")
+    return None
+
+def count_tokens(text, api_choice=None):
+    """
+    テキストのトークン数を数える
+    
+    Args:
+        text (str): 対象のテキスト
+        api_choice (str): 使用するAPI ('azure' または 'groq')
+        
+    Returns:
+        int: トークン数
+    """
+    encoding_name = get_encoding_name(api_choice)
+    if encoding_name is None:
+        return -(-len(text.encode('utf-8')) // FALLBACK_BYTES_PER_TOKEN)
+    return len(tiktoken.get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+def get_context_budget(api_choice=None, model_type='llama3'):
+    """
+    API・モデルのコンテキスト長と最大出力トークン数を取得する
+    
+    Args:
+        api_choice (str): 使用するAPI ('azure' または 'groq')
+        model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        
+    Returns:
+        dict: 'context'（コンテキスト長）と 'output'（最大出力トークン数）
+    """
+    budgets = CONTEXT_BUDGETS.get((api_choice or '').lower(), {})
+    return budgets.get(model_type) or budgets.get('default') or {'context': 8192, 'output': 1024}
+
+def get_chunk_token_budget(api_choice=None, model_type='llama3', prompt_tokens=PROMPT_RESERVE_TOKENS,
+                           output_tokens=None):
+    """
+    1チャンクに使用できるトークン数を計算する
+    
+    コンテキスト長から、プロンプト本文と出力用のトークン数を差し引いた値とする。
+    
+    Args:
+        api_choice (str): 使用するAPI ('azure' または 'groq'、省略時はMAX_TOKENS)
+        model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        prompt_tokens (int): プロンプト本文に確保するトークン数
+        output_tokens (int): 出力に確保するトークン数（省略時はモデルの最大出力）
+        
+    Returns:
+        int: 1チャンクのトークン数
+    """
+    if not api_choice:
+        return MAX_TOKENS
+    
+    budget = get_context_budget(api_choice, model_type)
+    if output_tokens is None:
+        output_tokens = budget['output']
+    
+    available = budget['context'] - prompt_tokens - output_tokens
+    if api_choice.lower() != 'azure':
+        available = int(available * TOKENIZER_SAFETY_MARGIN)
+    
+    return max(CHUNK_OVERLAP_TOKENS * 2, min(available, MAX_CHUNK_TOKENS))
+
+def split_text(text, api_choice=None, model_type='llama3', chunk_tokens=None, chunk_overlap=None):
     """
     テキストを処理可能なチャンクに分割する
     
+    チャンクの大きさは文字数ではなくtiktokenで数えたトークン数で決める
+    （エンコーディングを取得できない場合はバイト数から概算したトークン数）。
+    
     Args:
         text (str): 分割するテキスト
+        api_choice (str): 使用するAPI ('azure' または 'groq'、省略時はMAX_TOKENS単位)
+        model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        chunk_tokens (int): 1チャンクのトークン数（省略時はモデルのコンテキスト長から計算）
+        chunk_overlap (int): チャンク間で重複させるトークン数（省略時はCHUNK_OVERLAP_TOKENS）
         
     Returns:
         list: 分割されたテキストのリスト
     """
-    # テキストの長さに基づいてチャンクサイズを調整
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=MAX_TOKENS,
-        chunk_overlap=200,
-    )
+    if chunk_tokens is None:
+        chunk_tokens = get_chunk_token_budget(api_choice, model_type)
+    if chunk_overlap is None:
+        chunk_overlap = min(CHUNK_OVERLAP_TOKENS, chunk_tokens // 4)
+    
+    # トークン数に基づいてチャンクサイズを調整
+    encoding_name = get_encoding_name(api_choice)
+    if encoding_name is None:
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_tokens,
+            chunk_overlap=chunk_overlap,
+            length_function=lambda piece: count_tokens(piece, api_choice),
+            separators=TEXT_SEPARATORS,
+        )
+    else:
+        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name=encoding_name,
+            chunk_size=chunk_tokens,
+            chunk_overlap=chunk_overlap,
+            separators=TEXT_SEPARATORS,
+        )
     
     return text_splitter.split_text(text)
 
-def get_azure_llm():
-    """Azure OpenAIのLLMを取得"""
+def _get_or_create_llm(key, credentials, factory):
+    """
+    登録済みのLLMクライアントを取得する（未登録または認証情報が変わった場合は作成）
+    
+    Args:
+        key (tuple): (プロバイダー, モデル, temperature, ストリーミング有無)
+        credentials (tuple): 認証情報（APIキー・エンドポイントなど）
+        factory (callable): クライアントを作成する関数
+        
+    Returns:
+        BaseChatModel: LLM
+    """
+    fingerprint = hashlib.sha256(repr(credentials).encode('utf-8')).hexdigest()
+    
+    with _llm_clients_lock:
+        entry = _llm_clients.get(key)
+        if entry is not None and entry['fingerprint'] == fingerprint:
+            _llm_client_stats['reused'] += 1
+            return entry['client']
+        
+        # クライアントの作成中に同じキーで重複して作成しないようロックを保持する
+        client = factory()
+        _llm_clients[key] = {'client': client, 'fingerprint': fingerprint}
+        if entry is None:
+            _llm_client_stats['created'] += 1
+        else:
+            print(f"認証情報が変更されたため、LLMクライアントを作成し直します: {key[0]}/{key[1]}")
+            _llm_client_stats['rebuilt'] += 1
+        return client
+
+def get_llm_client_stats():
+    """
+    LLMクライアントの再利用に関する統計情報を取得する
+    
+    Returns:
+        dict: 保持しているクライアント数、作成数、再利用数、再作成数
+    """
+    with _llm_clients_lock:
+        stats = dict(_llm_client_stats)
+        stats['clients'] = len(_llm_clients)
+    return stats
+
+def get_azure_llm(streaming=False):
+    """Azure OpenAIのLLMを取得（同じ設定のクライアントは再利用）"""
     api_key = os.environ.get("AZURE_OPENAI_KEY")
     api_endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
     api_version = os.environ.get("AZURE_OPENAI_API_VERSION", "2023-05-15")  # デフォルトバージョンを設定
@@ -45,17 +347,25 @@ def get_azure_llm():
     # デプロイメント名のチェック
     deployment_name = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")  # デフォルト名
     
-    print(f"Azure OpenAI設定: エンドポイント={api_endpoint}, バージョン={api_version}, デプロイメント={deployment_name}")
+    def create():
+        print(f"Azure OpenAI設定: エンドポイント={api_endpoint}, バージョン={api_version}, デプロイメント={deployment_name}")
+        return AzureChatOpenAI(
+            openai_api_key=api_key,
+            azure_endpoint=api_endpoint,
+            azure_deployment=deployment_name,
+            api_version=api_version,  # API バージョンを追加
+            temperature=LLM_TEMPERATURE,
+            streaming=streaming
+        )
     
-    return AzureChatOpenAI(
-        openai_api_key=api_key,
-        azure_endpoint=api_endpoint,
-        azure_deployment=deployment_name,
-        api_version=api_version,  # API バージョンを追加
-        temperature=0.5
+    return _get_or_create_llm(
+        ('azure', deployment_name, LLM_TEMPERATURE, streaming),
+        (api_key, api_endpoint, api_version),
+        create
     )
-def get_groq_llm(model_type):
-    """Groq APIのLLMを取得"""
+
+def get_groq_llm(model_type, streaming=False):
+    """Groq APIのLLMを取得（同じ設定のクライアントは再利用）"""
     api_key = os.environ.get("GROQ_API_KEY")
     
     if not api_key:
@@ -69,107 +379,183 @@ def get_groq_llm(model_type):
     else:
         model_name = "llama-3.3-70b-versatile"  # デフォルト
     
-    return ChatGroq(
-        api_key=api_key,
-        model_name=model_name,
-        temperature=0.5
+    def create():
+        return ChatGroq(
+            api_key=api_key,
+            model_name=model_name,
+            temperature=LLM_TEMPERATURE,
+            streaming=streaming
+        )
+    
+    return _get_or_create_llm(
+        ('groq', model_name, LLM_TEMPERATURE, streaming),
+        (api_key,),
+        create
     )
-def summarize_text(text, api_choice='azure', method='refine', model_type='llama3'):
+
+def select_llm(api_choice, model_type='llama3', streaming=False):
     """
-    テキストを要約する
+    選択されたAPIのLLMを取得する（初期化に失敗した場合はもう一方のAPIを使用）
     
     Args:
-        text (str): 要約するテキスト
         api_choice (str): 使用するAPI ('azure' または 'groq')
-        method (str): 要約方法 ('map_reduce' または 'refine')
         model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        streaming (bool): トークンを逐次生成するかどうか
         
     Returns:
-        str: 要約テキスト
+        BaseChatModel: LLM
     """
+    llm = None
     try:
-        # テキストを分割
-        docs = split_text(text)
-        
-        # ドキュメント形式に変換
-        from langchain_core.documents import Document
-        docs = [Document(page_content=t) for t in docs]
-        
-        # プロンプトテンプレート
-        map_template = """次の文書を要約してください:
-        {text}
-        
-        簡潔で情報量の多い要約を日本語で作成してください。
-        """
+        if api_choice.lower() == 'azure':
+            print("Azure OpenAI APIを使用します")
+            llm = get_azure_llm(streaming=streaming)
+        elif api_choice.lower() == 'groq':
+            print(f"Groq APIを使用します (モデル: {model_type})")
+            llm = get_groq_llm(model_type, streaming=streaming)
+        else:
+            raise ValueError(f"不明なAPI選択: {api_choice}")
+    except Exception as llm_error:
+        print(f"選択されたAPI ({api_choice}) の初期化に失敗しました: {str(llm_error)}")
+        print("代替APIを試行します...")
         
-        map_prompt = PromptTemplate.from_template(map_template)
+        # フォールバックオプション
+        if llm is None:
+            # もう一方のAPIを試す
+            try:
+                if api_choice.lower() == 'azure':
+                    print("フォールバック: Groq APIを使用します")
+                    llm = get_groq_llm('llama3', streaming=streaming)
+                else:
+                    print("フォールバック: Azure OpenAI APIを使用します")
+                    llm = get_azure_llm(streaming=streaming)
+            except Exception as fallback_error:
+                print(f"フォールバックAPIの初期化にも失敗しました: {str(fallback_error)}")
         
-        combine_template = """次の要約をより簡潔にまとめてください:
-        {text}
+        if llm is None:
+            raise Exception("利用可能なLLMがありません。APIキーの設定を確認してください。")
+    
+    return llm
+
+def get_llm_identity(llm):
+    """
+    実際に使用するLLMのプロバイダーとモデルを取得する（キャッシュキーに使用）
+    
+    api_choice・model_typeだけではAzureのデプロイメントや、初期化に失敗して
+    もう一方のAPIを使用した場合を区別できないため、LLMの設定から取得する。
+    
+    Args:
+        llm (BaseChatModel): select_llm などで取得したLLM
         
-        全体の内容を網羅した簡潔で情報量の多い要約を日本語で作成してください。
-        """
+    Returns:
+        list: [プロバイダー, エンドポイント, モデル名またはデプロイメント名]
+    """
+    if isinstance(llm, AzureChatOpenAI):
+        return ['azure', llm.azure_endpoint, llm.deployment_name]
+    if isinstance(llm, ChatGroq):
+        return ['groq', None, llm.model_name]
+    return [type(llm).__name__, None, getattr(llm, 'model_name', None)]
+
+def summarize_text(text, api_choice='azure', method='refine', model_type='llama3', progress_callback=None,
+                   on_token=None, use_cache=True, force_japanese=True):
+    """
+    テキストを要約する
+    
+    Args:
+        text (str): 要約するテキスト
+        api_choice (str): 使用するAPI ('azure' または 'groq')
+        method (str): 要約方法 ('refine'、'tree_refine' または 'map_reduce')
+        model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        on_token (callable): 生成されたトークンを受け取る関数（LLM呼び出しの開始時はNone）
+        use_cache (bool): 同じ入力・設定の要約結果のキャッシュを使用するかどうか
+        force_japanese (bool): 日本語以外で出力された要約を日本語に翻訳するかどうか
         
-        combine_prompt = PromptTemplate.from_template(combine_template)
+    Returns:
+        str: 要約テキスト
+    """
+    try:
+        # LLMを選択（トークンを逐次通知する場合はストリーミングを有効化）
+        llm = select_llm(api_choice, model_type, streaming=on_token is not None)
         
-        # LLMを選択
-        llm = None
-        try:
-            if api_choice.lower() == 'azure':
-                print("Azure OpenAI APIを使用します")
-                llm = get_azure_llm()
-            elif api_choice.lower() == 'groq':
-                print(f"Groq APIを使用します (モデル: {model_type})")
-                llm = get_groq_llm(model_type)
-            else:
-                raise ValueError(f"不明なAPI選択: {api_choice}")
-        except Exception as llm_error:
-            print(f"選択されたAPI ({api_choice}) の初期化に失敗しました: {str(llm_error)}")
-            print("代替APIを試行します...")
-            
-            # フォールバックオプション
-            if llm is None:
-                # もう一方のAPIを試す
-                try:
-                    if api_choice.lower() == 'azure':
-                        print("フォールバック: Groq APIを使用します")
-                        llm = get_groq_llm('llama3')
-                    else:
-                        print("フォールバック: Azure OpenAI APIを使用します")
-                        llm = get_azure_llm()
-                except Exception as fallback_error:
-                    print(f"フォールバックAPIの初期化にも失敗しました: {str(fallback_error)}")
-            
-            if llm is None:
-                raise Exception("利用可能なLLMがありません。APIキーの設定を確認してください。")
+        # キャッシュキーには実際に使用するモデルを含める（フォールバック時の結果を区別する）
+        cache_key = make_cache_key(
+            'summarize',
+            text=text,
+            method=method,
+            api_choice=api_choice,
+            model_type=model_type,
+            llm=get_llm_identity(llm),
+            force_japanese=force_japanese,
+            prompts=[MAP_TEMPLATE, COMBINE_TEMPLATE, PAIR_REFINE_TEMPLATE]
+        )
+        if use_cache:
+            cached = get_cached_result(cache_key)
+            if cached is not None:
+                print("キャッシュ済みの要約を使用します")
+                return cached
         
-        # 要約チェーンを作成
         print(f"要約方法: {method}")
         if method == 'map_reduce':
-            chain = load_summarize_chain(
+            summary = map_reduce_summarize(
+                text,
                 llm,
-                chain_type="map_reduce",
-                map_prompt=map_prompt,
-                combine_prompt=combine_prompt,
-                verbose=True
+                api_choice=api_choice,
+                model_type=model_type,
+                progress_callback=progress_callback,
+                on_token=on_token
+            )
+        elif method == 'tree_refine':
+            summary = tree_refine_summarize(
+                text,
+                llm,
+                api_choice=api_choice,
+                model_type=model_type,
+                progress_callback=progress_callback,
+                on_token=on_token
             )
         else:  # refine
+            # テキストを分割（既存の要約もプロンプトに含まれるため、その分を確保）
+            prompt_tokens = PROMPT_RESERVE_TOKENS + get_context_budget(api_choice, model_type)['output']
+            docs = split_text(
+                text,
+                api_choice,
+                model_type,
+                chunk_tokens=get_chunk_token_budget(api_choice, model_type, prompt_tokens=prompt_tokens)
+            )
+            
+            # ドキュメント形式に変換
+            from langchain_core.documents import Document
+            docs = [Document(page_content=t) for t in docs]
+            
             chain = load_summarize_chain(
                 llm,
                 chain_type="refine",
                 verbose=True
             )
-        
-        # 要約を実行
-        print("要約チェーンを実行します...")
-        result = chain.invoke(docs)
+            
+            # 要約を実行
+            print("要約チェーンを実行します...")
+            config = {'callbacks': []}
+            if progress_callback:
+                progress_callback('summarize', 0, len(docs))
+                config['callbacks'].append(LLMProgressHandler(progress_callback, 'summarize', len(docs)))
+            if on_token:
+                config['callbacks'].append(TokenStreamHandler(on_token))
+            result = chain.invoke(docs, config=config)
+            summary = result['output_text']
         print("要約が完了しました")
         
-        summary = result['output_text']
-        
-        # 英語で出力された場合は日本語に翻訳
-        summary = translate_to_japanese(summary, api_choice)
+        # 日本語以外で出力された場合は日本語に翻訳
+        translated = True
+        if force_japanese and not is_japanese(summary):
+            summary, translated = try_translate_to_japanese(
+                summary, api_choice, progress_callback=progress_callback, use_cache=use_cache
+            )
         
+        # 翻訳に失敗した要約は保存しない（次回は翻訳からやり直す）
+        if translated:
+            store_cached_result(cache_key, 'summarize', summary)
         return summary
     
     except Exception as e:
@@ -178,72 +564,266 @@ def summarize_text(text, api_choice='azure', method='refine', model_type='llama3
         traceback.print_exc()
         raise Exception(f"要約処理中にエラーが発生しました: {str(e)}")
 
-def question_answering(text, question, api_choice='azure', model_type='llama3'):
+def map_reduce_summarize(text, llm, api_choice=None, model_type='llama3', progress_callback=None, on_token=None,
+                         max_concurrency=None):
+    """
+    テキストを分割して並列に要約し（Map処理）、部分要約を階層的に結合する（Reduce処理）
+    
+    Args:
+        text (str): 要約するテキスト
+        llm (BaseChatModel): 使用するLLM
+        api_choice (str): 使用するAPI（チャンクサイズの計算に使用）
+        model_type (str): Groq使用時のモデルタイプ（チャンクサイズの計算に使用）
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        on_token (callable): 最後の結合で生成されたトークンを受け取る関数（LLM呼び出しの開始時はNone）
+        max_concurrency (int): 同時に実行するLLM呼び出しの数（省略時はMAP_CONCURRENCY）
+        
+    Returns:
+        str: 要約テキスト
+    """
+    pieces = split_text(text, api_choice, model_type)
+    
+    config = None
+    if progress_callback:
+        progress_callback('summarize', 0, len(pieces))
+        config = {'callbacks': [LLMProgressHandler(progress_callback, 'summarize', len(pieces))]}
+    print(f"Map処理: {len(pieces)}チャンクを要約します")
+    summaries = map_summarize(pieces, llm, config=config, max_concurrency=max_concurrency)
+    
+    if progress_callback:
+        progress_callback('reduce', 0, 1)
+    summary = reduce_summaries(
+        summaries,
+        llm,
+        api_choice=api_choice,
+        model_type=model_type,
+        on_token=on_token,
+        max_concurrency=max_concurrency
+    )
+    if progress_callback:
+        progress_callback('reduce', 1, 1)
+    
+    return summary
+
+def tree_refine_summarize(text, llm, api_choice=None, model_type='llama3', progress_callback=None, on_token=None,
+                          max_concurrency=None):
+    """
+    隣接する部分を2つずつ並列に統合して要約する（階層的なRefine処理）
+    
+    1段目では奇数番目のチャンクを要約し、その要約を続く偶数番目のチャンクの本文で
+    改善する。以降は隣接する要約同士を同じプロンプトで統合していく。前の部分の
+    要約に後の部分を加えるというRefineの流れを保ったまま、逐次実行する
+    LLM呼び出しの段数がチャンク数Nに対してO(log N)になる。
+    
+    Args:
+        text (str): 要約するテキスト
+        llm (BaseChatModel): 使用するLLM
+        api_choice (str): 使用するAPI（チャンクサイズの計算に使用）
+        model_type (str): Groq使用時のモデルタイプ（チャンクサイズの計算に使用）
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        on_token (callable): 最後の統合で生成されたトークンを受け取る関数（LLM呼び出しの開始時はNone）
+        max_concurrency (int): 同時に実行するLLM呼び出しの数（省略時はMAP_CONCURRENCY）
+        
+    Returns:
+        str: 要約テキスト
+    """
+    # 既存の要約もプロンプトに含まれるため、その分を確保して分割
+    prompt_tokens = PROMPT_RESERVE_TOKENS + get_context_budget(api_choice, model_type)['output']
+    pieces = split_text(
+        text,
+        api_choice,
+        model_type,
+        chunk_tokens=get_chunk_token_budget(api_choice, model_type, prompt_tokens=prompt_tokens)
+    )
+    
+    # 空白のみのテキストはチャンクがなく、統合する組が減らないため要約しない
+    if not pieces:
+        print("要約するテキストがありません")
+        return ""
+    
+    map_chain = PromptTemplate.from_template(MAP_TEMPLATE) | llm | StrOutputParser()
+    refine_chain = PromptTemplate.from_template(PAIR_REFINE_TEMPLATE) | llm | StrOutputParser()
+    
+    # LLM呼び出しの総数: 1段目の要約 ceil(N/2) 回＋統合 N-1 回
+    total_calls = len(pieces) + (len(pieces) + 1) // 2 - 1
+    callbacks = []
+    if progress_callback:
+        progress_callback('summarize', 0, total_calls)
+        callbacks.append(LLMProgressHandler(progress_callback, 'summarize', total_calls))
+    config = {'callbacks': callbacks, 'max_concurrency': max_concurrency or MAP_CONCURRENCY}
+    
+    # 最後のLLM呼び出しのみトークンを逐次通知する
+    final_config = {'callbacks': callbacks + ([TokenStreamHandler(on_token)] if on_token else [])}
+    
+    print(f"階層的Refine処理: {len(pieces)}チャンクを要約します")
+    if len(pieces) == 1:
+        return map_chain.invoke({'text': pieces[0]}, config=final_config)
+    
+    # 1段目: 奇数番目のチャンクを要約し、続くチャンクの本文で改善する
+    summaries = map_chain.batch([{'text': piece} for piece in pieces[0::2]], config=config)
+    pairs = [(summary, pieces[i * 2 + 1] if i * 2 + 1 < len(pieces) else None) for i, summary in enumerate(summaries)]
+    
+    level = 1
+    while True:
+        print(f"階層的Refine処理 {level}段目: {len(pairs)}組を統合します")
+        inputs = [{'existing_answer': left, 'text': right} for left, right in pairs if right is not None]
+        if len(pairs) == 1:
+            return refine_chain.invoke(inputs[0], config=final_config)
+        
+        # 相手のない末尾の要約はそのまま次の段に送る
+        merged = iter(refine_chain.batch(inputs, config=config))
+        summaries = [next(merged) if right is not None else left for left, right in pairs]
+        pairs = [(summaries[i], summaries[i + 1] if i + 1 < len(summaries) else None) for i in range(0, len(summaries), 2)]
+        level += 1
+
+def map_summarize(text, llm, config=None, api_choice=None, model_type='llama3', max_concurrency=None):
+    """
+    テキストを分割し、各部分を並列に要約する（Map処理）
+    
+    Args:
+        text (str or list): 要約するテキスト（分割済みのリストも可）
+        llm (BaseChatModel): 使用するLLM
+        config (dict): チェーン実行時の設定（コールバック等）
+        api_choice (str): 使用するAPI（チャンクサイズの計算に使用）
+        model_type (str): Groq使用時のモデルタイプ（チャンクサイズの計算に使用）
+        max_concurrency (int): 同時に実行するLLM呼び出しの数（省略時はMAP_CONCURRENCY）
+        
+    Returns:
+        list: 部分要約のリスト（元の順序）
+    """
+    chain = PromptTemplate.from_template(MAP_TEMPLATE) | llm | StrOutputParser()
+    pieces = split_text(text, api_choice, model_type) if isinstance(text, str) else text
+    
+    config = dict(config or {})
+    config['max_concurrency'] = max_concurrency or MAP_CONCURRENCY
+    return chain.batch([{'text': piece} for piece in pieces], config=config)
+
+def group_summaries(summaries, token_budget, api_choice=None):
+    """
+    部分要約を順序を保ったまま、1回の結合で扱えるトークン数ごとにまとめる
+    
+    Args:
+        summaries (list): 部分要約のリスト（元の順序）
+        token_budget (int): 1回の結合に入力できるトークン数
+        api_choice (str): 使用するAPI（トークン数の計算に使用）
+        
+    Returns:
+        list: 部分要約のグループのリスト
+    """
+    groups = []
+    current = []
+    current_tokens = 0
+    for summary in summaries:
+        # 区切りの改行の分も数える
+        tokens = count_tokens(summary, api_choice) + 1
+        if current and current_tokens + tokens > token_budget:
+            groups.append(current)
+            current = []
+            current_tokens = 0
+        current.append(summary)
+        current_tokens += tokens
+    
+    if current:
+        groups.append(current)
+    return groups
+
+def reduce_summaries(summaries, llm, api_choice=None, model_type='llama3', on_token=None, max_concurrency=None):
+    """
+    部分要約を1つの要約にまとめる（Reduce処理）
+    
+    部分要約の合計がコンテキストに収まらない場合は、収まる単位のグループ毎に
+    並列に結合し、1回で結合できる量になるまで段階的に繰り返す。
+    
+    Args:
+        summaries (list): 部分要約のリスト（元の順序）
+        llm (BaseChatModel): 使用するLLM
+        api_choice (str): 使用するAPI（トークン数の計算に使用）
+        model_type (str): Groq使用時のモデルタイプ（トークン数の計算に使用）
+        on_token (callable): 最後の結合で生成されたトークンを受け取る関数（LLM呼び出しの開始時はNone）
+        max_concurrency (int): 同時に実行するLLM呼び出しの数（省略時はMAP_CONCURRENCY）
+        
+    Returns:
+        str: 要約テキスト
+    """
+    chain = PromptTemplate.from_template(COMBINE_TEMPLATE) | llm | StrOutputParser()
+    token_budget = get_chunk_token_budget(api_choice, model_type)
+    config = {'max_concurrency': max_concurrency or MAP_CONCURRENCY}
+    
+    level = 0
+    while True:
+        groups = group_summaries(summaries, token_budget, api_choice)
+        if len(groups) <= 1:
+            break
+        
+        # 1件ずつしか収まらない場合も件数が必ず減るように2件ずつ結合する
+        if len(groups) == len(summaries):
+            groups = [summaries[i:i + 2] for i in range(0, len(summaries), 2)]
+        
+        level += 1
+        print(f"Reduce処理 {level}段目: {len(summaries)}件の要約を{len(groups)}件に結合します")
+        merged = iter(chain.batch(
+            [{'text': "\n\n".join(group)} for group in groups if len(group) > 1],
+            config=config
+        ))
+        summaries = [next(merged) if len(group) > 1 else group[0] for group in groups]
+    
+    # 最後の結合のみトークンを逐次通知する
+    config = {'callbacks': [TokenStreamHandler(on_token)]} if on_token else None
+    return chain.invoke({'text': "\n\n".join(summaries)}, config=config)
+
+def question_answering(text, question, api_choice='azure', model_type='llama3', on_token=None, use_cache=True,
+                       force_japanese=True):
     """
     テキストに基づいて質問に回答する
     
+    文脈テキスト全体ではなく、BM25索引で検索した関連チャンクのみをLLMに渡す。
+    
     Args:
         text (str): 文脈テキスト
         question (str): 質問テキスト
         api_choice (str): 使用するAPI ('azure' または 'groq')
         model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        on_token (callable): 生成されたトークンを受け取る関数（LLM呼び出しの開始時はNone）
+        use_cache (bool): 同じ入力・設定の回答のキャッシュを使用するかどうか
+        force_japanese (bool): 日本語以外で出力された回答を日本語に翻訳するかどうか
         
     Returns:
         str: 回答テキスト
     """
     try:
-        # テキストを分割
-        docs = split_text(text)
+        from modules.retrieval import retrieve_context, RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_TOP_K
+        
+        # LLMを選択（トークンを逐次通知する場合はストリーミングを有効化）
+        llm = select_llm(api_choice, model_type, streaming=on_token is not None)
+        
+        cache_key = make_cache_key(
+            'qa',
+            text=text,
+            question=question,
+            api_choice=api_choice,
+            model_type=model_type,
+            llm=get_llm_identity(llm),
+            force_japanese=force_japanese,
+            prompt=QA_TEMPLATE,
+            retrieval=[RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_TOP_K]
+        )
+        if use_cache:
+            cached = get_cached_result(cache_key)
+            if cached is not None:
+                print("キャッシュ済みの回答を使用します")
+                return cached
+        
+        # 質問に関連するチャンクのみを検索（文字起こし毎の索引は再利用される）
+        docs = retrieve_context(text, question)
+        print(f"質問に関連する{len(docs)}チャンクを使用します")
         
         # ドキュメント形式に変換
         from langchain_core.documents import Document
         docs = [Document(page_content=t) for t in docs]
         
-        # LLMを選択
-        llm = None
-        try:
-            if api_choice.lower() == 'azure':
-                print("Azure OpenAI APIを使用します")
-                llm = get_azure_llm()
-            elif api_choice.lower() == 'groq':
-                print(f"Groq APIを使用します (モデル: {model_type})")
-                llm = get_groq_llm(model_type)
-            else:
-                raise ValueError(f"不明なAPI選択: {api_choice}")
-        except Exception as llm_error:
-            print(f"選択されたAPI ({api_choice}) の初期化に失敗しました: {str(llm_error)}")
-            print("代替APIを試行します...")
-            
-            # フォールバックオプション
-            if llm is None:
-                # もう一方のAPIを試す
-                try:
-                    if api_choice.lower() == 'azure':
-                        print("フォールバック: Groq APIを使用します")
-                        llm = get_groq_llm('llama3')
-                    else:
-                        print("フォールバック: Azure OpenAI APIを使用します")
-                        llm = get_azure_llm()
-                except Exception as fallback_error:
-                    print(f"フォールバックAPIの初期化にも失敗しました: {str(fallback_error)}")
-            
-            if llm is None:
-                raise Exception("利用可能なLLMがありません。APIキーの設定を確認してください。")
-        
         # QAチェーンを作成
-        prompt_template = """以下のコンテキストを使用して、質問に回答してください。
-        
-        コンテキスト:
-        {context}
-        
-        質問:
-        {question}
-        
-        回答: 
-        """
-        
         prompt = PromptTemplate(
-            template=prompt_template,
+            template=QA_TEMPLATE,
             input_variables=["context", "question"]
         )
         
@@ -255,17 +835,23 @@ def question_answering(text, question, api_choice='azure', model_type='llama3'):
         
         # 回答を取得
         print("質疑応答チェーンを実行します...")
+        config = {'callbacks': [TokenStreamHandler(on_token)]} if on_token else {}
         result = chain.invoke({
             "input_documents": docs,
             "question": question
-        })
+        }, config=config)
         print("質疑応答が完了しました")
         
         answer = result['output_text']
         
-        # 英語で出力された場合は日本語に翻訳
-        answer = translate_to_japanese(answer, api_choice)
+        # 日本語以外で出力された場合は日本語に翻訳
+        translated = True
+        if force_japanese and not is_japanese(answer):
+            answer, translated = try_translate_to_japanese(answer, api_choice, use_cache=use_cache)
         
+        # 翻訳に失敗した回答は保存しない（次回は翻訳からやり直す）
+        if translated:
+            store_cached_result(cache_key, 'qa', answer)
         return answer
     
     except Exception as e:
@@ -274,83 +860,267 @@ def question_answering(text, question, api_choice='azure', model_type='llama3'):
         traceback.print_exc()
         raise Exception(f"質疑応答処理中にエラーが発生しました: {str(e)}")
 
-def translate_to_japanese(text, api_choice='azure'):
+def batch_question_answering(text, questions, api_choice='azure', model_type='llama3', progress_callback=None,
+                             max_concurrency=None, use_cache=True, force_japanese=True):
     """
-    英語のテキストを日本語に翻訳する
+    テキストに基づいて複数の質問にまとめて回答する
+    
+    LLMの準備と検索用の索引の作成は全ての質問で共有する。検索結果のチャンクが
+    同じ質問は1つのプロンプトにまとめて回答させ、プロンプト同士は並列に実行する。
     
     Args:
-        text (str): 翻訳するテキスト
+        text (str): 文脈テキスト
+        questions (list): 質問テキストのリスト
         api_choice (str): 使用するAPI ('azure' または 'groq')
+        model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        max_concurrency (int): 同時に実行するLLM呼び出しの数（省略時はMAP_CONCURRENCY）
+        use_cache (bool): 同じ入力・設定の回答のキャッシュを使用するかどうか
+        force_japanese (bool): 日本語以外で出力された回答を日本語に翻訳するかどうか
         
     Returns:
-        str: 翻訳されたテキスト
+        list: 'question' と 'answer' を持つ辞書のリスト（質問と同じ順序）
     """
-    # 既に日本語の場合はそのまま返す
-    import re
-    # 日本語文字が含まれているかチェック（ひらがな、カタカナ、漢字）
-    if re.search(r'[ぁ-んァ-ヶ一-龯]', text):
-        # 日本語の文字が20%以上含まれていれば日本語と判断
-        japanese_chars = len(re.findall(r'[ぁ-んァ-ヶ一-龯]', text))
-        if japanese_chars / len(text) > 0.2:
-            print("テキストは既に日本語です")
-            return text
-    
     try:
-        print("英語から日本語への翻訳を開始します...")
+        from modules.retrieval import get_transcript_index, select_chunk_ids, RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_TOP_K
+        llm = select_llm(api_choice, model_type)
+        cache_key = make_cache_key(
+            'qa_batch',
+            text=text,
+            questions=list(questions),
+            api_choice=api_choice,
+            model_type=model_type,
+            llm=get_llm_identity(llm),
+            force_japanese=force_japanese,
+            prompts=[QA_TEMPLATE, BATCH_QA_TEMPLATE],
+            retrieval=[RETRIEVAL_CHUNK_TOKENS, RETRIEVAL_TOP_K, QA_BATCH_MAX_QUESTIONS]
+        )
+        if use_cache:
+            cached = get_cached_result(cache_key)
+            if cached is not None:
+                print("キャッシュ済みの回答を使用します")
+                return cached
         
-        # LLMを選択
-        llm = None
-        try:
-            if api_choice.lower() == 'azure':
-                print("Azure OpenAI APIを使用します")
-                llm = get_azure_llm()
-            else:
-                print("Groq APIを使用します")
-                llm = get_groq_llm('llama3')
-        except Exception as llm_error:
-            print(f"選択されたAPI ({api_choice}) の初期化に失敗しました: {str(llm_error)}")
-            print("代替APIを試行します...")
+        index = get_transcript_index(text)
+        single_chain = PromptTemplate.from_template(QA_TEMPLATE) | llm | StrOutputParser()
+        batch_chain = PromptTemplate.from_template(BATCH_QA_TEMPLATE) | llm | StrOutputParser()
+        
+        # 同じチャンクを参照する質問をまとめる
+        groups = {}
+        for i, question in enumerate(questions):
+            groups.setdefault(tuple(select_chunk_ids(index, question)), []).append(i)
+        tasks = [
+            (chunk_ids, members[start:start + QA_BATCH_MAX_QUESTIONS])
+            for chunk_ids, members in groups.items()
+            for start in range(0, len(members), QA_BATCH_MAX_QUESTIONS)
+        ]
+        print(f"{len(questions)}件の質問を{len(tasks)}回のプロンプトで回答します")
+        
+        answers = [None] * len(questions)
+        state = {'done': 0, 'untranslated': 0}
+        lock = threading.Lock()
+        if progress_callback:
+            progress_callback('answer', 0, len(questions))
+        
+        def answer_group(task):
+            chunk_ids, members = task
+            context = "\n\n".join(index.chunks[i] for i in chunk_ids)
             
-            # フォールバックオプション
-            if api_choice.lower() == 'azure':
-                print("フォールバック: Groq APIを使用します")
-                llm = get_groq_llm('llama3')
-            else:
-                print("フォールバック: Azure OpenAI APIを使用します")
-                llm = get_azure_llm()
-        
-        # 翻訳プロンプトの作成
-        from langchain_core.prompts import PromptTemplate
-        translate_template = """
-        以下の英語のテキストを自然で読みやすい日本語に翻訳してください。
-        内容を損なわず、日本語として自然な表現を使ってください。
+            results = None
+            if len(members) > 1:
+                numbered = "\n".join(f"{n}. {questions[i]}" for n, i in enumerate(members, 1))
+                raw = batch_chain.invoke({'context': context, 'questions': numbered})
+                results = parse_batch_answers(raw, len(members))
+                if results is None:
+                    print("まとめた回答を解釈できなかったため、質問毎に回答します")
+            if results is None:
+                results = single_chain.batch([{'context': context, 'question': questions[i]} for i in members])
+            
+            for i, answer in zip(members, results):
+                # 日本語以外で出力された場合は日本語に翻訳
+                answer = answer.strip()
+                if force_japanese and not is_japanese(answer):
+                    answer, translated = try_translate_to_japanese(answer, api_choice, use_cache=use_cache)
+                    if not translated:
+                        with lock:
+                            state['untranslated'] += 1
+                answers[i] = answer
+            
+            with lock:
+                state['done'] += len(members)
+                done = state['done']
+            if progress_callback:
+                progress_callback('answer', done, len(questions))
         
-        テキスト:
-        {text}
+        with ThreadPoolExecutor(max_workers=max_concurrency or MAP_CONCURRENCY) as executor:
+            list(executor.map(answer_group, tasks))
+        print("質疑応答が完了しました")
         
-        日本語訳:
-        """
+        qa_data = [{'question': question, 'answer': answer} for question, answer in zip(questions, answers)]
         
-        translate_prompt = PromptTemplate.from_template(translate_template)
+        # 翻訳に失敗した回答を含む場合は保存しない（次回は翻訳からやり直す）
+        if not state['untranslated']:
+            store_cached_result(cache_key, 'qa_batch', qa_data)
+        return qa_data
+    
+    except Exception as e:
+        import traceback
+        print("質疑応答処理中にエラーが発生しました:")
+        traceback.print_exc()
+        raise Exception(f"質疑応答処理中にエラーが発生しました: {str(e)}")
+
+def parse_json_object(raw):
+    """
+    LLMの出力からJSONオブジェクトを取り出す（前後の説明文やコードブロックは無視する）
+    
+    Args:
+        raw (str): LLMの出力
         
-        # 翻訳を実行
-        from langchain_core.output_parsers import StrOutputParser
-        from langchain.chains import LLMChain
+    Returns:
+        dict: JSONオブジェクト（取り出せない場合はNone）
+    """
+    start = raw.find('{')
+    end = raw.rfind('}')
+    if start < 0 or end < start:
+        return None
+    
+    try:
+        value = json.loads(raw[start:end + 1])
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+def parse_batch_answers(raw, count):
+    """
+    まとめて回答させたLLMの出力から回答のリストを取り出す
+    
+    Args:
+        raw (str): LLMの出力
+        count (int): 質問の数
         
-        chain = LLMChain(
-            llm=llm,
-            prompt=translate_prompt,
-            output_parser=StrOutputParser()
+    Returns:
+        list: 回答のリスト（形式や数が合わない場合はNone）
+    """
+    answers = (parse_json_object(raw) or {}).get('answers')
+    if not isinstance(answers, list) or len(answers) != count:
+        return None
+    return [str(answer) for answer in answers]
+
+def detect_language(text):
+    """
+    テキストが日本語かどうかをローカルで判定する
+    
+    文字種を数えるだけの処理のため、結果は保持せずに毎回判定する。
+    
+    Args:
+        text (str): 判定するテキスト
+        
+    Returns:
+        str: 'ja'（日本語）、'en'（英字が中心）、'other'（その他の言語）、'none'（文字を含まない）
+    """
+    letters = 0
+    ascii_letters = 0
+    for char in text:
+        if char.isalpha():
+            letters += 1
+            if char.isascii():
+                ascii_letters += 1
+    if letters == 0:
+        return 'none'
+    
+    japanese_chars = len(JAPANESE_CHAR_PATTERN.findall(text))
+    if japanese_chars / letters > JAPANESE_RATIO_THRESHOLD:
+        return 'ja'
+    
+    return 'en' if ascii_letters / letters > 0.5 else 'other'
+
+def is_japanese(text):
+    """
+    テキストが日本語（または翻訳の必要がないテキスト）かどうかを判定する
+    
+    Args:
+        text (str): 判定するテキスト
+        
+    Returns:
+        bool: 翻訳の必要がない場合はTrue
+    """
+    return not text or detect_language(text) in ('ja', 'none')
+
+def translate_to_japanese(text, api_choice='azure', progress_callback=None, use_cache=True):
+    """
+    英語のテキストを日本語に翻訳する
+    
+    長いテキストは段落・文の区切りで分割し、並列に翻訳して元の順序で結合する。
+    
+    Args:
+        text (str): 翻訳するテキスト
+        api_choice (str): 使用するAPI ('azure' または 'groq')
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        use_cache (bool): 同じテキスト・設定の翻訳結果のキャッシュを使用するかどうか
+        
+    Returns:
+        str: 翻訳されたテキスト（翻訳に失敗した場合は元のテキスト）
+    """
+    translated_text, _ = try_translate_to_japanese(text, api_choice, progress_callback, use_cache)
+    return translated_text
+
+def try_translate_to_japanese(text, api_choice='azure', progress_callback=None, use_cache=True):
+    """
+    英語のテキストを日本語に翻訳し、翻訳できたかどうかも返す
+    
+    翻訳に失敗した場合は元のテキストを返すため、呼び出し元は結果をキャッシュに
+    保存するかどうかの判断に2つ目の戻り値を使用する。
+    
+    Args:
+        text (str): 翻訳するテキスト
+        api_choice (str): 使用するAPI ('azure' または 'groq')
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        use_cache (bool): 同じテキスト・設定の翻訳結果のキャッシュを使用するかどうか
+        
+    Returns:
+        tuple: (翻訳されたテキスト, 翻訳できたか翻訳の必要がない場合はTrue)
+    """
+    # 既に日本語の場合はそのまま返す
+    if is_japanese(text):
+        print("テキストは既に日本語です")
+        return text, True
+    
+    try:
+        # LLMを選択（初期化に失敗した場合はもう一方のAPIを使用）
+        llm = select_llm(api_choice, 'llama3')
+        
+        cache_key = make_cache_key(
+            'translate', text=text, api_choice=api_choice, llm=get_llm_identity(llm), prompt=TRANSLATE_TEMPLATE
         )
+        if use_cache:
+            cached = get_cached_result(cache_key)
+            if cached is not None:
+                print("キャッシュ済みの翻訳を使用します")
+                return cached, True
+        
+        print("英語から日本語への翻訳を開始します...")
+        chain = PromptTemplate.from_template(TRANSLATE_TEMPLATE) | llm | StrOutputParser()
         
-        translated_text = chain.run(text=text)
+        # 重複なしで分割（重複させると訳文が重複するため）
+        pieces = split_text(text, api_choice, chunk_tokens=TRANSLATION_CHUNK_TOKENS, chunk_overlap=0)
+        config = {'max_concurrency': MAP_CONCURRENCY}
+        if progress_callback:
+            progress_callback('translate', 0, len(pieces))
+            config['callbacks'] = [LLMProgressHandler(progress_callback, 'translate', len(pieces))]
+        
+        if len(pieces) > 1:
+            print(f"{len(pieces)}チャンクに分割して並列に翻訳します")
+        translated_text = "\n".join(
+            translated.strip() for translated in chain.batch([{'text': piece} for piece in pieces], config=config)
+        )
         print("翻訳が完了しました")
         
-        return translated_text
+        store_cached_result(cache_key, 'translate', translated_text)
+        return translated_text, True
     
     except Exception as e:
         import traceback
         print("翻訳処理中にエラーが発生しました:")
         traceback.print_exc()
         print(f"翻訳に失敗しました。元のテキストを返します: {str(e)}")
-        return text  # エラーの場合は元のテキストを返す
+        return text, False  # エラーの場合は元のテキストを返す
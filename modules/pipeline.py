@@ -0,0 +1,94 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.transcription import transcribe_audio
+from modules.llm_processing import (
+    select_llm, map_summarize, reduce_summaries, translate_to_japanese
+)
+
+# 文字起こしと並行して実行する要約（Map処理）の並列数
+PIPELINE_MAP_WORKERS = int(os.environ.get("PIPELINE_MAP_WORKERS", "4"))
+
+def run_meeting_pipeline(audio_path, transcription_api='deepgram', api_choice='azure', model_type='llama3',
+                         use_cache=True, force_japanese=True, progress_callback=None, on_chunk=None, on_token=None):
+    """
+    文字起こしと要約をパイプラインで実行する
+    
+    文字起こしが完了したチャンクから順に要約（Map処理）を開始し、
+    最後のチャンクの要約が揃った時点で結合（Reduce処理）を行う。
+    部分要約がコンテキストに収まらない場合は段階的に結合する。
+    文字起こしと要約が重なって実行されるため、逐次実行より早く完了する。
+    
+    Args:
+        audio_path (str): 音声ファイルのパス
+        transcription_api (str): 文字起こしに使用するAPI ('deepgram' または 'groq')
+        api_choice (str): 要約に使用するAPI ('azure' または 'groq')
+        model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        use_cache (bool): 文字起こし・翻訳のキャッシュを使用するかどうか
+        force_japanese (bool): 英語で出力された要約を日本語に翻訳するかどうか
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        on_chunk (callable): チャンクの文字起こしが完了する度に呼ばれる関数 (index, total, text)
+        on_token (callable): 結合時に生成されたトークンを受け取る関数（LLM呼び出しの開始時はNone）
+        
+    Returns:
+        dict: 'transcription'（文字起こし全文）と 'summary'（要約）
+    """
+    llm = select_llm(api_choice, model_type, streaming=on_token is not None)
+    
+    map_futures = {}
+    map_state = {'done': 0, 'total': 0}
+    map_lock = threading.Lock()
+    
+    def report_map_progress(future):
+        with map_lock:
+            map_state['done'] += 1
+            done, total = map_state['done'], map_state['total']
+        if progress_callback:
+            progress_callback('summarize', done, total)
+    
+    with ThreadPoolExecutor(max_workers=PIPELINE_MAP_WORKERS) as executor:
+        def handle_chunk(index, total, text):
+            if on_chunk:
+                on_chunk(index, total, text)
+            
+            # 文字起こしが完了したチャンクをすぐに要約する
+            with map_lock:
+                map_state['total'] = total
+            if text.strip():
+                future = executor.submit(map_summarize, text, llm, api_choice=api_choice, model_type=model_type)
+                future.add_done_callback(report_map_progress)
+            else:
+                future = None
+                report_map_progress(None)
+            map_futures[index] = future
+        
+        transcription = transcribe_audio(
+            audio_path,
+            api_choice=transcription_api,
+            use_cache=use_cache,
+            progress_callback=progress_callback,
+            on_chunk=handle_chunk
+        )
+        
+        # チャンクの順序で部分要約を集める
+        partial_summaries = []
+        for index in sorted(map_futures):
+            if map_futures[index] is not None:
+                partial_summaries.extend(map_futures[index].result())
+    
+    if not partial_summaries:
+        raise Exception("要約する文字起こしテキストがありません")
+    
+    # 部分要約を結合
+    if progress_callback:
+        progress_callback('reduce', 0, 1)
+    summary = reduce_summaries(partial_summaries, llm, api_choice=api_choice, model_type=model_type, on_token=on_token)
+    if progress_callback:
+        progress_callback('reduce', 1, 1)
+    
+    # 日本語以外で出力された場合は日本語に翻訳
+    if force_japanese:
+        summary = translate_to_japanese(summary, api_choice, progress_callback=progress_callback, use_cache=use_cache)
+    
+    return {'transcription': transcription, 'summary': summary}
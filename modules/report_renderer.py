@@ -0,0 +1,166 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# レポートの出力先（レポート毎にサブディレクトリを作成する）
+REPORT_OUTPUT_DIR = 'static/uploads/reports'
+
+# レポートの作成（docxの組み立て・保存）を並列に実行するプロセス数（0の場合はリクエストのスレッドで実行）
+REPORT_RENDER_WORKERS = int(os.environ.get("REPORT_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# 作成したレポートを保持する時間（秒）
+REPORT_RETENTION = int(os.environ.get("REPORT_RETENTION", str(24 * 60 * 60)))
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# new_report_id で作成したレポートIDの形式
+_REPORT_ID_PATTERN = re.compile(r'[0-9a-f]{32}')
+
+_executor = None
+_render_stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'inline': 0, 'restarts': 0}
+_render_lock = threading.Lock()
+
+def new_report_id():
+    """
+    レポートIDを作成する
+    
+    Returns:
+        str: 他のレポートと重複しないID
+    """
+    return uuid.uuid4().hex
+
+def is_valid_report_id(report_id):
+    """
+    レポートIDの形式が正しいかどうかを判定する（リクエストで指定されたIDの検証に使用）
+    
+    Args:
+        report_id (str): レポートID
+        
+    Returns:
+        bool: new_report_id で作成した形式のIDであればTrue
+    """
+    return isinstance(report_id, str) and _REPORT_ID_PATTERN.fullmatch(report_id) is not None
+
+def make_report_path(report_id, filename):
+    """
+    レポートの出力先を作成する
+    
+    出力先はレポートID毎のディレクトリのため、同時に作成された
+    レポートが互いに上書きすることはない。
+    
+    Args:
+        report_id (str): レポートID
+        filename (str): ファイル名
+        
+    Returns:
+        tuple: (相対パス, 絶対パス)
+        
+    Raises:
+        ValueError: 出力先がレポートの出力先のディレクトリの外になる場合
+    """
+    # 相対パスはダウンロードのURLに使用するため、区切り文字を / にする
+    relative_path = f'{REPORT_OUTPUT_DIR}/{report_id}/{filename}'
+    abs_path = os.path.join(_BASE_DIR, *relative_path.split('/'))
+    
+    # レポートID・ファイル名に含まれる .. や区切り文字で出力先の外に書き込まない
+    report_root = os.path.realpath(os.path.join(_BASE_DIR, *REPORT_OUTPUT_DIR.split('/')))
+    report_dir = os.path.dirname(os.path.realpath(abs_path))
+    if os.path.dirname(report_dir) != report_root or os.path.basename(report_dir) != report_id:
+        raise ValueError(f"不正なレポートの出力先です: {relative_path}")
+    
+    _remove_expired_reports()
+    
+    os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+    return relative_path, abs_path
+
+def _remove_expired_reports():
+    """保持期間を過ぎたレポートのディレクトリを削除する"""
+    report_root = os.path.join(_BASE_DIR, *REPORT_OUTPUT_DIR.split('/'))
+    if REPORT_RETENTION <= 0 or not os.path.isdir(report_root):
+        return
+    
+    now = time.time()
+    for name in os.listdir(report_root):
+        path = os.path.join(report_root, name)
+        try:
+            if os.path.isdir(path) and now - os.path.getmtime(path) > REPORT_RETENTION:
+                shutil.rmtree(path)
+                print(f"保持期間を過ぎたレポートを削除しました: {path}")
+        except OSError as e:
+            print(f"レポートの削除中にエラーが発生しました: {str(e)}")
+
+def _get_executor():
+    """レポート作成用のプロセスプールを取得する（_render_lock を取得した状態で呼ぶ）"""
+    global _executor
+    if _executor is None:
+        # スレッドを使用するWebサーバーからforkしないよう、新しいプロセスを起動する
+        _executor = ProcessPoolExecutor(
+            max_workers=REPORT_RENDER_WORKERS,
+            mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+def render_report(render, *args, **kwargs):
+    """
+    レポートの作成処理をプロセスプールで実行し、完了を待つ
+    
+    docxの組み立て・保存はCPUを使用する処理のため、Webサーバーのスレッドではなく
+    別のプロセスで実行し、同時に作成されるレポートを複数のコアに分散する。
+    プロセスプールが使用できない場合は呼び出し元のスレッドで実行する。
+    
+    Args:
+        render (callable): モジュールの最上位に定義された作成処理（別のプロセスから呼び出せるもの）
+        *args: 作成処理の引数（pickle可能なもの）
+        **kwargs: 作成処理のキーワード引数
+        
+    Returns:
+        object: 作成処理の戻り値
+    """
+    global _executor
+    if REPORT_RENDER_WORKERS <= 0:
+        with _render_lock:
+            _render_stats['inline'] += 1
+        return render(*args, **kwargs)
+    
+    with _render_lock:
+        executor = _get_executor()
+        _render_stats['submitted'] += 1
+    
+    try:
+        result = executor.submit(render, *args, **kwargs).result()
+    except BrokenProcessPool as e:
+        # ワーカーが異常終了した場合はプールを作り直し、今回はこのスレッドで作成する
+        print(f"レポート作成用のプロセスが異常終了したため、プロセスプールを再作成します: {str(e)}")
+        with _render_lock:
+            if _executor is executor:
+                _executor = None
+            _render_stats['restarts'] += 1
+            _render_stats['inline'] += 1
+        executor.shutdown(wait=False)
+        return render(*args, **kwargs)
+    except Exception:
+        with _render_lock:
+            _render_stats['failed'] += 1
+        raise
+    
+    with _render_lock:
+        _render_stats['completed'] += 1
+    return result
+
+def get_report_render_stats():
+    """
+    レポート作成の統計情報を取得する
+    
+    Returns:
+        dict: プロセスプールでの実行数、完了数、失敗数、スレッドでの実行数、プールの再作成数
+    """
+    with _render_lock:
+        stats = dict(_render_stats)
+        stats['workers'] = REPORT_RENDER_WORKERS
+    return stats
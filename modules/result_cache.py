@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+
+# LLMの処理結果キャッシュの保存先
+LLM_CACHE_PATH = os.environ.get(
+    "LLM_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'llm_results.sqlite3')
+)
+
+# キャッシュの有効期限（秒、0以下の場合は無期限）と最大サイズ（バイト）
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", str(7 * 24 * 60 * 60)))
+LLM_CACHE_MAX_BYTES = int(os.environ.get("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# キャッシュを使用するかどうか
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "true").lower() not in ('0', 'false', 'off')
+
+_connection = None
+_cache_stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+_cache_lock = threading.Lock()
+
+def _get_connection():
+    """キャッシュのデータベースに接続する（_cache_lock を取得した状態で呼ぶ）"""
+    global _connection
+    if _connection is None:
+        cache_dir = os.path.dirname(LLM_CACHE_PATH)
+        if cache_dir and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        
+        _connection = sqlite3.connect(LLM_CACHE_PATH, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                operation TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        _connection.execute("CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at)")
+        _connection.commit()
+    return _connection
+
+def make_cache_key(operation, **params):
+    """
+    処理の種類と入力（テキスト、プロンプト、API、モデル、方法など）からキャッシュキーを作成する
+    
+    Args:
+        operation (str): 処理の種類（'summarize'、'qa' など）
+        **params: 結果に影響する入力
+        
+    Returns:
+        str: キャッシュキー（SHA-256）
+    """
+    payload = json.dumps({'operation': operation, 'params': params}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def get_cached_result(cache_key):
+    """
+    キャッシュから処理結果を取得する
+    
+    Args:
+        cache_key (str): キャッシュキー
+        
+    Returns:
+        object: キャッシュされた結果（存在しない・期限切れ・無効の場合はNone）
+    """
+    if not LLM_CACHE_ENABLED:
+        return None
+    
+    try:
+        with _cache_lock:
+            connection = _get_connection()
+            row = connection.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (cache_key,)
+            ).fetchone()
+            
+            if row is None:
+                _cache_stats['misses'] += 1
+                return None
+            
+            now = time.time()
+            if LLM_CACHE_TTL > 0 and now - row[1] > LLM_CACHE_TTL:
+                connection.execute("DELETE FROM results WHERE key = ?", (cache_key,))
+                connection.commit()
+                _cache_stats['expired'] += 1
+                _cache_stats['misses'] += 1
+                return None
+            
+            # 最終利用日時を更新（サイズ超過時に古いものから削除するため）
+            connection.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, cache_key))
+            connection.commit()
+            _cache_stats['hits'] += 1
+        
+        return json.loads(row[0])
+    except (sqlite3.Error, ValueError) as e:
+        print(f"LLM結果キャッシュの読み込みに失敗しました: {str(e)}")
+        return None
+
+def store_cached_result(cache_key, operation, value):
+    """
+    処理結果をキャッシュに保存し、上限を超えた分を古い順に削除する
+    
+    Args:
+        cache_key (str): キャッシュキー
+        operation (str): 処理の種類
+        value (object): JSONに変換可能な処理結果
+    """
+    if not LLM_CACHE_ENABLED:
+        return
+    
+    try:
+        serialized = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with _cache_lock:
+            connection = _get_connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO results (key, operation, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, operation, serialized, len(serialized.encode('utf-8')), now, now)
+            )
+            connection.commit()
+            _evict(connection)
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        print(f"LLM結果キャッシュの保存に失敗しました: {str(e)}")
+
+def _evict(connection):
+    """期限切れの結果と、合計サイズの上限を超えた分を削除する（_cache_lock を取得した状態で呼ぶ）"""
+    if LLM_CACHE_TTL > 0:
+        cursor = connection.execute("DELETE FROM results WHERE created_at < ?", (time.time() - LLM_CACHE_TTL,))
+        _cache_stats['expired'] += cursor.rowcount
+    
+    total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+    if total > LLM_CACHE_MAX_BYTES:
+        # 最終利用が古いものから上限に収まるまで削除
+        removed = []
+        for key, size in connection.execute("SELECT key, size FROM results ORDER BY accessed_at"):
+            if total <= LLM_CACHE_MAX_BYTES:
+                break
+            removed.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM results WHERE key = ?", removed)
+        _cache_stats['evictions'] += len(removed)
+    
+    connection.commit()
+
+def get_result_cache_stats():
+    """
+    LLM結果キャッシュの統計情報を取得する
+    
+    Returns:
+        dict: ヒット数、ミス数、削除数、件数、合計サイズ
+    """
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats.update({'enabled': LLM_CACHE_ENABLED, 'entries': 0, 'size_bytes': 0, 'max_bytes': LLM_CACHE_MAX_BYTES})
+        if not LLM_CACHE_ENABLED:
+            return stats
+        
+        try:
+            entries, size = _get_connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+            stats.update({'entries': entries, 'size_bytes': size})
+        except sqlite3.Error as e:
+            print(f"LLM結果キャッシュの統計情報の取得に失敗しました: {str(e)}")
+    return stats
@@ -0,0 +1,182 @@
+import os
+import re
+import math
+import hashlib
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+
+from modules.llm_processing import split_text
+
+# 検索用に文字起こしを分割する1チャンクのトークン数
+RETRIEVAL_CHUNK_TOKENS = int(os.environ.get("RETRIEVAL_CHUNK_TOKENS", "800"))
+
+# 質問毎にLLMに渡すチャンクの数
+RETRIEVAL_TOP_K = int(os.environ.get("RETRIEVAL_TOP_K", "4"))
+
+# メモリに保持する索引の数（文字起こし単位）
+RETRIEVAL_INDEX_CACHE_SIZE = int(os.environ.get("RETRIEVAL_INDEX_CACHE_SIZE", "32"))
+
+# BM25のパラメータ
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 日本語などの単語の区切りがない文字列を分割する文字n-gramの長さ
+NGRAM_SIZE = 2
+
+# 英数字の単語、それ以外の文字の連続
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+|[^\W\d_a-z]+")
+
+_indexes = OrderedDict()
+_index_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_index_lock = threading.Lock()
+
+def tokenize(text):
+    """
+    検索用にテキストを語に分割する
+    
+    英数字は単語単位、日本語などの単語の区切りがない文字列は
+    文字n-gram（NGRAM_SIZE文字）単位で分割する。
+    
+    Args:
+        text (str): 対象のテキスト
+        
+    Returns:
+        list: 語のリスト
+    """
+    text = unicodedata.normalize('NFKC', text).lower()
+    
+    terms = []
+    for run in _TOKEN_PATTERN.findall(text):
+        if run.isascii() or len(run) <= NGRAM_SIZE:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + NGRAM_SIZE] for i in range(len(run) - NGRAM_SIZE + 1))
+    return terms
+
+class BM25Index:
+    """チャンク単位のBM25索引"""
+    
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.term_freqs = [Counter(tokenize(chunk)) for chunk in chunks]
+        self.lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        
+        doc_freqs = Counter()
+        for freqs in self.term_freqs:
+            doc_freqs.update(freqs.keys())
+        count = len(chunks)
+        self.idf = {
+            term: math.log(1 + (count - freq + 0.5) / (freq + 0.5))
+            for term, freq in doc_freqs.items()
+        }
+    
+    def search(self, query, top_k=RETRIEVAL_TOP_K):
+        """
+        クエリに関連するチャンクを検索する
+        
+        Args:
+            query (str): 検索クエリ（質問）
+            top_k (int): 取得するチャンクの数
+            
+        Returns:
+            list: (チャンク番号, スコア) のリスト（スコアの高い順、一致のないチャンクは含まない）
+        """
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        
+        scores = []
+        for index, freqs in enumerate(self.term_freqs):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[index] / (self.average_length or 1))
+            score = 0.0
+            for term in terms:
+                freq = freqs.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((index, score))
+        
+        scores.sort(key=lambda item: item[1], reverse=True)
+        return scores[:top_k]
+
+def get_transcript_index(text):
+    """
+    文字起こしのBM25索引を取得する（同じ内容の文字起こしでは作成済みの索引を再利用）
+    
+    Args:
+        text (str): 文字起こしテキスト
+        
+    Returns:
+        BM25Index: 索引
+    """
+    key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    with _index_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            _index_stats['hits'] += 1
+            return index
+        _index_stats['misses'] += 1
+    
+    index = BM25Index(split_text(text, chunk_tokens=RETRIEVAL_CHUNK_TOKENS))
+    
+    with _index_lock:
+        _indexes[key] = index
+        _indexes.move_to_end(key)
+        while len(_indexes) > RETRIEVAL_INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+            _index_stats['evictions'] += 1
+    
+    return index
+
+def select_chunk_ids(index, question, top_k=RETRIEVAL_TOP_K):
+    """
+    索引から質問に関連するチャンク番号を選ぶ
+    
+    Args:
+        index (BM25Index): 文字起こしの索引
+        question (str): 質問テキスト
+        top_k (int): 取得するチャンクの数
+        
+    Returns:
+        list: チャンク番号のリスト（文字起こし内の順序）
+    """
+    if len(index.chunks) <= top_k:
+        return list(range(len(index.chunks)))
+    
+    hits = index.search(question, top_k)
+    if not hits:
+        # 一致する語がない場合は冒頭から使用する
+        print("質問に一致するチャンクが見つからないため、冒頭のチャンクを使用します")
+        return list(range(top_k))
+    
+    # 会話の流れが分かるように元の順序で渡す
+    return sorted(i for i, _ in hits)
+
+def retrieve_context(text, question, top_k=RETRIEVAL_TOP_K):
+    """
+    質問に関連する文字起こしのチャンクを取得する
+    
+    Args:
+        text (str): 文字起こしテキスト
+        question (str): 質問テキスト
+        top_k (int): 取得するチャンクの数
+        
+    Returns:
+        list: チャンクのリスト（文字起こし内の順序）
+    """
+    index = get_transcript_index(text)
+    return [index.chunks[i] for i in select_chunk_ids(index, question, top_k)]
+
+def get_retrieval_index_stats():
+    """
+    検索索引のキャッシュの統計情報を取得する
+    
+    Returns:
+        dict: ヒット数、ミス数、削除数、保持している索引の数
+    """
+    with _index_lock:
+        stats = dict(_index_stats)
+        stats.update({'entries': len(_indexes), 'max_entries': RETRIEVAL_INDEX_CACHE_SIZE})
+    return stats
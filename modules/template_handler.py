@@ -1,60 +1,268 @@
 import os
 import re
+import json
+import bisect
+import hashlib
 import tempfile
+import threading
+from collections import OrderedDict
 import docx
 from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from docx.oxml.ns import qn
+from docx.table import _Cell
 
 # 同じディレクトリにあるllm_processingモジュールをインポート
-from modules.llm_processing import get_azure_llm, get_groq_llm
+from modules.llm_processing import (
+    get_azure_llm, get_groq_llm, get_llm_identity, split_text, parse_json_object, LLMProgressHandler,
+    MAP_CONCURRENCY
+)
+from modules.result_cache import make_cache_key, get_cached_result, store_cached_result
+from modules.docx_writer import TRANSCRIPT_MARKER, save_with_transcript
+from modules.report_renderer import new_report_id, make_report_path, render_report
 
-def extract_placeholders(template_path):
+# 文字起こし（またはその一部）から情報を抽出するプロンプト
+EXTRACT_TEMPLATE = """
+文字起こしされた会議の内容から、以下の情報を抽出してください。
+抽出できない場合は「情報なし」と記入してください。
+情報は、抽出すべき項目名をキー、抽出した内容を文字列の値とするJSONオブジェクトのみで出力してください。
+
+{{"開催日時": "抽出された開催日時", "出席者": "抽出された出席者リスト"}}
+
+以下は文字起こしの内容です:
+{transcription}
+
+抽出すべき項目:
+{placeholders}
+"""
+
+# 文字起こしの部分毎の抽出結果を統合するプロンプト
+MERGE_EXTRACT_TEMPLATE = """
+以下は、1つの会議の文字起こしを複数の部分に分けて、それぞれから抽出した情報です。
+項目毎に各部分の情報を統合し、重複を除いて1つにまとめてください。
+どの部分からも抽出できなかった項目は「情報なし」と記入してください。
+情報は、抽出すべき項目名をキー、統合した内容を文字列の値とするJSONオブジェクトのみで出力してください。
+
+{{"開催日時": "統合された開催日時", "出席者": "統合された出席者リスト"}}
+
+各部分から抽出した情報:
+{findings}
+
+抽出すべき項目:
+{placeholders}
+"""
+
+# プレースホルダーのパターン - {{任意の文字}}
+PLACEHOLDER_PATTERN = re.compile(r'{{([^{}]+)}}')
+
+# メモリに保持する解析済みテンプレートの数
+TEMPLATE_CACHE_SIZE = int(os.environ.get("TEMPLATE_CACHE_SIZE", "16"))
+
+_template_cache = OrderedDict()
+_template_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_template_cache_lock = threading.Lock()
+
+# 抽出結果に含まれなかった項目を再抽出する回数
+EXTRACT_MAX_RETRIES = 2
+
+# 抽出できなかった項目の値
+MISSING_VALUE = "情報なし"
+
+# 抽出結果をキャッシュする、抽出できなかった項目の割合の上限
+# （JSONを解釈できなかった場合など、失敗に近い結果をキャッシュの有効期間中に返し続けない）
+EXTRACT_CACHE_MAX_MISSING_RATIO = 0.5
+
+def hash_template_file(template_path):
     """
-    Wordテンプレートからプレースホルダーを抽出する
+    テンプレートファイルの内容のハッシュ値を計算する
     
     Args:
         template_path (str): テンプレートファイルのパス
         
     Returns:
-        list: 抽出されたプレースホルダーのリスト
+        str: SHA-256のハッシュ値（16進数）
+    """
+    sha256 = hashlib.sha256()
+    with open(template_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def iter_template_paragraphs(doc):
+    """
+    ドキュメント本文とテーブル内のパラグラフを、位置を表すキーと共に順に取り出す
+    
+    結合されたセルは python-docx では複数のセルとして返されるため、
+    同じパラグラフは最初の位置でのみ返す。
+    
+    Args:
+        doc (Document): docxドキュメント
+        
+    Yields:
+        tuple: (位置のキー, パラグラフ)
+    """
+    for paragraph_index, paragraph in enumerate(doc.paragraphs):
+        yield ('body', paragraph_index), paragraph
+    
+    # id() ではなく要素自体を保持する（プロキシが解放されると同じidが別の要素に再利用されるため）
+    seen = set()
+    for table_index, table in enumerate(doc.tables):
+        for row_index, row in enumerate(table.rows):
+            for cell_index, cell in enumerate(row.cells):
+                for paragraph_index, paragraph in enumerate(cell.paragraphs):
+                    if paragraph._p in seen:
+                        continue
+                    seen.add(paragraph._p)
+                    yield ('table', table_index, row_index, cell_index, paragraph_index), paragraph
+
+def get_paragraph_at(doc, location):
+    """
+    位置のキーからパラグラフを取得する
+    
+    Args:
+        doc (Document): docxドキュメント
+        location (tuple): iter_template_paragraphs が返す位置のキー
+        
+    Returns:
+        Paragraph: docxパラグラフ
+    """
+    if location[0] == 'body':
+        return doc.paragraphs[location[1]]
+    _, table_index, row_index, cell_index, paragraph_index = location
+    return doc.tables[table_index].rows[row_index].cells[cell_index].paragraphs[paragraph_index]
+
+def find_placeholder_spans(run_texts):
+    """
+    ランのテキストを連結した中からプレースホルダーを探し、ランの位置に対応付ける
+    
+    Args:
+        run_texts (list): パラグラフ内の各ランのテキスト
+        
+    Returns:
+        list: 各プレースホルダーの 'name'、開始位置 'start'（ラン番号, ラン内の文字位置）、
+              終了位置 'end'（ラン番号, ラン内の文字位置（この位置の文字は含まない））の辞書のリスト
+    """
+    # 連結したテキスト上の位置からラン番号・ラン内の位置を求めるための各ランの開始位置
+    offsets = []
+    position = 0
+    for text in run_texts:
+        offsets.append(position)
+        position += len(text)
+    
+    def locate(index, is_end):
+        # 終了位置は最後の文字を含むランに対応付ける（同じ位置から始まる空のランは飛ばす）
+        run_index = bisect.bisect_right(offsets, index - 1 if is_end else index) - 1
+        return run_index, index - offsets[run_index]
+    
+    spans = []
+    for match in PLACEHOLDER_PATTERN.finditer("".join(run_texts)):
+        spans.append({
+            'name': match.group(1),
+            'start': locate(match.start(), False),
+            'end': locate(match.end(), True),
+        })
+    return spans
+
+def parse_template(template_path):
+    """
+    テンプレートを解析し、プレースホルダーとその位置の索引を作成する
+    
+    Args:
+        template_path (str): テンプレートファイルのパス
+        
+    Returns:
+        dict: 'placeholders'（重複を除いたプレースホルダーのリスト）と
+              'locations'（プレースホルダーを含むパラグラフの位置のキーとランの位置のリスト）
     """
-    # テンプレートを読み込む
     doc = docx.Document(template_path)
     
-    # プレースホルダーを保存するリスト
     placeholders = []
+    locations = []
+    for location, paragraph in iter_template_paragraphs(doc):
+        run_texts = [run.text for run in paragraph.runs]
+        spans = find_placeholder_spans(run_texts)
+        if not spans:
+            continue
+        
+        locations.append({'location': location, 'spans': spans})
+        for span in spans:
+            if span['name'] not in placeholders:
+                placeholders.append(span['name'])
+    
+    return {'placeholders': placeholders, 'locations': locations}
+
+def get_parsed_template(template_path):
+    """
+    解析済みのテンプレートを取得する（同じ内容のテンプレートは再解析しない）
+    
+    Args:
+        template_path (str): テンプレートファイルのパス
+        
+    Returns:
+        dict: parse_template の結果
+    """
+    key = hash_template_file(template_path)
     
-    # 正規表現パターン - {{任意の文字}}
-    pattern = r'{{([^{}]+)}}'
+    with _template_cache_lock:
+        parsed = _template_cache.get(key)
+        if parsed is not None:
+            _template_cache.move_to_end(key)
+            _template_cache_stats['hits'] += 1
+            return parsed
+        _template_cache_stats['misses'] += 1
     
-    # すべてのパラグラフを検索
-    for paragraph in doc.paragraphs:
-        matches = re.findall(pattern, paragraph.text)
-        placeholders.extend(matches)
+    parsed = parse_template(template_path)
     
-    # すべてのテーブルを検索
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    matches = re.findall(pattern, paragraph.text)
-                    placeholders.extend(matches)
+    with _template_cache_lock:
+        _template_cache[key] = parsed
+        _template_cache.move_to_end(key)
+        while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+            _template_cache_stats['evictions'] += 1
     
-    # 重複を除去
-    unique_placeholders = list(set(placeholders))
+    return parsed
+
+def get_template_cache_stats():
+    """
+    解析済みテンプレートのキャッシュの統計情報を取得する
     
-    return unique_placeholders
+    Returns:
+        dict: ヒット数、ミス数、削除数、保持しているテンプレートの数
+    """
+    with _template_cache_lock:
+        stats = dict(_template_cache_stats)
+        stats.update({'entries': len(_template_cache), 'max_entries': TEMPLATE_CACHE_SIZE})
+    return stats
 
-def extract_info_with_llm(transcription, placeholders, api_choice='azure', model_type='llama3'):
+def extract_placeholders(template_path):
+    """
+    Wordテンプレートからプレースホルダーを抽出する
+    
+    Args:
+        template_path (str): テンプレートファイルのパス
+        
+    Returns:
+        list: 抽出されたプレースホルダーのリスト
+    """
+    return list(get_parsed_template(template_path)['placeholders'])
+
+def extract_info_with_llm(transcription, placeholders, api_choice='azure', model_type='llama3', progress_callback=None,
+                          use_cache=True):
     """
     文字起こしテキストからプレースホルダーに対応する情報をLLMで抽出する
     
+    文字起こしがコンテキストに収まらない場合は、チャンク毎に並列に抽出し（Map処理）、
+    チャンク毎の抽出結果を1回の呼び出しで統合する（Merge処理）。
+    結果はプレースホルダーをキーとするJSONで受け取り、含まれなかった項目のみを
+    最大 EXTRACT_MAX_RETRIES 回まで再抽出する。
+    
     Args:
         transcription (str): 文字起こしテキスト
         placeholders (list): プレースホルダーのリスト
         api_choice (str): 使用するAPI ('azure' または 'groq')
         model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        use_cache (bool): 同じ入力・設定の抽出結果のキャッシュを使用するかどうか
         
     Returns:
         dict: プレースホルダーとその値のマッピング
@@ -67,56 +275,111 @@ def extract_info_with_llm(transcription, placeholders, api_choice='azure', model
     else:
         raise ValueError(f"不明なAPI選択: {api_choice}")
     
-    # プロンプトの作成
-    prompt_text = f"""
-文字起こしされた会議の内容から、以下の情報を抽出してください。
-抽出できない場合は「情報なし」と記入してください。
-情報は以下の形式で出力してください。
-
-開催日時: [抽出された開催日時]
-出席者: [抽出された出席者リスト]
-...
-
-以下は文字起こしの内容です:
-{transcription}
-
-抽出すべき情報:
-"""
-    
-    for placeholder in placeholders:
-        prompt_text += f"- {placeholder}\n"
+    # 同じ文字起こし・プレースホルダー・モデルでの抽出結果はキャッシュから返す
+    cache_key = make_cache_key(
+        'extract',
+        transcription=transcription,
+        placeholders=sorted(placeholders),
+        api_choice=api_choice,
+        model_type=model_type,
+        llm=get_llm_identity(llm),
+        prompts=[EXTRACT_TEMPLATE, MERGE_EXTRACT_TEMPLATE]
+    )
+    if use_cache:
+        cached = get_cached_result(cache_key)
+        if cached is not None:
+            print("キャッシュ済みの抽出結果を使用します")
+            return cached
     
     # LLMに質問
     from langchain_core.prompts import PromptTemplate
     from langchain_core.output_parsers import StrOutputParser
     
-    prompt = PromptTemplate.from_template(prompt_text)
-    chain = prompt | llm | StrOutputParser()
+    extract_chain = PromptTemplate.from_template(EXTRACT_TEMPLATE) | llm | StrOutputParser()
+    merge_chain = PromptTemplate.from_template(MERGE_EXTRACT_TEMPLATE) | llm | StrOutputParser()
     
-    response = chain.invoke({})
+    chunks = split_text(transcription, api_choice, model_type)
+    total_calls = len(chunks) + (1 if len(chunks) > 1 else 0)
+    config = {'max_concurrency': MAP_CONCURRENCY}
+    if progress_callback:
+        progress_callback('extract', 0, total_calls)
+        config['callbacks'] = [LLMProgressHandler(progress_callback, 'extract', total_calls)]
     
-    # 抽出された情報をパースしてディクショナリに変換
-    extracted_info = {}
+    keys = json.dumps(sorted(placeholders), ensure_ascii=False)
+    if len(chunks) == 1:
+        def extract(targets):
+            return extract_chain.invoke({'transcription': chunks[0], 'placeholders': targets}, config=config)
+    else:
+        # チャンク毎に並列に抽出し、結果を統合する
+        print(f"文字起こしを{len(chunks)}チャンクに分割して情報を抽出します")
+        findings = extract_chain.batch(
+            [{'transcription': chunk, 'placeholders': keys} for chunk in chunks],
+            config=config
+        )
+        findings = "\n\n".join(f"[部分{i}]\n{finding.strip()}" for i, finding in enumerate(findings, 1))
+        
+        def extract(targets):
+            return merge_chain.invoke({'findings': findings, 'placeholders': targets}, config=config)
+    
+    extracted_info = parse_extracted_info(extract(keys), placeholders)
+    
+    # 結果に含まれなかった項目のみを再抽出する
+    missing = [placeholder for placeholder in placeholders if placeholder not in extracted_info]
+    for attempt in range(EXTRACT_MAX_RETRIES):
+        if not missing:
+            break
+        print(f"抽出結果に含まれなかった項目を再抽出します ({attempt + 1}/{EXTRACT_MAX_RETRIES}): {missing}")
+        extracted_info.update(parse_extracted_info(extract(json.dumps(missing, ensure_ascii=False)), missing))
+        missing = [placeholder for placeholder in placeholders if placeholder not in extracted_info]
+    
+    for placeholder in missing:
+        extracted_info[placeholder] = MISSING_VALUE
+    
+    if len(missing) <= len(placeholders) * EXTRACT_CACHE_MAX_MISSING_RATIO:
+        store_cached_result(cache_key, 'extract', extracted_info)
+    else:
+        print(f"{len(placeholders)}項目中{len(missing)}項目を抽出できなかったため、抽出結果をキャッシュしません")
+    return extracted_info
+
+def parse_extracted_info(response, placeholders):
+    """
+    LLMが出力したJSONからプレースホルダー毎の値を取り出す
+    
+    Args:
+        response (str): LLMの出力（プレースホルダーをキーとするJSONオブジェクト）
+        placeholders (list): プレースホルダーのリスト
+        
+    Returns:
+        dict: プレースホルダーとその値のマッピング（値が得られなかった項目は含まない）
+    """
+    data = parse_json_object(response)
+    if data is None:
+        print("抽出結果をJSONとして解釈できませんでした")
+        return {}
     
+    extracted_info = {}
     for placeholder in placeholders:
-        # 正規表現パターン - "プレースホルダー: 任意の文字列"
-        pattern = re.compile(f"{placeholder}:\\s*(.+?)(?=\\n\\w+:|$)", re.DOTALL)
-        match = pattern.search(response)
+        value = data.get(placeholder)
+        if isinstance(value, list):
+            value = "、".join(str(item) for item in value if item not in (None, ""))
+        elif isinstance(value, dict):
+            value = json.dumps(value, ensure_ascii=False)
+        elif value is not None:
+            value = str(value)
         
-        if match:
-            # マッチした値を取得し、余分な空白を削除
-            value = match.group(1).strip()
-            extracted_info[placeholder] = value
-        else:
-            # 値が見つからない場合はデフォルト値
-            extracted_info[placeholder] = "情報なし"
+        if value and value.strip():
+            extracted_info[placeholder] = value.strip()
     
     return extracted_info
 
-def process_template(template_path, transcription=None, summary=None, qa_data=None, api_choice='azure', model_type='llama3'):
+def process_template(template_path, transcription=None, summary=None, qa_data=None, api_choice='azure', model_type='llama3',
+                     progress_callback=None, report_id=None, use_cache=True):
     """
     Wordテンプレートを処理し、抽出した情報を挿入する
     
+    情報の抽出（LLM呼び出し）は呼び出し元のスレッドで行い、文書の組み立て・保存は
+    レポート作成用のプロセスプールで行う。
+    
     Args:
         template_path (str): テンプレートファイルのパス
         transcription (str): 文字起こしテキスト
@@ -124,13 +387,17 @@ def process_template(template_path, transcription=None, summary=None, qa_data=No
         qa_data (list): 質疑応答データのリスト
         api_choice (str): 使用するAPI ('azure' または 'groq')
         model_type (str): Groq使用時のモデルタイプ ('llama3' または 'gemma2')
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        report_id (str): レポートID（出力先のディレクトリ、省略時は新しく作成）
+        use_cache (bool): 情報抽出の結果のキャッシュを使用するかどうか
         
     Returns:
-        str: 生成された文書のパス
+        str: 生成された文書の相対パス
     """
     try:
-        # テンプレートからプレースホルダーを抽出
-        placeholders = extract_placeholders(template_path)
+        # テンプレートからプレースホルダーを抽出（解析済みのテンプレートは再利用）
+        template = get_parsed_template(template_path)
+        placeholders = list(template['placeholders'])
         print(f"抽出されたプレースホルダー: {placeholders}")
         
         # 必要な情報を準備
@@ -143,107 +410,145 @@ def process_template(template_path, transcription=None, summary=None, qa_data=No
             if '要約' in placeholders:
                 placeholders.remove('要約')
         
+        # 「文字起こし全文」プレースホルダーの位置には保存時に文字起こしを直接書き込む
+        if '文字起こし全文' in placeholders and transcription:
+            replacements['文字起こし全文'] = TRANSCRIPT_MARKER
+            placeholders.remove('文字起こし全文')
+        
         # 残りのプレースホルダーに対応する情報を文字起こしから抽出
         if transcription and placeholders:
             extracted_info = extract_info_with_llm(
                 transcription, 
                 placeholders, 
                 api_choice=api_choice, 
-                model_type=model_type
+                model_type=model_type,
+                progress_callback=progress_callback,
+                use_cache=use_cache
             )
             
             # 抽出された情報をreplacementsに追加
             replacements.update(extracted_info)
         
-        # テンプレートを読み込む
-        doc = docx.Document(template_path)
-        
-        # テンプレート内のプレースホルダーを置換
-        replace_placeholders_in_document(doc, replacements)
-        
-        # 文字起こし全文を追加（特定のプレースホルダーがあれば置換、なければ末尾に追加）
-        if transcription:
-            if '文字起こし全文' in placeholders and '文字起こし全文' in replacements:
-                # すでに処理済み
-                pass
-            else:
-                # ドキュメントの末尾に追加
-                doc.add_heading('文字起こし全文', level=1)
-                doc.add_paragraph(transcription)
+        if progress_callback:
+            progress_callback('render', 0, 1)
         
-        # Q&Aデータがある場合はテーブルに追加
-        if qa_data:
-            add_qa_table(doc, qa_data)
+        # レポート毎のディレクトリに保存（同時に作成されたレポートと衝突しない）
+        relative_path, output_path = make_report_path(report_id or new_report_id(), 'meeting_minutes.docx')
+        # 解析済みの索引を渡し、ワーカーのプロセスではテンプレートを再解析しない
+        render_report(render_template_document, template_path, template, replacements, output_path, transcription, qa_data)
         
-        # 一時ファイルとして保存
-        output_dir = 'static/uploads'
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        if progress_callback:
+            progress_callback('render', 1, 1)
         
-        output_path = os.path.join(output_dir, 'meeting_minutes.docx')
-        doc.save(output_path)
-        
-        return output_path
+        return relative_path
     
     except Exception as e:
         raise Exception(f"テンプレート処理中にエラーが発生しました: {str(e)}")
 
-def replace_placeholders_in_document(doc, replacements):
+def render_template_document(template_path, template, replacements, output_path, transcription=None, qa_data=None):
+    """
+    テンプレートに置換値・文字起こし・Q&Aを挿入して保存する（レポート作成用のプロセスで実行）
+    
+    Args:
+        template_path (str): テンプレートファイルのパス
+        template (dict): 同じテンプレートを parse_template で解析した結果
+        replacements (dict): プレースホルダーと置換値のマッピング
+        output_path (str): 出力するdocxファイルのパス
+        transcription (str): 文字起こしテキスト
+        qa_data (list): 質疑応答データのリスト
+        
+    Returns:
+        str: 出力したdocxファイルのパス
+    """
+    # テンプレートを読み込む
+    doc = docx.Document(template_path)
+    
+    # テンプレート内のプレースホルダーを置換（プレースホルダーを含むパラグラフのみ）
+    replace_placeholders_in_document(doc, replacements, template=template)
+    
+    # 文字起こし全文を追加（特定のプレースホルダーがあれば置換、なければ末尾に追加）
+    if transcription:
+        if replacements.get('文字起こし全文') == TRANSCRIPT_MARKER:
+            # すでに目印に置換済み
+            pass
+        else:
+            # ドキュメントの末尾に目印を追加
+            doc.add_heading('文字起こし全文', level=1)
+            doc.add_paragraph(TRANSCRIPT_MARKER)
+    
+    # Q&Aデータがある場合はテーブルに追加
+    if qa_data:
+        add_qa_table(doc, qa_data)
+    
+    if transcription:
+        # 文字起こしはオブジェクトを作らずに分割したパラグラフとして直接書き込む
+        save_with_transcript(doc, output_path, transcription)
+    else:
+        doc.save(output_path)
+    
+    return output_path
+
+def replace_placeholders_in_document(doc, replacements, template=None):
     """
     ドキュメント内のプレースホルダーを置換する
     
     Args:
         doc (Document): docxドキュメント
         replacements (dict): プレースホルダーと置換値のマッピング
+        template (dict): 同じテンプレートを parse_template で解析した結果
+                         （指定した場合はプレースホルダーを含むパラグラフのみを処理）
     """
-    # すべてのパラグラフを処理
-    for paragraph in doc.paragraphs:
-        replace_text_in_paragraph(paragraph, replacements)
+    if template is not None:
+        for entry in template['locations']:
+            if any(span['name'] in replacements for span in entry['spans']):
+                replace_text_in_paragraph(get_paragraph_at(doc, entry['location']), replacements, entry['spans'])
+        return
     
-    # すべてのテーブルを処理
-    for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    replace_text_in_paragraph(paragraph, replacements)
+    # すべてのパラグラフ（テーブル内を含む）を処理
+    for _, paragraph in iter_template_paragraphs(doc):
+        replace_text_in_paragraph(paragraph, replacements)
 
-def replace_text_in_paragraph(paragraph, replacements):
+def replace_text_in_paragraph(paragraph, replacements, spans=None):
     """
     パラグラフ内のプレースホルダーを置換する
     
+    ランのテキストを1回だけ読み込み、複数のランにまたがるプレースホルダーも含めて
+    置換が必要なランのみを書き換える。置換後の値はプレースホルダーの先頭を含む
+    ランの書式になり、それ以外のランの書式は変わらない。
+    
     Args:
         paragraph (Paragraph): docxパラグラフ
         replacements (dict): プレースホルダーと置換値のマッピング
+        spans (list): find_placeholder_spans で求めたプレースホルダーの位置（省略時はここで求める）
     """
-    for placeholder, value in replacements.items():
-        if f"{{{{{placeholder}}}}}" in paragraph.text:
-            # テキスト置換のための準備
-            placeholder_text = f"{{{{{placeholder}}}}}"
-            text = paragraph.text
-            
-            # テキストを置換
-            new_text = text.replace(placeholder_text, value)
-            
-            # 古いランの保存
-            old_runs = [run for run in paragraph.runs]
-            
-            # パラグラフをクリア
-            for i in range(len(paragraph.runs)):
-                p = paragraph._p
-                p.remove(paragraph.runs[0]._r)
-            
-            # 新しいテキストを追加（スタイルを維持）
-            if old_runs:
-                # 最初のランのスタイルを使用
-                run = paragraph.add_run(new_text)
-                run.bold = old_runs[0].bold
-                run.italic = old_runs[0].italic
-                run.underline = old_runs[0].underline
-                run.font.name = old_runs[0].font.name
-                if old_runs[0].font.size:
-                    run.font.size = old_runs[0].font.size
-            else:
-                paragraph.add_run(new_text)
+    runs = paragraph.runs
+    texts = [run.text for run in runs]
+    if spans is None:
+        spans = find_placeholder_spans(texts)
+    
+    changed = set()
+    removed = set()
+    # 後ろから置換すると、前にあるプレースホルダーの位置は変わらない
+    for span in reversed(spans):
+        if span['name'] not in replacements:
+            continue
+        value = str(replacements[span['name']])
+        (start_run, start_offset), (end_run, end_offset) = span['start'], span['end']
+        
+        if start_run == end_run:
+            texts[start_run] = texts[start_run][:start_offset] + value + texts[start_run][end_offset:]
+        else:
+            texts[start_run] = texts[start_run][:start_offset] + value
+            texts[end_run] = texts[end_run][end_offset:]
+            changed.add(end_run)
+            # 間のランはプレースホルダーの一部のみなので削除する
+            removed.update(range(start_run + 1, end_run))
+        changed.add(start_run)
+    
+    for index in sorted(changed - removed):
+        runs[index].text = texts[index]
+    for index in removed:
+        paragraph._p.remove(runs[index]._r)
 
 def add_qa_table(doc, qa_data):
     """
@@ -256,8 +561,8 @@ def add_qa_table(doc, qa_data):
     # Q&Aセクションヘッダーを追加
     doc.add_heading("質疑応答", level=2)
     
-    # Q&Aテーブルを作成
-    table = doc.add_table(rows=1, cols=2)
+    # Q&Aテーブルを作成（ヘッダー行とすべてのデータ行をまとめて作成）
+    table = doc.add_table(rows=len(qa_data) + 1, cols=2)
     
     # テーブルスタイルの設定（エラー回避のため修正）
     try:
@@ -275,49 +580,58 @@ def add_qa_table(doc, qa_data):
                 # それでも失敗する場合はスタイル設定をスキップ
                 print("警告: テーブルスタイルの適用に失敗しました。標準スタイルを使用します。")
     
-    # テーブルボーダーを手動で設定
-    from docx.oxml import OxmlElement
-    from docx.oxml.ns import qn
-
-    def set_cell_border(cell, border_type="single", size=4):
-        """セルに境界線を追加する"""
-        tc = cell._tc
-        tcPr = tc.get_or_add_tcPr()
-        
-        # すべての方向に境界線を追加
-        for direction in ['top', 'left', 'bottom', 'right']:
-            border_element = OxmlElement('w:{}'.format(direction))
-            border_element.set(qn('w:val'), border_type)
-            border_element.set(qn('w:sz'), str(size))
-            border_element.set(qn('w:space'), '0')
-            border_element.set(qn('w:color'), 'auto')
-            tcBorders = tcPr.first_child_found_in("w:tcBorders")
-            if tcBorders is None:
-                tcBorders = OxmlElement('w:tcBorders')
-                tcPr.append(tcBorders)
-            tcBorders.append(border_element)
-
+    # テーブル全体にボーダーを設定（セル毎ではなくテーブルのプロパティに1回だけ設定）
+    set_table_borders(table)
+    
+    # ヘッダー行とデータ行のセルを行の要素から直接取得（行毎に全セルを走査しない）
+    rows = [[_Cell(tc, table) for tc in tr.tc_lst] for tr in table._tbl.tr_lst]
+    
     # ヘッダー行を設定
-    hdr_cells = table.rows[0].cells
+    hdr_cells = rows[0]
     hdr_cells[0].text = "質問"
     hdr_cells[1].text = "回答"
     
     # ヘッダー行のスタイルを設定
     for cell in hdr_cells:
-        # セルにボーダーを適用
-        set_cell_border(cell)
-        
         cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
         # 太字にする
         for run in cell.paragraphs[0].runs:
             run.bold = True
     
     # Q&Aデータを追加
-    for qa in qa_data:
-        row_cells = table.add_row().cells
+    for row_cells, qa in zip(rows[1:], qa_data):
         row_cells[0].text = qa.get('question', '')
         row_cells[1].text = qa.get('answer', '')
-        
-        # 新しい行のセルにもボーダーを適用
-        for cell in row_cells:
-            set_cell_border(cell)
+
+def set_table_borders(table, border_type="single", size=4):
+    """
+    テーブル全体（外枠と内側の罫線）に境界線を設定する
+    
+    Args:
+        table (Table): docxテーブル
+        border_type (str): 線の種類
+        size (int): 線の太さ（1/8ポイント単位）
+    """
+    from docx.oxml import OxmlElement
+    
+    tblPr = table._tbl.tblPr
+    tblBorders = tblPr.first_child_found_in("w:tblBorders")
+    if tblBorders is None:
+        tblBorders = OxmlElement('w:tblBorders')
+        # スキーマの順序に合わせて、後に続く要素の前に挿入する
+        following = tblPr.first_child_found_in("w:shd", "w:tblLayout", "w:tblCellMar", "w:tblLook")
+        if following is not None:
+            following.addprevious(tblBorders)
+        else:
+            tblPr.append(tblBorders)
+    else:
+        for child in list(tblBorders):
+            tblBorders.remove(child)
+    
+    for direction in ['top', 'left', 'bottom', 'right', 'insideH', 'insideV']:
+        border_element = OxmlElement('w:{}'.format(direction))
+        border_element.set(qn('w:val'), border_type)
+        border_element.set(qn('w:sz'), str(size))
+        border_element.set(qn('w:space'), '0')
+        border_element.set(qn('w:color'), 'auto')
+        tblBorders.append(border_element)
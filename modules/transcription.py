@@ -1,46 +1,231 @@
 import os
 import json
 import time
-import tempfile
-from pydub import AudioSegment
-import requests
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from modules.http_client import post_with_retry
+from modules.audio_processing import (
+    TARGET_CHUNK_LENGTH, UPLOAD_AUDIO_FORMAT, UPLOAD_FORMATS,
+    get_audio_duration, get_content_type, plan_segments, export_segment, merge_transcripts
+)
 
 # 音声ファイルの最大長さ（ミリ秒）- 例: 10分
-MAX_AUDIO_LENGTH = 10 * 60 * 1000
+MAX_AUDIO_LENGTH = TARGET_CHUNK_LENGTH
+
+# API毎のチャンク並列数（レート制限に合わせて環境変数で調整可能）
+MAX_WORKERS = {
+    'deepgram': int(os.environ.get("DEEPGRAM_MAX_WORKERS", "4")),
+    'groq': int(os.environ.get("GROQ_MAX_WORKERS", "2")),
+}
+
+# 文字起こしの言語とモデル
+TRANSCRIPTION_LANGUAGE = "ja"
+DEEPGRAM_MODEL = os.environ.get("DEEPGRAM_MODEL", "")
+GROQ_WHISPER_MODEL = "whisper-large-v3-turbo"
+
+# 文字起こしキャッシュの保存先と最大サイズ（バイト）
+TRANSCRIPTION_CACHE_DIR = os.environ.get(
+    "TRANSCRIPTION_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'transcriptions')
+)
+TRANSCRIPTION_CACHE_MAX_BYTES = int(os.environ.get("TRANSCRIPTION_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# キャッシュのヒット数・ミス数・削除数
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+_cache_lock = threading.Lock()
+
+def hash_audio_file(audio_path):
+    """
+    音声ファイルの内容からハッシュ値を計算する
+    
+    Args:
+        audio_path (str): 音声ファイルのパス
+        
+    Returns:
+        str: SHA-256ハッシュ値（16進数）
+    """
+    digest = hashlib.sha256()
+    with open(audio_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def get_transcription_cache_key(audio_path, api_choice='deepgram'):
+    """
+    音声の内容とAPI設定からキャッシュキーを生成する
+    
+    Args:
+        audio_path (str): 音声ファイルのパス
+        api_choice (str): 使用するAPI ('deepgram' または 'groq')
+        
+    Returns:
+        str: キャッシュキー
+    """
+    provider = api_choice.lower()
+    model = GROQ_WHISPER_MODEL if provider == 'groq' else (DEEPGRAM_MODEL or 'default')
+    
+    key_source = json.dumps({
+        'audio': hash_audio_file(audio_path),
+        'provider': provider,
+        'model': model,
+        'language': TRANSCRIPTION_LANGUAGE,
+    }, sort_keys=True)
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+def get_cached_transcription(cache_key):
+    """
+    キャッシュから文字起こし結果を取得する
+    
+    Args:
+        cache_key (str): キャッシュキー
+        
+    Returns:
+        str: 文字起こしテキスト（キャッシュがない場合はNone）
+    """
+    cache_path = os.path.join(TRANSCRIPTION_CACHE_DIR, f"{cache_key}.json")
+    
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        # 最終利用時刻を更新（LRU削除の基準）
+        os.utime(cache_path, None)
+    except (OSError, ValueError):
+        with _cache_lock:
+            _cache_stats['misses'] += 1
+        return None
+    
+    with _cache_lock:
+        _cache_stats['hits'] += 1
+    return entry['transcription']
+
+def store_cached_transcription(cache_key, transcription):
+    """
+    文字起こし結果をキャッシュに保存し、上限を超えた分を古い順に削除する
+    
+    Args:
+        cache_key (str): キャッシュキー
+        transcription (str): 文字起こしテキスト
+    """
+    try:
+        if not os.path.exists(TRANSCRIPTION_CACHE_DIR):
+            os.makedirs(TRANSCRIPTION_CACHE_DIR, exist_ok=True)
+        
+        # 書き込み途中のファイルを読まれないよう一時ファイル経由で保存
+        cache_path = os.path.join(TRANSCRIPTION_CACHE_DIR, f"{cache_key}.json")
+        temp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'transcription': transcription, 'created_at': time.time()}, f, ensure_ascii=False)
+        os.replace(temp_path, cache_path)
+        
+        evict_transcription_cache()
+    except OSError as e:
+        print(f"文字起こしキャッシュの保存に失敗しました: {str(e)}")
+
+def evict_transcription_cache(max_bytes=None):
+    """
+    キャッシュの合計サイズが上限を超えている場合、最終利用が古いものから削除する
+    
+    Args:
+        max_bytes (int): キャッシュの最大サイズ（バイト、省略時は既定値）
+    """
+    if max_bytes is None:
+        max_bytes = TRANSCRIPTION_CACHE_MAX_BYTES
+    
+    with _cache_lock:
+        entries = []
+        for filename in os.listdir(TRANSCRIPTION_CACHE_DIR):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(TRANSCRIPTION_CACHE_DIR, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                _cache_stats['evictions'] += 1
+            except OSError:
+                pass
+
+def get_transcription_cache_stats():
+    """
+    文字起こしキャッシュの統計情報を取得する
+    
+    Returns:
+        dict: ヒット数、ミス数、削除数、エントリ数、合計サイズ
+    """
+    entries = 0
+    size = 0
+    if os.path.exists(TRANSCRIPTION_CACHE_DIR):
+        for filename in os.listdir(TRANSCRIPTION_CACHE_DIR):
+            if filename.endswith('.json'):
+                entries += 1
+                size += os.path.getsize(os.path.join(TRANSCRIPTION_CACHE_DIR, filename))
+    
+    with _cache_lock:
+        stats = dict(_cache_stats)
+    stats.update({'entries': entries, 'size_bytes': size, 'max_bytes': TRANSCRIPTION_CACHE_MAX_BYTES})
+    return stats
 
 def split_audio(audio_path):
     """
     長い音声ファイルを処理可能なチャンクに分割する
     
+    分割点は目標の長さ付近の無音区間に置き、無音が見つからない場合は
+    前のチャンクと少し重ねて分割する。音声全体はデコードせず、
+    長さはメタデータから、分割点は探索範囲だけを読み込んで決定する。
+    チャンクの書き出しは prepare_chunk で必要になった時点で行う。
+    
     Args:
         audio_path (str): 音声ファイルのパス
         
     Returns:
-        list: 分割された一時音声ファイルのパスリスト
+        list: チャンクのリスト（各要素は 'start', 'end', 'overlap' を持つ辞書）
     """
     try:
-        # 音声ファイルを読み込む
-        audio = AudioSegment.from_file(audio_path)
+        # メタデータから音声の長さを取得
+        duration = get_audio_duration(audio_path)
         
         # ファイルが短い場合は分割不要
-        if len(audio) <= MAX_AUDIO_LENGTH:
-            return [audio_path]
+        if duration <= MAX_AUDIO_LENGTH:
+            return [{'start': 0, 'end': duration, 'overlap': 0, 'whole': True}]
         
-        # 分割する
-        chunks = []
-        for i in range(0, len(audio), MAX_AUDIO_LENGTH):
-            chunk = audio[i:i + MAX_AUDIO_LENGTH]
-            
-            # 一時ファイルを作成
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-            chunk.export(temp_file.name, format="wav")
-            chunks.append(temp_file.name)
-        
-        return chunks
+        # 分割区間を決定
+        return plan_segments(audio_path, duration=duration, target_length=MAX_AUDIO_LENGTH)
     
     except Exception as e:
         raise Exception(f"音声分割中にエラーが発生しました: {str(e)}")
 
+def prepare_chunk(audio_path, chunk, upload_format=UPLOAD_AUDIO_FORMAT):
+    """
+    チャンクの音声ファイルを用意する
+    
+    アップロード用の変換が有効な場合は、分割不要なファイルも含めて
+    モノラル・16kHzの圧縮形式（FLACまたはOpus）に変換する。
+    
+    Args:
+        audio_path (str): 元の音声ファイルのパス
+        chunk (dict): split_audio が返したチャンク
+        upload_format (str): 変換形式（'flac'、'opus'、'off'）
+        
+    Returns:
+        str: チャンクの音声ファイルのパス（分割・変換不要の場合は元のファイル）
+    """
+    if chunk.get('whole') and upload_format not in UPLOAD_FORMATS:
+        return audio_path
+    
+    # 一時ファイルに該当区間だけを書き出す
+    return export_segment(audio_path, chunk, upload_format=upload_format)
+
 def transcribe_with_deepgram(audio_path):
     """
     Deepgram APIを使用して音声を文字起こしする
@@ -59,11 +244,17 @@ def transcribe_with_deepgram(audio_path):
         # 音声ファイルを開く
         with open(audio_path, 'rb') as audio:
             # APIリクエストを送信
-            response = requests.post(
-                "https://api.deepgram.com/v1/listen?language=ja",
+            params = {"language": TRANSCRIPTION_LANGUAGE}
+            if DEEPGRAM_MODEL:
+                params["model"] = DEEPGRAM_MODEL
+            
+            response = post_with_retry(
+                'deepgram',
+                "https://api.deepgram.com/v1/listen",
+                params=params,
                 headers={
                     "Authorization": f"Token {api_key}",
-                    "Content-Type": "audio/wav"
+                    "Content-Type": get_content_type(audio_path)
                 },
                 data=audio
             )
@@ -95,11 +286,12 @@ def transcribe_with_groq(audio_path):
     try:
         with open(audio_path, 'rb') as audio:
             # APIリクエストを送信
-            response = requests.post(
+            response = post_with_retry(
+                'groq',
                 "https://api.groq.com/openai/v1/audio/transcriptions",
                 headers={"Authorization": f"Bearer {api_key}"},
-                files={"file": audio},
-                data={"model": "whisper-large-v3-turbo", "language": "ja"}
+                files={"file": (os.path.basename(audio_path), audio, get_content_type(audio_path))},
+                data={"model": GROQ_WHISPER_MODEL, "language": TRANSCRIPTION_LANGUAGE}
             )
         
         if response.status_code != 200:
@@ -112,39 +304,127 @@ def transcribe_with_groq(audio_path):
     except Exception as e:
         raise Exception(f"Groq Whisperでの文字起こし中にエラーが発生しました: {str(e)}")
 
-def transcribe_audio(audio_path, api_choice='deepgram'):
+def transcribe_chunk(chunk_path, api_choice='deepgram'):
+    """
+    1つのチャンクを選択されたAPIで文字起こしする
+    
+    Args:
+        chunk_path (str): チャンク音声ファイルのパス
+        api_choice (str): 使用するAPI ('deepgram' または 'groq')
+        
+    Returns:
+        str: 文字起こしテキスト
+    """
+    if api_choice.lower() == 'deepgram':
+        return transcribe_with_deepgram(chunk_path)
+    elif api_choice.lower() == 'groq':
+        return transcribe_with_groq(chunk_path)
+    else:
+        raise ValueError(f"不明なAPI選択: {api_choice}")
+
+def transcribe_audio(audio_path, api_choice='deepgram', max_workers=None, upload_format=None, use_cache=True,
+                     progress_callback=None, on_chunk=None):
     """
     音声を文字起こしする
     
+    チャンクはAPI毎の並列数の上限内で同時に文字起こしし、
+    結果は元の順序で結合する。重なりのあるつなぎ目の重複は取り除く。
+    同じ音声・API設定の結果がキャッシュにあればAPIを呼ばずに返す。
+    
     Args:
         audio_path (str): 音声ファイルのパス
         api_choice (str): 使用するAPI ('deepgram' または 'groq')
+        max_workers (int): 並列数（省略時はAPI毎の既定値、1で逐次処理）
+        upload_format (str): アップロード前の変換形式（'flac'、'opus'、'off'、省略時は既定値）
+        use_cache (bool): 文字起こしキャッシュを使用するかどうか
+        progress_callback (callable): 進捗報告用の関数 (stage, done, total)
+        on_chunk (callable): チャンクの文字起こしが完了する度に呼ばれる関数 (index, total, text)
+            （完了順に呼ばれるため、indexは元の順序とは限らない）
         
     Returns:
         str: 文字起こしテキスト
     """
+    if api_choice.lower() not in MAX_WORKERS:
+        raise ValueError(f"不明なAPI選択: {api_choice}")
+    
     try:
+        # キャッシュを確認
+        cache_key = None
+        if use_cache:
+            cache_key = get_transcription_cache_key(audio_path, api_choice)
+            cached = get_cached_transcription(cache_key)
+            if cached is not None:
+                print("キャッシュから文字起こし結果を取得しました")
+                if progress_callback:
+                    progress_callback('transcribe', 1, 1)
+                if on_chunk:
+                    on_chunk(0, 1, cached)
+                return cached
+        
         # 音声ファイルを分割
-        chunk_paths = split_audio(audio_path)
-        
-        # 各チャンクを文字起こし
-        transcriptions = []
-        for chunk_path in chunk_paths:
-            if api_choice.lower() == 'deepgram':
-                chunk_text = transcribe_with_deepgram(chunk_path)
-            elif api_choice.lower() == 'groq':
-                chunk_text = transcribe_with_groq(chunk_path)
-            else:
-                raise ValueError(f"不明なAPI選択: {api_choice}")
-            
-            transcriptions.append(chunk_text)
-            
-            # 一時ファイルを削除（元のファイル以外）
-            if chunk_path != audio_path:
-                os.unlink(chunk_path)
+        chunks = split_audio(audio_path)
+        total = len(chunks)
+        
+        if max_workers is None:
+            max_workers = MAX_WORKERS[api_choice.lower()]
+        if upload_format is None:
+            upload_format = UPLOAD_AUDIO_FORMAT
+        max_workers = max(1, min(max_workers, total))
+        print(f"{total}個のチャンクを並列数{max_workers}で文字起こしします")
+        if progress_callback:
+            progress_callback('transcribe', 0, total)
+        
+        def process_chunk(chunk):
+            # チャンクは処理する直前に書き出すため、同時に存在する一時ファイルは並列数まで
+            chunk_path = prepare_chunk(audio_path, chunk, upload_format=upload_format)
+            try:
+                return transcribe_chunk(chunk_path, api_choice)
+            finally:
+                # 一時ファイルを削除（元のファイル以外）
+                if chunk_path != audio_path and os.path.exists(chunk_path):
+                    os.unlink(chunk_path)
+        
+        # 各チャンクを並列に文字起こし（結果はインデックス順に格納）
+        transcriptions = [None] * total
+        errors = []
+        done = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(process_chunk, chunk): i
+                for i, chunk in enumerate(chunks)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                if future.cancelled():
+                    continue
+                try:
+                    transcriptions[index] = future.result()
+                    done += 1
+                    print(f"チャンク {index + 1}/{total} の文字起こしが完了しました")
+                    if on_chunk:
+                        on_chunk(index, total, transcriptions[index])
+                    if progress_callback:
+                        progress_callback('transcribe', done, total)
+                except Exception as chunk_error:
+                    errors.append((index, chunk_error))
+                    # 未着手のチャンクは実行しない
+                    for pending in futures:
+                        pending.cancel()
+        
+        if errors:
+            details = "; ".join(
+                f"チャンク {index + 1}/{total}: {str(error)}"
+                for index, error in sorted(errors, key=lambda item: item[0])
+            )
+            raise Exception(details)
+        
+        # 結果を結合（重なりのあるつなぎ目は重複を除去）
+        transcription = merge_transcripts(transcriptions, [chunk['overlap'] for chunk in chunks])
+        
+        if cache_key is not None:
+            store_cached_transcription(cache_key, transcription)
         
-        # 結果を結合
-        return " ".join(transcriptions)
+        return transcription
     
     except Exception as e:
         raise Exception(f"文字起こし処理中にエラーが発生しました: {str(e)}")
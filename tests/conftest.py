@@ -0,0 +1,48 @@
+import os
+import sys
+import threading
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+# modules パッケージを読み込めるようにリポジトリのルートをパスに追加
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# パスを追加した後に読み込む
+from modules import result_cache
+
+# Colabのセルから保存した手動確認用のスクリプト（!pip などを含むためテストとして読み込まない）
+collect_ignore = ['test_transcription.py']
+
+@pytest.fixture
+def fake_llm():
+    """
+    プロンプトの文字列から応答を作る関数を、チェーンでLLMの代わりに使用できるようにする
+    
+    Returns:
+        callable: 応答を作る関数を受け取り、(LLM, 受け取ったプロンプトのリスト) を返す関数
+    """
+    def make(respond):
+        prompts = []
+        lock = threading.Lock()
+        
+        def invoke(prompt, **kwargs):
+            text = prompt.to_string()
+            with lock:
+                prompts.append(text)
+            return respond(text)
+        
+        return RunnableLambda(invoke), prompts
+    
+    return make
+
+@pytest.fixture(autouse=True)
+def result_cache_db(tmp_path, monkeypatch):
+    """LLM結果キャッシュをテスト毎の一時ファイルに保存する"""
+    monkeypatch.setattr(result_cache, "LLM_CACHE_PATH", str(tmp_path / "llm_results.sqlite3"))
+    monkeypatch.setattr(result_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(result_cache, "_connection", None)
+    yield
+    if result_cache._connection is not None:
+        result_cache._connection.close()
+        result_cache._connection = None
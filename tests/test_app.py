@@ -0,0 +1,28 @@
+import pytest
+
+import app as app_module
+
+@pytest.fixture
+def client():
+    return app_module.app.test_client()
+
+def test_qa_batch_rejects_string_questions(client):
+    response = client.post('/qa/batch', json={'text': '会議の内容', 'questions': '予算は？'})
+    assert response.status_code == 400
+
+def test_qa_batch_rejects_blank_question(client):
+    response = client.post('/qa/batch', json={'text': '会議の内容', 'questions': ['予算は？', ' ']})
+    assert response.status_code == 400
+
+def test_summarize_rejects_blank_text(client):
+    response = client.post('/summarize', json={'text': '   \n'})
+    assert response.status_code == 400
+
+def test_generate_report_rejects_invalid_report_id(client):
+    response = client.post('/generate_report', json={'transcription': '会議', 'report_id': '../../outside'})
+    assert response.status_code == 400
+
+def test_generate_report_unknown_report_id(client):
+    response = client.post('/generate_report', json={'report_id': '0' * 32, 'output_format': 'txt'})
+    assert response.status_code == 404
+    assert 'error' in response.get_json()
@@ -0,0 +1,74 @@
+import pytest
+from pydub import AudioSegment
+from pydub.generators import Sine
+
+from modules.audio_processing import plan_segments, merge_transcripts, _merge_seam, get_content_type
+
+def make_audio(*parts):
+    """(種類, 長さ) の並びから 'tone'（発話の代わり）と 'silence' をつないだ音声を作る"""
+    audio = AudioSegment.silent(duration=0, frame_rate=8000)
+    for kind, length in parts:
+        if kind == 'tone':
+            audio += Sine(440, sample_rate=8000).to_audio_segment(duration=length, volume=-20)
+        else:
+            audio += AudioSegment.silent(duration=length, frame_rate=8000)
+    return audio
+
+@pytest.fixture(scope='module')
+def meeting_audio(tmp_path_factory):
+    # 55秒付近にだけ無音があり、115秒付近には無音がない2分30秒の音声
+    path = tmp_path_factory.mktemp("audio") / "meeting.wav"
+    make_audio(('tone', 55000), ('silence', 1000), ('tone', 94000)).export(str(path), format='wav')
+    return str(path)
+
+def test_segments_cut_at_silence_or_overlap(meeting_audio):
+    segments = plan_segments(meeting_audio, duration=150000, target_length=60000, overlap=2000)
+    
+    # 無音の中央で分割した区間は重ならず、無音がない位置で分割した区間は overlap だけ重なる
+    assert segments == [
+        {'start': 0, 'end': 55500, 'overlap': 0},
+        {'start': 55500, 'end': 115500, 'overlap': 0},
+        {'start': 113500, 'end': 150000, 'overlap': 2000},
+    ]
+
+def test_merge_transcripts_removes_overlap():
+    texts = ["今日は会議を始めます。まず議題", "まず議題の確認です。"]
+    assert merge_transcripts(texts, [0, 2000]) == "今日は会議を始めます。まず議題の確認です。"
+
+def test_merge_transcripts_skips_silence_cuts():
+    # 無音で分割したつなぎ目（重なり0）は一致する語句があっても取り除かない
+    texts = ["はい、そうです", "そうです、次へ"]
+    assert merge_transcripts(texts, [0, 0]) == "はい、そうです そうです、次へ"
+    assert merge_transcripts(texts, [0, 2000]) == "はい、そうです、次へ"
+
+def test_merge_seam_exact_overlap():
+    previous = "今日は会議を始めます。まず議題"
+    following = "まず議題の確認です。"
+    assert _merge_seam(previous, following, 2000) == "今日は会議を始めます。まず議題の確認です。"
+
+def test_merge_seam_allows_jitter_at_edges():
+    # 前チャンクの末尾で途切れた語と、次チャンクの先頭の誤認識を無視する
+    assert _merge_seam("we will start the meet", "the meeting now", 2000) == "we will start the meeting now"
+    previous = "それでは次の議題の予算案の確認をしまｓ"
+    following = "っ議題の予算案の確認をします。"
+    assert _merge_seam(previous, following, 2000) == "それでは次の議題の予算案の確認をします。"
+
+def test_merge_seam_no_overlap():
+    assert _merge_seam("前半の発言です。", "後半の発言です。", 2000) == "前半の発言です。 後半の発言です。"
+
+def test_merge_seam_ignores_spurious_repeated_phrase():
+    # 前チャンクの途中と次チャンクの途中にだけ現れる語句は重複とみなさない
+    previous = "ということで" + "あ" * 60 + "の結論に至りました"
+    following = "いいえ違います" + "い" * 20 + "ということで進めます"
+    assert _merge_seam(previous, following, 2000) == f"{previous} {following}"
+
+def test_merge_seam_window_follows_overlap_length():
+    # 重なりが短い場合は、見積もった文字数より長い一致を探さない
+    phrase = "あいうえおかきくけこさしすせそ"
+    assert _merge_seam("前" + phrase, phrase + "後", 2000) == "前" + phrase + "後"
+    assert _merge_seam("前" + phrase, phrase + "後", 200) != "前" + phrase + "後"
+
+def test_content_type_from_extension():
+    assert get_content_type("meeting.MP3") == "audio/mpeg"
+    assert get_content_type("/tmp/chunk.flac") == "audio/flac"
+    assert get_content_type("meeting.unknown") == "application/octet-stream"
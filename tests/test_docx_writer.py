@@ -0,0 +1,51 @@
+import docx
+
+from modules.docx_writer import TRANSCRIPT_MARKER, iter_transcript_segments, save_with_transcript
+
+def save_and_read(doc, tmp_path, transcription):
+    """目印を含むドキュメントに文字起こしを書き込んで保存し、パラグラフのテキストを返す"""
+    output_path = str(tmp_path / "output.docx")
+    save_with_transcript(doc, output_path, transcription, max_chars=100)
+    return [paragraph.text for paragraph in docx.Document(output_path).paragraphs]
+
+def test_segments_split_on_lines():
+    assert list(iter_transcript_segments("一行目\n\n  二行目  \n", max_chars=100)) == ["一行目", "二行目"]
+
+def test_segments_group_sentences():
+    text = "これは文です。" * 10
+    segments = list(iter_transcript_segments(text, max_chars=20))
+    
+    assert "".join(segments) == text
+    assert all(len(segment) <= 20 for segment in segments)
+    assert all(segment.endswith("。") for segment in segments)
+
+def test_segments_split_long_sentence():
+    text = "あ" * 25
+    assert list(iter_transcript_segments(text, max_chars=10)) == ["あ" * 10, "あ" * 10, "あ" * 5]
+
+def test_transcript_replaces_marker_paragraph(tmp_path):
+    doc = docx.Document()
+    doc.add_paragraph("前")
+    doc.add_paragraph(TRANSCRIPT_MARKER)
+    doc.add_paragraph("後")
+    
+    assert save_and_read(doc, tmp_path, "一行目\n二行目") == ["前", "一行目", "二行目", "後"]
+
+def test_transcript_keeps_text_around_marker(tmp_path):
+    doc = docx.Document()
+    paragraph = doc.add_paragraph("全文: ")
+    paragraph.add_run(TRANSCRIPT_MARKER + " 以上")
+    paragraph.add_run("です").bold = True
+    
+    assert save_and_read(doc, tmp_path, "一行目\n二行目") == ["全文: 一行目", "二行目", " 以上です"]
+
+def test_transcript_expands_every_marker(tmp_path):
+    doc = docx.Document()
+    doc.add_paragraph(TRANSCRIPT_MARKER)
+    doc.add_paragraph("区切り")
+    doc.add_paragraph(f"{TRANSCRIPT_MARKER}/{TRANSCRIPT_MARKER}")
+    
+    paragraphs = save_and_read(doc, tmp_path, "一行目\n二行目")
+    
+    assert paragraphs == ["一行目", "二行目", "区切り", "一行目", "二行目", "/一行目", "二行目"]
+    assert not any(TRANSCRIPT_MARKER in text for text in paragraphs)
@@ -0,0 +1,75 @@
+import io
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+
+from modules import http_client
+from modules.http_client import parse_retry_after, compute_backoff, post_with_retry, BACKOFF_BASE, BACKOFF_MAX
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+    
+    def close(self):
+        self.closed = True
+
+class FakeSession:
+    """決められた順にレスポンスを返し、送信された本文を記録するセッション"""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.bodies = []
+    
+    def post(self, url, timeout=None, data=None, **kwargs):
+        self.bodies.append(data.read())
+        return self.responses.pop(0)
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after("12") == 12.0
+    assert parse_retry_after("1.5") == 1.5
+    assert parse_retry_after("-3") == 0.0
+
+def test_parse_retry_after_http_date():
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=30)
+    seconds = parse_retry_after(format_datetime(retry_at, usegmt=True))
+    assert 25 <= seconds <= 30
+
+def test_parse_retry_after_invalid():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("") is None
+    assert parse_retry_after("soon") is None
+
+def test_compute_backoff_uses_retry_after():
+    assert compute_backoff(0, retry_after=5.0) == 5.0
+    assert compute_backoff(0, retry_after=BACKOFF_MAX * 10) == BACKOFF_MAX
+
+def test_compute_backoff_is_bounded():
+    for attempt in range(10):
+        for _ in range(20):
+            wait = compute_backoff(attempt)
+            assert 0 <= wait <= min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt))
+
+def test_post_retries_with_rewound_body(monkeypatch):
+    busy = FakeResponse(503, {'Retry-After': '7'})
+    session = FakeSession([busy, FakeResponse(200)])
+    waits = []
+    monkeypatch.setattr(http_client, "get_session", lambda provider: session)
+    monkeypatch.setattr(http_client.time, "sleep", waits.append)
+    
+    response = post_with_retry('deepgram', "https://example.com", data=io.BytesIO(b"audio"))
+    
+    # 再試行でも本文を先頭から送り直し、Retry-Afterの秒数だけ待機する
+    assert response.status_code == 200
+    assert session.bodies == [b"audio", b"audio"]
+    assert waits == [7.0]
+    assert busy.closed
+
+def test_post_returns_last_response_after_retries(monkeypatch):
+    session = FakeSession([FakeResponse(429, {'Retry-After': '0'}) for _ in range(3)])
+    monkeypatch.setattr(http_client, "get_session", lambda provider: session)
+    monkeypatch.setattr(http_client.time, "sleep", lambda seconds: None)
+    
+    response = post_with_retry('groq', "https://example.com", max_retries=2, data=io.BytesIO(b"audio"))
+    
+    assert response.status_code == 429
+    assert len(session.bodies) == 3
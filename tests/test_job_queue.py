@@ -0,0 +1,94 @@
+import time
+
+from modules.job_queue import submit_job, get_job, iter_job_events, TOKEN_EVENT_CHARS
+
+def wait_for_job(job_id, timeout=5):
+    """ジョブが完了または失敗するまで待機し、最後の状態を返す"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = get_job(job_id)
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"ジョブが終了しません: {job_id}")
+
+def collect_events(job_id, last_event_id=-1):
+    return [item[1] for item in iter_job_events(job_id, last_event_id) if item is not None]
+
+def test_job_records_progress_and_result():
+    def run(progress, emit):
+        progress('transcribe', 1, 2)
+        progress('transcribe', 2, 2)
+        return {'transcription': 'テキスト'}
+    
+    job = wait_for_job(submit_job('transcribe', run))
+    
+    assert job['status'] == 'completed'
+    assert job['kind'] == 'transcribe'
+    assert job['result'] == {'transcription': 'テキスト'}
+    assert job['stages'] == {'transcribe': {'done': 2, 'total': 2}}
+
+def test_job_records_error():
+    def run(progress, emit):
+        raise RuntimeError("APIエラー")
+    
+    job = wait_for_job(submit_job('summarize', run))
+    
+    assert job['status'] == 'failed'
+    assert job['error'] == "APIエラー"
+    assert job['result'] is None
+
+def test_unknown_job():
+    assert get_job("unknown") is None
+
+def test_events_end_with_done_and_resume():
+    def run(progress, emit):
+        emit({'type': 'partial', 'index': 0, 'text': '発言'})
+        progress('transcribe', 1, 1)
+        return {'transcription': '発言'}
+    
+    job_id = submit_job('transcribe', run)
+    events = collect_events(job_id)
+    
+    assert [event['type'] for event in events] == ['partial', 'progress', 'done']
+    assert events[-1]['result'] == {'transcription': '発言'}
+    
+    # 再接続時は受信済みのイベントより後だけを返す
+    assert collect_events(job_id, last_event_id=1) == events[2:]
+
+def test_events_end_with_error():
+    def run(progress, emit):
+        raise RuntimeError("APIエラー")
+    
+    events = collect_events(submit_job('qa', run))
+    assert events == [{'type': 'error', 'error': "APIエラー"}]
+
+def test_token_events_are_coalesced():
+    tokens = [f"{i % 10}" for i in range(TOKEN_EVENT_CHARS * 5 + 7)]
+    
+    def run(progress, emit):
+        emit({'type': 'llm_start'})
+        for token in tokens:
+            emit({'type': 'token', 'text': token})
+        progress('reduce', 1, 1)
+        return {'summary': ''.join(tokens)}
+    
+    events = collect_events(submit_job('summarize', run))
+    token_events = [event for event in events if event['type'] == 'token']
+    
+    # トークンの順序と内容は変わらず、イベントの数はトークン数より大幅に少ない
+    assert ''.join(event['text'] for event in token_events) == ''.join(tokens)
+    assert len(token_events) <= len(tokens) // TOKEN_EVENT_CHARS + 1
+    
+    # まとめたトークンは後続のイベントより前に追加される
+    types = [event['type'] for event in events]
+    assert types[0] == 'llm_start'
+    assert types[-2:] == ['progress', 'done']
+
+def test_pending_tokens_not_in_snapshot():
+    job_id = submit_job('qa', lambda progress, emit: {'answer': 'ok'})
+    collect_events(job_id)
+    job = get_job(job_id)
+    
+    assert job['status'] == 'completed'
+    assert 'pending_tokens' not in job
@@ -0,0 +1,290 @@
+import re
+import json
+
+import pytest
+import tiktoken
+
+from modules import llm_processing, retrieval
+from modules.result_cache import get_result_cache_stats
+from modules.llm_processing import (
+    get_chunk_token_budget, get_llm_identity, split_text, count_tokens, detect_language, is_japanese, group_summaries,
+    reduce_summaries, tree_refine_summarize, summarize_text, question_answering, batch_question_answering,
+    parse_batch_answers, parse_json_object, get_groq_llm, MAX_TOKENS, MAX_CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS,
+    PROMPT_RESERVE_TOKENS, TOKENIZER_SAFETY_MARGIN
+)
+
+@pytest.fixture
+def char_tokens(monkeypatch):
+    """トークン数を文字数で数える（tiktokenのエンコーディングを使用しない）"""
+    monkeypatch.setattr(llm_processing, "count_tokens", lambda text, api_choice=None: len(text))
+
+def test_chunk_budget_without_api():
+    assert get_chunk_token_budget() == MAX_TOKENS
+
+def test_chunk_budget_is_capped():
+    assert get_chunk_token_budget('azure') == MAX_CHUNK_TOKENS
+    assert get_chunk_token_budget('groq', 'llama3') == MAX_CHUNK_TOKENS
+
+def test_chunk_budget_small_context():
+    # gemma2: 8192 - プロンプト - 出力1024 に誤差の係数を掛けた値
+    expected = int((8192 - PROMPT_RESERVE_TOKENS - 1024) * TOKENIZER_SAFETY_MARGIN)
+    assert get_chunk_token_budget('groq', 'gemma2') == min(expected, MAX_CHUNK_TOKENS)
+
+def test_chunk_budget_has_floor():
+    budget = get_chunk_token_budget('groq', 'gemma2', prompt_tokens=8000, output_tokens=8000)
+    assert budget == CHUNK_OVERLAP_TOKENS * 2
+
+def test_split_text_respects_token_budget():
+    text = "今日は会議の議題について話し合いました。" * 400
+    chunks = split_text(text, chunk_tokens=300, chunk_overlap=0)
+    
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= 300 for chunk in chunks)
+    assert "".join(chunks) == text
+
+def test_split_text_short_text():
+    assert split_text("短いテキスト", chunk_tokens=300) == ["短いテキスト"]
+
+@pytest.fixture
+def offline_encoding(monkeypatch):
+    """tiktokenのエンコーディングをダウンロードできない環境にする"""
+    def fail(name):
+        raise OSError(f"{name} をダウンロードできません")
+    monkeypatch.setattr(tiktoken, "get_encoding", fail)
+    llm_processing.get_encoding_name.cache_clear()
+    yield
+    llm_processing.get_encoding_name.cache_clear()
+
+def test_count_tokens_without_encoding(offline_encoding):
+    assert llm_processing.get_encoding_name('azure') is None
+    assert count_tokens("abcd") == 2
+    assert count_tokens("会議") == 3
+
+def test_split_text_without_encoding(offline_encoding):
+    text = "今日は会議の議題について話し合いました。" * 100
+    chunks = split_text(text, 'azure', chunk_tokens=300, chunk_overlap=0)
+    
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk, 'azure') <= 300 for chunk in chunks)
+    assert "".join(chunks) == text
+
+def test_group_summaries_keeps_order_within_budget(char_tokens):
+    # 区切りの改行の分を含めて 5 + 5 = 10 トークンまで1つにまとめる
+    groups = group_summaries(["aaaa", "bbbb", "cc", "dddddddddddd", "e"], 10)
+    assert groups == [["aaaa", "bbbb"], ["cc"], ["dddddddddddd"], ["e"]]
+
+def test_reduce_summaries_combines_in_levels(monkeypatch, fake_llm, char_tokens):
+    monkeypatch.setattr(llm_processing, "COMBINE_TEMPLATE", "combine:{text}")
+    monkeypatch.setattr(llm_processing, "get_chunk_token_budget", lambda *args, **kwargs: 10)
+    # 各要約の先頭の文字だけを残して結合する
+    llm, prompts = fake_llm(lambda prompt: "".join(part[0] for part in prompt[len("combine:"):].split("\n\n")))
+    
+    assert reduce_summaries(["Aaaa", "Bbbb", "Cccc", "Dddd", "Eeee"], llm) == "AE"
+    # 1段目: AB, CD（Eはそのまま）、2段目: AC（Eはそのまま）、最後の結合: AE
+    assert sorted(prompts) == sorted([
+        "combine:Aaaa\n\nBbbb", "combine:Cccc\n\nDddd", "combine:AB\n\nCD", "combine:AC\n\nEeee"
+    ])
+
+def test_reduce_summaries_single_group(monkeypatch, fake_llm, char_tokens):
+    monkeypatch.setattr(llm_processing, "COMBINE_TEMPLATE", "combine:{text}")
+    llm, prompts = fake_llm(lambda prompt: "要約")
+    
+    assert reduce_summaries(["前半", "後半"], llm) == "要約"
+    assert prompts == ["combine:前半\n\n後半"]
+
+@pytest.fixture
+def pair_templates(monkeypatch):
+    """要約・統合のプロンプトを、入力をそのまま連結する短い形式にする"""
+    monkeypatch.setattr(llm_processing, "MAP_TEMPLATE", "map:{text}")
+    monkeypatch.setattr(llm_processing, "PAIR_REFINE_TEMPLATE", "refine:{existing_answer}|{text}")
+    
+    def respond(prompt):
+        if prompt.startswith("map:"):
+            return prompt[len("map:"):]
+        left, right = prompt[len("refine:"):].split("|")
+        return left + right
+    return respond
+
+def test_tree_refine_keeps_order(monkeypatch, fake_llm, pair_templates):
+    monkeypatch.setattr(llm_processing, "split_text", lambda *args, **kwargs: list("ABCDE"))
+    llm, prompts = fake_llm(pair_templates)
+    
+    assert tree_refine_summarize("本文", llm) == "ABCDE"
+    # 1段目の要約3回と統合4回
+    assert len(prompts) == 7
+
+def test_tree_refine_blank_text(fake_llm, pair_templates):
+    llm, prompts = fake_llm(pair_templates)
+    assert tree_refine_summarize("   \n ", llm) == ""
+    assert prompts == []
+
+@pytest.fixture
+def qa_llm(monkeypatch, fake_llm):
+    """
+    文字起こし全体を1チャンクとして検索し、番号付きの質問にはJSONで回答するLLMを使用する
+    
+    Returns:
+        callable: まとめた回答を返すかどうかを受け取り、(LLM, 受け取ったプロンプトのリスト) を返す関数
+    """
+    monkeypatch.setattr(retrieval, "split_text", lambda text, *args, **kwargs: [text])
+    
+    def make(batch_json=True):
+        def respond(prompt):
+            questions = re.findall(r"\d+\. (\S+)", prompt)
+            if not questions:
+                return "個別の回答です。"
+            if not batch_json:
+                return "回答をまとめられませんでした。"
+            return json.dumps({'answers': [f"{question}への回答" for question in questions]}, ensure_ascii=False)
+        
+        llm, prompts = fake_llm(respond)
+        monkeypatch.setattr(llm_processing, "select_llm", lambda *args, **kwargs: llm)
+        return llm, prompts
+    
+    return make
+
+def test_batch_questions_share_prompts(monkeypatch, qa_llm):
+    monkeypatch.setattr(llm_processing, "QA_BATCH_MAX_QUESTIONS", 2)
+    llm, prompts = qa_llm()
+    questions = ["日程は？", "予算は？", "担当は？"]
+    
+    qa_data = batch_question_answering("予算と日程と担当について話し合いました。", questions)
+    
+    # 同じチャンクを参照する質問は上限の数ずつ1つのプロンプトにまとめる
+    assert qa_data == [{'question': question, 'answer': f"{question}への回答"} for question in questions[:2]] + [
+        {'question': "担当は？", 'answer': "個別の回答です。"}
+    ]
+    assert len(prompts) == 2
+
+def test_batch_falls_back_to_single_questions(qa_llm):
+    llm, prompts = qa_llm(batch_json=False)
+    
+    qa_data = batch_question_answering("来期の予算と日程を確認しました。", ["日程は？", "予算は？"])
+    
+    assert [qa['answer'] for qa in qa_data] == ["個別の回答です。"] * 2
+    assert len(prompts) == 3
+
+def test_parse_batch_answers():
+    assert parse_batch_answers('回答:\n{"answers": ["はい", 2]}\n以上', 2) == ["はい", "2"]
+    assert parse_batch_answers('{"answers": ["はい"]}', 2) is None
+    assert parse_batch_answers('{"answers": "はい"}', 1) is None
+    assert parse_batch_answers('回答できません', 1) is None
+
+def test_batch_answers_translated_only_when_forced(monkeypatch, fake_llm):
+    def respond(prompt):
+        return "予算は承認されました。" if "日本語訳:" in prompt else "The budget was approved."
+    llm, prompts = fake_llm(respond)
+    monkeypatch.setattr(llm_processing, "select_llm", lambda *args, **kwargs: llm)
+    monkeypatch.setattr(retrieval, "split_text", lambda text, *args, **kwargs: [text])
+    
+    qa_data = batch_question_answering("予算について話し合いました。", ["予算は？"], force_japanese=False)
+    assert qa_data == [{'question': "予算は？", 'answer': "The budget was approved."}]
+    assert not any("日本語訳:" in prompt for prompt in prompts)
+    
+    qa_data = batch_question_answering("予算について話し合いました。", ["予算は？"])
+    assert qa_data == [{'question': "予算は？", 'answer': "予算は承認されました。"}]
+
+def test_parse_json_object():
+    assert parse_json_object('回答:\n```json\n{"日付": "1月1日"}\n```') == {'日付': '1月1日'}
+    assert parse_json_object('["日付"]') is None
+    assert parse_json_object('{"日付": }') is None
+    assert parse_json_object('情報なし') is None
+
+def test_llm_clients_are_reused(monkeypatch):
+    monkeypatch.setattr(llm_processing, "_llm_clients", {})
+    monkeypatch.setenv("GROQ_API_KEY", "key")
+    
+    llm = get_groq_llm('gemma2')
+    assert get_groq_llm('gemma2') is llm
+    assert get_groq_llm('gemma2', streaming=True) is not llm
+    
+    # 認証情報が変わった場合は作成し直す
+    monkeypatch.setenv("GROQ_API_KEY", "new-key")
+    assert get_groq_llm('gemma2') is not llm
+
+def test_summary_served_from_cache(monkeypatch, fake_llm, char_tokens):
+    monkeypatch.setattr(llm_processing, "split_text", lambda text, *args, **kwargs: [text])
+    llm, prompts = fake_llm(lambda prompt: "予算が承認されました。")
+    monkeypatch.setattr(llm_processing, "select_llm", lambda *args, **kwargs: llm)
+    
+    assert summarize_text("予算について話し合いました。", method='map_reduce') == "予算が承認されました。"
+    calls = len(prompts)
+    assert summarize_text("予算について話し合いました。", method='map_reduce') == "予算が承認されました。"
+    assert len(prompts) == calls
+    
+    # 方法が異なる場合やキャッシュを使用しない場合はLLMを呼び出す
+    summarize_text("予算について話し合いました。", method='tree_refine')
+    summarize_text("予算について話し合いました。", method='map_reduce', use_cache=False)
+    assert len(prompts) == calls * 2 + 1
+
+def test_llm_identity_distinguishes_deployments():
+    from langchain_openai import AzureChatOpenAI
+    from langchain_groq import ChatGroq
+    
+    def azure(deployment):
+        return AzureChatOpenAI(
+            openai_api_key='key', azure_endpoint='https://example.openai.azure.com',
+            azure_deployment=deployment, api_version='2023-05-15'
+        )
+    
+    assert get_llm_identity(azure('gpt-4o')) == ['azure', 'https://example.openai.azure.com', 'gpt-4o']
+    assert get_llm_identity(azure('gpt-4o')) != get_llm_identity(azure('gpt-4o-mini'))
+    assert get_llm_identity(ChatGroq(api_key='key', model_name='gemma2-9b-it')) == ['groq', None, 'gemma2-9b-it']
+
+def test_detect_language():
+    assert detect_language("本日の会議では予算について話し合いました。") == 'ja'
+    assert detect_language("We discussed the budget for next year.") == 'en'
+    assert detect_language("Мы обсудили бюджет") == 'other'
+    assert detect_language("12345 !?") == 'none'
+    # 英単語を含む日本語の文
+    assert detect_language("次回のMTGでKPIを確認します。") == 'ja'
+
+def test_is_japanese():
+    assert is_japanese("")
+    assert is_japanese("日本語の回答です。")
+    assert not is_japanese("This is an English answer.")
+
+def english_summary_llm(fake_llm, translation):
+    """英語で要約し、翻訳のプロンプトには translation を返す（例外の場合は送出する）LLM"""
+    def respond(prompt):
+        if "日本語訳:" not in prompt:
+            return "The budget was approved."
+        if isinstance(translation, Exception):
+            raise translation
+        return translation
+    return fake_llm(respond)
+
+def test_summary_cached_after_translation(monkeypatch, fake_llm):
+    llm, _ = english_summary_llm(fake_llm, "予算が承認されました。")
+    monkeypatch.setattr(llm_processing, "select_llm", lambda *args, **kwargs: llm)
+    
+    assert summarize_text("予算について話し合いました。", method='map_reduce') == "予算が承認されました。"
+    assert get_result_cache_stats()['entries'] == 2
+    
+    # 2回目はキャッシュから返す
+    llm, prompts = english_summary_llm(fake_llm, RuntimeError("呼び出されない"))
+    assert summarize_text("予算について話し合いました。", method='map_reduce') == "予算が承認されました。"
+    assert prompts == []
+
+def test_summary_not_cached_when_translation_fails(monkeypatch, fake_llm):
+    llm, _ = english_summary_llm(fake_llm, RuntimeError("翻訳できません"))
+    monkeypatch.setattr(llm_processing, "select_llm", lambda *args, **kwargs: llm)
+    
+    assert summarize_text("予算について話し合いました。", method='map_reduce') == "The budget was approved."
+    assert get_result_cache_stats()['entries'] == 0
+
+def test_answer_not_cached_when_translation_fails(monkeypatch, fake_llm):
+    llm, _ = english_summary_llm(fake_llm, RuntimeError("翻訳できません"))
+    monkeypatch.setattr(llm_processing, "select_llm", lambda *args, **kwargs: llm)
+    
+    answer = question_answering("予算について話し合いました。", "予算は？")
+    assert answer == "The budget was approved."
+    assert get_result_cache_stats()['entries'] == 0
+
+def test_batch_answers_not_cached_when_translation_fails(monkeypatch, fake_llm):
+    llm, _ = english_summary_llm(fake_llm, RuntimeError("翻訳できません"))
+    monkeypatch.setattr(llm_processing, "select_llm", lambda *args, **kwargs: llm)
+    
+    qa_data = batch_question_answering("予算について話し合いました。", ["予算は？", "日程は？"])
+    assert [qa['answer'] for qa in qa_data] == ["The budget was approved."] * 2
+    assert get_result_cache_stats()['entries'] == 0
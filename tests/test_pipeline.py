@@ -0,0 +1,38 @@
+from modules import pipeline
+from modules.pipeline import run_meeting_pipeline
+
+def test_partial_summaries_reduced_in_chunk_order(monkeypatch):
+    texts = ["冒頭の発言", "", "中盤の発言", "終盤の発言"]
+    chunks = []
+    progress = []
+    
+    def transcribe_audio(audio_path, on_chunk=None, **kwargs):
+        # 後のチャンクから文字起こしが完了した場合でも元の順序で結合される
+        for index in reversed(range(len(texts))):
+            on_chunk(index, len(texts), texts[index])
+        return " ".join(texts)
+    
+    def reduce_summaries(summaries, llm, **kwargs):
+        return " / ".join(summaries)
+    
+    monkeypatch.setattr(pipeline, "transcribe_audio", transcribe_audio)
+    monkeypatch.setattr(pipeline, "select_llm", lambda *args, **kwargs: None)
+    monkeypatch.setattr(pipeline, "map_summarize", lambda text, llm, **kwargs: [f"要約:{text}"])
+    monkeypatch.setattr(pipeline, "reduce_summaries", reduce_summaries)
+    
+    result = run_meeting_pipeline(
+        "meeting.wav",
+        force_japanese=False,
+        progress_callback=lambda stage, done, total: progress.append((stage, done, total)),
+        on_chunk=lambda index, total, text: chunks.append(index)
+    )
+    
+    assert result['summary'] == "要約:冒頭の発言 / 要約:中盤の発言 / 要約:終盤の発言"
+    assert result['transcription'] == " ".join(texts)
+    assert chunks == [3, 2, 1, 0]
+    
+    # 空のチャンクも要約の進捗に数える
+    summarize_progress = [item for item in progress if item[0] == 'summarize']
+    assert len(summarize_progress) == 4
+    assert max(done for _, done, _ in summarize_progress) == 4
+    assert progress[-1] == ('reduce', 1, 1)
@@ -0,0 +1,93 @@
+import os
+import json
+
+import pytest
+
+from modules import report_renderer
+from modules.report_renderer import (
+    is_valid_report_id, make_report_path, new_report_id, render_report, get_report_render_stats
+)
+from modules.download_handler import ReportNotFoundError, generate_reports, get_report_cache_stats, has_report
+
+@pytest.fixture
+def base_dir(tmp_path, monkeypatch):
+    """レポートの出力先を一時ディレクトリにする"""
+    monkeypatch.setattr(report_renderer, "_BASE_DIR", str(tmp_path))
+    return tmp_path
+
+def test_valid_report_id():
+    assert is_valid_report_id(new_report_id())
+    assert not is_valid_report_id("../../etc")
+    assert not is_valid_report_id("A" * 32)
+    assert not is_valid_report_id("0" * 31)
+    assert not is_valid_report_id(None)
+
+def test_make_report_path(base_dir):
+    report_id = new_report_id()
+    relative_path, abs_path = make_report_path(report_id, "report.txt")
+    
+    assert relative_path == f"static/uploads/reports/{report_id}/report.txt"
+    assert abs_path == os.path.join(str(base_dir), "static", "uploads", "reports", report_id, "report.txt")
+    assert os.path.isdir(os.path.dirname(abs_path))
+
+def test_report_ids_do_not_share_directory(base_dir):
+    _, first = make_report_path(new_report_id(), "report.txt")
+    _, second = make_report_path(new_report_id(), "report.txt")
+    assert os.path.dirname(first) != os.path.dirname(second)
+
+def test_render_inline_without_workers(monkeypatch):
+    monkeypatch.setattr(report_renderer, "REPORT_RENDER_WORKERS", 0)
+    before = get_report_render_stats()
+    
+    assert render_report(max, 1, 3) == 3
+    assert get_report_render_stats()['inline'] - before['inline'] == 1
+
+@pytest.mark.parametrize("report_id, filename", [
+    ("..", "report.txt"),
+    ("../../outside", "report.txt"),
+    ("a/b", "report.txt"),
+    ("/tmp", "report.txt"),
+    ("", "report.txt"),
+    (new_report_id(), "../report.txt"),
+    (new_report_id(), "sub/report.txt"),
+])
+def test_make_report_path_rejects_outside(base_dir, report_id, filename):
+    with pytest.raises(ValueError):
+        make_report_path(report_id, filename)
+    assert not (base_dir / "outside").exists()
+
+def test_generate_reports_in_every_format(base_dir, monkeypatch):
+    monkeypatch.setattr(report_renderer, "REPORT_RENDER_WORKERS", 0)
+    qa_data = [{'question': "予算は？", 'answer': "承認されました。"}]
+    
+    report_id, paths = generate_reports(['txt', 'json', 'md', 'docx'], "一行目\n二行目", "要約", qa_data)
+    
+    assert list(paths) == ['txt', 'json', 'markdown', 'docx']
+    assert all(path.startswith(f"static/uploads/reports/{report_id}/") for path in paths.values())
+    files = {name: os.path.join(str(base_dir), *path.split('/')) for name, path in paths.items()}
+    assert all(os.path.exists(path) for path in files.values())
+    
+    with open(files['json'], encoding='utf-8') as f:
+        assert json.load(f)['qa_data'] == qa_data
+    with open(files['txt'], encoding='utf-8') as f:
+        assert "Q1: 予算は？" in f.read()
+    with open(files['markdown'], encoding='utf-8') as f:
+        assert "## 要約\n\n要約" in f.read()
+
+def test_generate_reports_reuses_report(base_dir, monkeypatch):
+    monkeypatch.setattr(report_renderer, "REPORT_RENDER_WORKERS", 0)
+    report_id, paths = generate_reports(['txt'], "一行目", "要約")
+    before = get_report_cache_stats()
+    
+    # 文字起こしを指定しない場合は保持しているレポートから出力する
+    _, json_paths = generate_reports(['json'], report_id=report_id)
+    assert get_report_cache_stats()['hits'] - before['hits'] == 1
+    assert os.path.dirname(json_paths['json']) == os.path.dirname(paths['txt'])
+    with open(os.path.join(str(base_dir), *json_paths['json'].split('/')), encoding='utf-8') as f:
+        assert json.load(f)['summary'] == "要約"
+
+def test_unknown_report_without_transcription():
+    report_id = new_report_id()
+    assert not has_report(report_id)
+    with pytest.raises(ReportNotFoundError):
+        generate_reports(['txt'], report_id=report_id)
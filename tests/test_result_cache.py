@@ -0,0 +1,50 @@
+import pytest
+
+from modules import result_cache
+from modules.result_cache import make_cache_key, get_cached_result, store_cached_result, get_result_cache_stats
+
+@pytest.fixture
+def clock(monkeypatch):
+    """キャッシュが参照する現在時刻を進められるようにする"""
+    now = {'time': 1_000_000.0}
+    monkeypatch.setattr(result_cache.time, "time", lambda: now['time'])
+    return now
+
+def test_cache_key_depends_on_every_input():
+    key = make_cache_key('summarize', text="本文", method='refine')
+    assert key == make_cache_key('summarize', method='refine', text="本文")
+    assert key != make_cache_key('summarize', text="本文", method='map_reduce')
+    assert key != make_cache_key('qa', text="本文", method='refine')
+
+def test_store_and_get():
+    key = make_cache_key('qa_batch', text="本文")
+    assert get_cached_result(key) is None
+    
+    store_cached_result(key, 'qa_batch', [{'question': "予算は？", 'answer': "承認されました。"}])
+    assert get_cached_result(key) == [{'question': "予算は？", 'answer': "承認されました。"}]
+    assert get_result_cache_stats()['entries'] == 1
+
+def test_expired_result_is_not_returned(clock):
+    store_cached_result("key", 'summarize', "要約")
+    clock['time'] += result_cache.LLM_CACHE_TTL + 1
+    
+    assert get_cached_result("key") is None
+    assert get_result_cache_stats()['entries'] == 0
+
+def test_least_recently_used_results_are_evicted(monkeypatch, clock):
+    monkeypatch.setattr(result_cache, "LLM_CACHE_MAX_BYTES", 30)
+    for key in ("a", "b", "c"):
+        store_cached_result(key, 'summarize', "要約")
+        clock['time'] += 1
+    get_cached_result("a")
+    clock['time'] += 1
+    
+    # 上限（3件分）を超えたため、最終利用が最も古い b を削除する
+    store_cached_result("d", 'summarize', "要約")
+    assert get_cached_result("b") is None
+    assert all(get_cached_result(key) == "要約" for key in ("a", "c", "d"))
+
+def test_disabled_cache(monkeypatch):
+    monkeypatch.setattr(result_cache, "LLM_CACHE_ENABLED", False)
+    store_cached_result("key", 'summarize', "要約")
+    assert get_cached_result("key") is None
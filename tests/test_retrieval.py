@@ -0,0 +1,73 @@
+import pytest
+
+from modules import retrieval
+from modules.retrieval import (
+    tokenize, BM25Index, select_chunk_ids, get_transcript_index, retrieve_context, get_retrieval_index_stats
+)
+
+@pytest.fixture
+def paragraph_chunks(monkeypatch):
+    """文字起こしを段落単位のチャンクに分割する（tiktokenのエンコーディングを使用しない）"""
+    monkeypatch.setattr(retrieval, "split_text", lambda text, *args, **kwargs: text.split("\n\n"))
+
+def test_tokenize_words_and_bigrams():
+    assert tokenize("Budget 2024") == ["budget", "2024"]
+    assert tokenize("予算案") == ["予算", "算案"]
+    # 全角英数字は正規化して単語として扱う
+    assert tokenize("ＡＢＣ") == ["abc"]
+
+def test_bm25_ranks_matching_chunk_first():
+    index = BM25Index([
+        "来週の営業会議の日程を調整します。",
+        "来期の予算案について経理部から説明がありました。",
+        "新製品の発売時期は未定です。",
+    ])
+    hits = index.search("予算について教えてください", top_k=2)
+    
+    assert hits[0][0] == 1
+    assert all(score > 0 for _, score in hits)
+
+def test_bm25_no_match():
+    index = BM25Index(["会議の議事録", "次回の予定"])
+    assert index.search("xyz") == []
+
+def test_bm25_top_k():
+    index = BM25Index(["予算 予算 予算", "予算 予算", "予算", "日程"])
+    hits = index.search("予算", top_k=2)
+    assert [i for i, _ in hits] == [0, 1]
+
+def test_retrieve_context_keeps_transcript_order(paragraph_chunks):
+    text = "予算の説明です。\n\n日程の調整です。\n\n予算案を承認しました。\n\n次回の予定です。"
+    
+    assert retrieve_context(text, "予算は？", top_k=2) == ["予算の説明です。", "予算案を承認しました。"]
+    # 一致する語がない場合は冒頭から使用する
+    assert retrieve_context(text, "xyz", top_k=2) == ["予算の説明です。", "日程の調整です。"]
+
+def test_transcript_index_is_reused(paragraph_chunks):
+    text = "\n\n".join(f"第{i}回の議題は日程{i}です。" for i in range(10))
+    index = get_transcript_index(text)
+    before = get_retrieval_index_stats()
+    
+    assert get_transcript_index(text) is index
+    after = get_retrieval_index_stats()
+    assert after['hits'] - before['hits'] == 1
+    assert after['misses'] == before['misses']
+
+def test_retrieve_context_looks_up_index_once():
+    text = "\n\n".join(f"第{i}回の議題は予算{i}です。" for i in range(10))
+    get_transcript_index(text)
+    before = get_retrieval_index_stats()
+    
+    retrieve_context(text, "予算について")
+    after = get_retrieval_index_stats()
+    
+    assert after['hits'] - before['hits'] == 1
+    assert after['misses'] == before['misses']
+
+def test_select_chunk_ids_small_index():
+    index = BM25Index(["a", "b"])
+    assert select_chunk_ids(index, "c", top_k=4) == [0, 1]
+
+def test_select_chunk_ids_falls_back_to_first_chunks():
+    index = BM25Index(["会議", "予定", "議事録", "日程"])
+    assert select_chunk_ids(index, "xyz", top_k=2) == [0, 1]
@@ -0,0 +1,212 @@
+import json
+import shutil
+from collections import OrderedDict
+
+import docx
+from docx.oxml.ns import qn
+
+from modules import template_handler
+from modules.template_handler import (
+    find_placeholder_spans, replace_text_in_paragraph, parse_template, get_parsed_template, render_template_document,
+    extract_info_with_llm, parse_extracted_info, replace_placeholders_in_document, add_qa_table, MISSING_VALUE,
+    EXTRACT_MAX_RETRIES
+)
+from modules.result_cache import get_result_cache_stats
+
+def make_paragraph(*run_texts):
+    """指定したテキストのランからなるパラグラフを作成する"""
+    doc = docx.Document()
+    paragraph = doc.add_paragraph()
+    for text in run_texts:
+        paragraph.add_run(text)
+    return paragraph
+
+def use_llm(monkeypatch, fake_llm, respond):
+    """文字起こしを段落単位のチャンクに分割し、respond で応答するLLMで抽出する"""
+    monkeypatch.setattr(template_handler, "split_text", lambda text, *args, **kwargs: text.split("\n\n"))
+    llm, prompts = fake_llm(respond)
+    monkeypatch.setattr(template_handler, "get_azure_llm", lambda: llm)
+    return prompts
+
+def test_parse_extracted_info():
+    response = '抽出結果:\n```json\n{"日付": "1月1日", "出席者": ["山田", "佐藤"], "場所": " "}\n```'
+    assert parse_extracted_info(response, ["日付", "出席者", "場所"]) == {'日付': '1月1日', '出席者': '山田、佐藤'}
+    assert parse_extracted_info("日付: 1月1日", ["日付"]) == {}
+
+def test_extraction_retries_only_missing_keys(monkeypatch, fake_llm):
+    def respond(prompt):
+        if "各部分から抽出した情報" not in prompt:
+            return '{"日付": "情報なし", "場所": "情報なし"}'
+        targets = json.loads(prompt.rsplit("抽出すべき項目:", 1)[1])
+        # 最初の統合では場所を出力せず、議題はどの呼び出しでも出力しない
+        if "日付" in targets:
+            return '```json\n{"日付": "1月1日"}\n```'
+        return json.dumps({'場所': "会議室A"} if "場所" in targets else {}, ensure_ascii=False)
+    prompts = use_llm(monkeypatch, fake_llm, respond)
+    
+    extracted = extract_info_with_llm("1月1日に開催しました。\n\n会議室Aで行いました。", ["日付", "場所", "議題"])
+    
+    assert extracted == {'日付': '1月1日', '場所': '会議室A', '議題': MISSING_VALUE}
+    # チャンク毎の抽出2回、統合1回、含まれなかった項目の再抽出2回
+    assert len(prompts) == 5
+    assert any("[部分1]" in prompt and "[部分2]" in prompt for prompt in prompts)
+
+def make_template(path):
+    """本文とテーブルにプレースホルダーを含むテンプレートを作成する"""
+    doc = docx.Document()
+    doc.add_paragraph("日付: {{日付}} 場所: {{場所}}")
+    doc.add_paragraph("本文")
+    table = doc.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "出席者"
+    table.cell(0, 1).text = "{{出席者}}と{{日付}}"
+    doc.save(path)
+
+def test_find_spans_in_single_run():
+    spans = find_placeholder_spans(["日付: {{日付}} 場所: {{場所}}"])
+    assert spans == [
+        {'name': '日付', 'start': (0, 4), 'end': (0, 10)},
+        {'name': '場所', 'start': (0, 15), 'end': (0, 21)},
+    ]
+
+def test_find_spans_across_runs():
+    spans = find_placeholder_spans(["開催日: {", "{日", "付}", "}です"])
+    assert spans == [{'name': '日付', 'start': (0, 5), 'end': (3, 1)}]
+
+def test_find_spans_skips_empty_runs():
+    spans = find_placeholder_spans(["{{日付}}", "", "後"])
+    assert spans == [{'name': '日付', 'start': (0, 0), 'end': (0, 6)}]
+
+def test_find_spans_without_placeholder():
+    assert find_placeholder_spans(["{単独の括弧}", "なし"]) == []
+
+def test_parse_template_indexes_placeholders(tmp_path):
+    path = str(tmp_path / "template.docx")
+    make_template(path)
+    template = parse_template(path)
+    
+    assert template['placeholders'] == ["日付", "場所", "出席者"]
+    # プレースホルダーを含むパラグラフの位置のみを記録する
+    assert [entry['location'] for entry in template['locations']] == [('body', 0), ('table', 0, 0, 1, 0)]
+
+def test_parsed_template_is_reused_by_content(tmp_path, monkeypatch):
+    path = str(tmp_path / "template.docx")
+    make_template(path)
+    copy_path = str(tmp_path / "copy.docx")
+    shutil.copy(path, copy_path)
+    calls = []
+    monkeypatch.setattr(template_handler, "_template_cache", OrderedDict())
+    monkeypatch.setattr(template_handler, "parse_template", lambda template_path: calls.append(template_path) or {})
+    
+    # 同じ内容のテンプレートは、パスが異なっても再解析しない
+    assert get_parsed_template(path) is get_parsed_template(copy_path)
+    assert calls == [path]
+
+def test_replace_in_single_run():
+    paragraph = make_paragraph("日付: {{日付}}")
+    replace_text_in_paragraph(paragraph, {'日付': '2024年1月1日'})
+    assert paragraph.text == "日付: 2024年1月1日"
+
+def test_replace_across_runs_keeps_other_runs():
+    paragraph = make_paragraph("前", "{{", "日付", "}}", "後")
+    paragraph.runs[4].bold = True
+    replace_text_in_paragraph(paragraph, {'日付': '1月1日'})
+    
+    assert paragraph.text == "前1月1日後"
+    assert paragraph.runs[-1].text == "後"
+    assert paragraph.runs[-1].bold
+
+def test_replace_multiple_and_unknown():
+    paragraph = make_paragraph("{{a}}と{{b}}と{{c}}")
+    replace_text_in_paragraph(paragraph, {'a': 'A', 'c': 'C'})
+    assert paragraph.text == "Aと{{b}}とC"
+
+def test_qa_table_rows_and_borders():
+    doc = docx.Document()
+    qa_data = [{'question': f"質問{i}", 'answer': f"回答{i}"} for i in range(50)]
+    
+    add_qa_table(doc, qa_data)
+    
+    table = doc.tables[-1]
+    assert len(table.rows) == 51
+    assert [cell.text for cell in table.rows[0].cells] == ["質問", "回答"]
+    assert [cell.text for cell in table.rows[50].cells] == ["質問49", "回答49"]
+    assert all(run.bold for cell in table.rows[0].cells for run in cell.paragraphs[0].runs)
+    
+    # 罫線はセル毎ではなくテーブルに1回だけ設定する
+    borders = table._tbl.tblPr.first_child_found_in("w:tblBorders")
+    assert [child.tag for child in borders] == [
+        qn(f"w:{side}") for side in ('top', 'left', 'bottom', 'right', 'insideH', 'insideV')
+    ]
+    assert not table._tbl.xpath(".//w:tcBorders")
+
+def test_render_uses_given_template_index(tmp_path, monkeypatch):
+    template_path = str(tmp_path / "template.docx")
+    doc = docx.Document()
+    doc.add_paragraph("日付: {{日付}}")
+    doc.add_paragraph("本文")
+    doc.save(template_path)
+    template = parse_template(template_path)
+    
+    # ワーカーではテンプレートを再解析しない
+    def fail(_):
+        raise AssertionError("テンプレートが再解析されました")
+    monkeypatch.setattr(template_handler, "get_parsed_template", fail)
+    monkeypatch.setattr(template_handler, "parse_template", fail)
+    
+    output_path = str(tmp_path / "output.docx")
+    render_template_document(template_path, template, {'日付': '1月1日'}, output_path)
+    
+    assert [p.text for p in docx.Document(output_path).paragraphs] == ["日付: 1月1日", "本文"]
+
+def test_extraction_cached_when_parsed(monkeypatch, fake_llm):
+    llm, _ = fake_llm(lambda prompt: '{"日付": "1月1日", "場所": "会議室A"}')
+    monkeypatch.setattr(template_handler, "get_azure_llm", lambda: llm)
+    
+    assert extract_info_with_llm("1月1日に会議室Aで会議", ["日付", "場所"]) == {'日付': '1月1日', '場所': '会議室A'}
+    assert get_result_cache_stats()['entries'] == 1
+
+def test_extraction_not_cached_when_parsing_fails(monkeypatch, fake_llm):
+    llm, prompts = fake_llm(lambda prompt: "抽出できませんでした")
+    monkeypatch.setattr(template_handler, "get_azure_llm", lambda: llm)
+    
+    extracted = extract_info_with_llm("1月1日に会議室Aで会議", ["日付", "場所"])
+    assert extracted == {'日付': MISSING_VALUE, '場所': MISSING_VALUE}
+    # 最初の抽出と、抽出できなかった項目の再抽出
+    assert len(prompts) == 1 + EXTRACT_MAX_RETRIES
+    assert get_result_cache_stats()['entries'] == 0
+
+def make_table_template(path, rows=30, cols=4):
+    """セル毎に異なるプレースホルダーを含み、一部のセルを結合した表のテンプレートを作成する"""
+    doc = docx.Document()
+    table = doc.add_table(rows=rows, cols=cols)
+    for row_index, row in enumerate(table.rows):
+        for cell_index, cell in enumerate(row.cells):
+            cell.text = f"{{{{項目{row_index}_{cell_index}}}}}"
+    
+    # 横方向と縦方向の結合（結合したセルには両方のパラグラフが残る）
+    table.cell(0, 0).merge(table.cell(0, 1))
+    table.cell(5, 3).merge(table.cell(7, 3))
+    doc.save(path)
+    return [f"項目{row_index}_{cell_index}" for row_index in range(rows) for cell_index in range(cols)]
+
+def test_parse_template_visits_every_table_paragraph(tmp_path):
+    path = str(tmp_path / "table.docx")
+    names = make_table_template(path)
+    template = parse_template(path)
+    
+    assert sorted(template['placeholders']) == sorted(names)
+    # 結合したセルのパラグラフは1回だけ含まれる
+    assert sum(len(entry['spans']) for entry in template['locations']) == len(names)
+
+def test_replace_in_table_with_merged_cells(tmp_path):
+    path = str(tmp_path / "table.docx")
+    names = make_table_template(path)
+    template = parse_template(path)
+    
+    doc = docx.Document(path)
+    replace_placeholders_in_document(doc, {name: f"値:{name}" for name in names}, template=template)
+    
+    texts = [paragraph.text for table in doc.tables for row in table.rows for cell in row.cells
+             for paragraph in cell.paragraphs]
+    assert not any("{{" in text for text in texts)
+    assert all(any(f"値:{name}" == text for text in texts) for name in names)
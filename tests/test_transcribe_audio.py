@@ -0,0 +1,117 @@
+import os
+import time
+import threading
+
+import pytest
+
+from modules import transcription
+from modules.transcription import (
+    transcribe_audio, get_transcription_cache_key, get_cached_transcription, store_cached_transcription,
+    evict_transcription_cache
+)
+
+@pytest.fixture
+def audio_file(tmp_path):
+    """文字起こしする音声ファイル（内容はAPIに送らないため任意）"""
+    path = tmp_path / "meeting.wav"
+    path.write_bytes(b"RIFF" + b"\0" * 64)
+    return str(path)
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """文字起こしキャッシュをテスト毎の一時ディレクトリに保存する"""
+    path = tmp_path / "transcriptions"
+    monkeypatch.setattr(transcription, "TRANSCRIPTION_CACHE_DIR", str(path))
+    return path
+
+def fake_chunks(monkeypatch, count):
+    """音声を count 個のチャンク（無音で分割、重なりなし）に分割したことにする"""
+    chunks = [{'start': i * 1000, 'end': (i + 1) * 1000, 'overlap': 0} for i in range(count)]
+    monkeypatch.setattr(transcription, "split_audio", lambda audio_path: chunks)
+    monkeypatch.setattr(
+        transcription, "prepare_chunk", lambda audio_path, chunk, **kwargs: f"chunk{chunk['start'] // 1000}"
+    )
+
+def fake_transcriber(monkeypatch, count, fail=None):
+    """
+    チャンクの文字起こしを、後のチャンクほど先に完了する処理に置き換える
+    
+    Returns:
+        dict: 同時に実行された数の最大値（'max_running'）と呼び出し回数（'calls'）
+    """
+    state = {'running': 0, 'max_running': 0, 'calls': 0}
+    lock = threading.Lock()
+    
+    def transcribe_chunk(chunk_path, api_choice='deepgram'):
+        index = int(chunk_path[len("chunk"):])
+        with lock:
+            state['running'] += 1
+            state['calls'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+        try:
+            time.sleep(0.02 * (count - index))
+            if index == fail:
+                raise RuntimeError("APIエラー")
+            return f"発言{index}"
+        finally:
+            with lock:
+                state['running'] -= 1
+    
+    monkeypatch.setattr(transcription, "transcribe_chunk", transcribe_chunk)
+    return state
+
+def test_chunks_joined_in_original_order(monkeypatch, audio_file):
+    fake_chunks(monkeypatch, 4)
+    fake_transcriber(monkeypatch, 4)
+    
+    assert transcribe_audio(audio_file, max_workers=4) == "発言0 発言1 発言2 発言3"
+
+def test_parallelism_is_limited(monkeypatch, audio_file):
+    fake_chunks(monkeypatch, 6)
+    state = fake_transcriber(monkeypatch, 6)
+    
+    transcribe_audio(audio_file, max_workers=2)
+    assert state['max_running'] == 2
+
+def test_failed_chunk_is_reported(monkeypatch, audio_file):
+    fake_chunks(monkeypatch, 4)
+    fake_transcriber(monkeypatch, 4, fail=2)
+    
+    with pytest.raises(Exception, match="チャンク 3/4"):
+        transcribe_audio(audio_file, max_workers=1)
+
+def test_unknown_api():
+    with pytest.raises(ValueError):
+        transcribe_audio("meeting.wav", api_choice='unknown')
+
+def test_second_transcription_uses_cache(monkeypatch, audio_file):
+    fake_chunks(monkeypatch, 2)
+    state = fake_transcriber(monkeypatch, 2)
+    
+    assert transcribe_audio(audio_file) == "発言0 発言1"
+    assert transcribe_audio(audio_file) == "発言0 発言1"
+    assert state['calls'] == 2
+    
+    # キャッシュを使用しない場合はAPIを呼び出す
+    transcribe_audio(audio_file, use_cache=False)
+    assert state['calls'] == 4
+
+def test_cache_key_depends_on_content_and_provider(tmp_path, audio_file):
+    other = tmp_path / "other.wav"
+    other.write_bytes(b"RIFF" + b"\1" * 64)
+    
+    key = get_transcription_cache_key(audio_file, 'deepgram')
+    assert key == get_transcription_cache_key(audio_file, 'Deepgram')
+    assert key != get_transcription_cache_key(audio_file, 'groq')
+    assert key != get_transcription_cache_key(str(other), 'deepgram')
+
+def test_cache_evicts_least_recently_used(cache_dir):
+    store_cached_transcription("a", "古い" * 100)
+    store_cached_transcription("b", "新しい" * 100)
+    old_time = time.time() - 60
+    os.utime(cache_dir / "a.json", (old_time, old_time))
+    
+    evict_transcription_cache(max_bytes=os.path.getsize(cache_dir / "b.json"))
+    
+    assert get_cached_transcription("a") is None
+    assert get_cached_transcription("b") == "新しい" * 100